@@ -1,14 +1,30 @@
 from django.contrib import admin
 
-from api.models import Company, Review, Reviewer
+from api import jobs
+from api.models import Company, CompanyRatingStats, Job, Review, Reviewer
 
 
 class CompanyAdmin(admin.ModelAdmin):
     list_display = ('pk', '__str__')
 
 
+class CompanyRatingStatsAdmin(admin.ModelAdmin):
+    list_display = ('company', 'review_count', 'average_rating')
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'created', 'run_at', 'attempts', 'failed', 'locked_by')
+    list_filter = ('kind', 'failed')
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        self.message_user(request, "Queued %d failed jobs again" % jobs.retry(queryset))
+    retry.short_description = "Retry the selected failed jobs"
+
+
 class ReviewAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'company', 'title', 'rating', 'reviewer')
+    list_display = ('pk', 'company', 'title', 'rating', 'reviewer', 'flagged')
+    list_filter = ('flagged',)
 
 
 class ReviewerAdmin(admin.ModelAdmin):
@@ -16,5 +32,7 @@ class ReviewerAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Company, CompanyAdmin)
+admin.site.register(CompanyRatingStats, CompanyRatingStatsAdmin)
+admin.site.register(Job, JobAdmin)
 admin.site.register(Reviewer, ReviewerAdmin)
 admin.site.register(Review, ReviewAdmin)
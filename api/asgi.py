@@ -0,0 +1,248 @@
+"""
+ASGI handler for the API.
+
+Django 2.2 views and the ORM are synchronous, so this handler runs on
+the event loop and hands each request to Django's own WSGI handler on a
+pool of ASGI_THREADS threads: reading the request body, sending the
+response and waiting between long poll re-checks (see api.longpoll)
+take no thread. A server with one worker process can then keep
+thousands of idle keep-alive or long polling connections open, while
+the number of threads, and so of database connections, stays bounded.
+
+Each request, and each long poll re-check, is one call of the WSGI
+handler in a copy of the request's context, so that the thread-local
+database connections and the context variables of api.replicas behave
+as under WSGI. A streaming response holds a pool thread until it is
+sent, because its queries run on the connection of that thread.
+
+Run with any ASGI 3 server, e.g. uvicorn reviews.asgi:application
+"""
+import asyncio
+import contextvars
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+
+from api.connections import close_pools
+from api.longpoll import ASYNC_KEY, get_wait, mark_retry
+
+
+# set in the environ of a long poll re-check
+RETRY_KEY = 'reviews.long_poll.retry'
+
+
+def get_environ(scope, body):
+    """
+    The WSGI environ of an ASGI http request
+    :param scope: ASGI connection scope
+    :param body: file with the request body
+    :return: environ dictionary
+    """
+    # WSGI strings are bytes decoded as latin-1
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 80),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else 'HTTP_' + name
+        value = value.decode('latin-1')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+
+    if 'CONTENT_LENGTH' not in environ:
+        # chunked request bodies
+        body.seek(0, 2)
+        environ['CONTENT_LENGTH'] = str(body.tell())
+        body.seek(0)
+    return environ
+
+
+class LongPollWSGIHandler(WSGIHandler):
+    """
+    Django's WSGI handler, that notes on each response how long to wait
+    for a change before sending it
+    """
+    def get_response(self, request):
+        if request.META.get(RETRY_KEY):
+            mark_retry(request)
+        response = super().get_response(request)
+        response.long_poll_wait = get_wait(request, response)
+        return response
+
+
+class ASGIHandler:
+    """
+    ASGI 3 application that runs Django's WSGI handler on a bounded
+    thread pool, see above
+    """
+    def __init__(self, threads=None):
+        """
+        :param threads: size of the thread pool, default ASGI_THREADS
+        """
+        self.handler = LongPollWSGIHandler()
+        self.threads = threads or settings.ASGI_THREADS
+        self.executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported ASGI connection type: %s" % scope['type'])
+
+    async def lifespan(self, receive, send):
+        """
+        Close the pool and its database connections on shutdown
+        """
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_event_loop().run_in_executor(None, self.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        """
+        Close the database connections of the pool threads, then the pool,
+        then the idle connections of the database connection pools
+        """
+        # connections belong to the thread that opened them: run one job on
+        # each thread, the barrier keeps them from running on the same one
+        barrier = threading.Barrier(self.threads)
+
+        def close_connections():
+            barrier.wait()
+            connections.close_all()
+
+        wait([self.executor.submit(close_connections) for _ in range(self.threads)])
+        self.executor.shutdown()
+        close_pools()
+
+    async def http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body', False):
+                    break
+            body.seek(0)
+
+            disconnected = asyncio.Event()
+            watcher = asyncio.ensure_future(self._watch_disconnect(receive, disconnected))
+            try:
+                await self._respond(get_environ(scope, body), send, disconnected)
+            finally:
+                watcher.cancel()
+        finally:
+            body.close()
+
+    async def _watch_disconnect(self, receive, disconnected):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    async def _respond(self, environ, send, disconnected):
+        loop = asyncio.get_event_loop()
+        # the same context for every job of the request
+        context = contextvars.copy_context()
+
+        def run(function, *args):
+            return loop.run_in_executor(self.executor, partial(context.run, function, *args))
+
+        environ[ASYNC_KEY] = True
+        status, headers, response = await run(self._call, environ)
+
+        # long poll: wait for a change here rather than in a pool thread
+        if response.long_poll_wait is not None:
+            deadline = loop.time() + response.long_poll_wait
+            environ[RETRY_KEY] = True
+            while status == 304:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(disconnected.wait(),
+                                           min(settings.LONG_POLL_INTERVAL, remaining))
+                    return
+                except asyncio.TimeoutError:
+                    pass
+                status, headers, response = await run(self._call, environ)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        head = environ['REQUEST_METHOD'] == 'HEAD'
+        if response.streaming:
+            await run(self._stream, response, head, send, loop)
+            await send({'type': 'http.response.body'})
+        else:
+            await send({'type': 'http.response.body', 'body': b'' if head else response.content})
+
+    def _call(self, environ):
+        """
+        :return: (status code, ASGI headers, response) tuple
+        """
+        started = []
+
+        def start_response(status, headers):
+            started.append(int(status.split(' ', 1)[0]))
+            started.append([(name.encode('latin-1'), value.strip().encode('latin-1'))
+                            for name, value in headers])
+
+        response = self.handler(environ, start_response)
+        if not response.streaming:
+            # close on this thread: request_finished cleans up its database connections
+            response.close()
+        return started[0], started[1], response
+
+    def _stream(self, response, head, send, loop):
+        try:
+            for chunk in response:
+                if chunk and not head:
+                    asyncio.run_coroutine_threadsafe(
+                        send({'type': 'http.response.body', 'body': chunk, 'more_body': True}),
+                        loop).result()
+        finally:
+            response.close()
+
+
+def get_asgi_application():
+    """
+    The ASGI counterpart of django.core.wsgi.get_wsgi_application
+    :return: ASGIHandler
+    """
+    django.setup(set_prefix=False)
+    return ASGIHandler()
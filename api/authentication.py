@@ -0,0 +1,138 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    Two level cache of token key -> Token (with its user and reviewer).
+
+    The first level is a small LRU in this process with a short TTL,
+    the second level is Django's cache framework, shared between
+    processes. Entries are stored pickled so every request gets its
+    own copy of the user and reviewer objects.
+
+    Invalidation clears both levels in this process and the shared cache,
+    other processes may serve a stale entry for up to local_ttl seconds.
+    """
+    key_prefix = 'api:token:'
+
+    def __init__(self, max_size, local_ttl, shared_ttl):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Look up a token
+        :param key: token key
+        :return: Token object, or None on a miss
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None and entry[0] > now:
+                self._local.move_to_end(key)
+                self.local_hits += 1
+                return pickle.loads(entry[1])
+
+        data = cache.get(self.key_prefix + key)
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.shared_hits += 1
+        self._set_local(key, data, now)
+        return pickle.loads(data)
+
+    def set(self, key, token):
+        """
+        Store a token in both levels
+        :param key: token key
+        :param token: Token object, with user and user.reviewer loaded
+        """
+        data = pickle.dumps(token, pickle.HIGHEST_PROTOCOL)
+        cache.set(self.key_prefix + key, data, self.shared_ttl)
+        self._set_local(key, data, time.monotonic())
+
+    def invalidate(self, *keys):
+        """
+        Drop tokens from both levels
+        :param keys: token keys
+        """
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        cache.delete_many([self.key_prefix + key for key in keys])
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        """
+        Hit and miss counters for this process
+        :return: dictionary
+        """
+        with self._lock:
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'local_size': len(self._local),
+            }
+
+    def _set_local(self, key, data, now):
+        with self._lock:
+            self._local[key] = (now + self.local_ttl, data)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_SIZE,
+    local_ttl=settings.TOKEN_CACHE_LOCAL_TTL,
+    shared_ttl=settings.TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that resolves token -> user -> reviewer through
+    token_cache, so an authenticated request normally runs no auth queries.
+
+    Entries are invalidated by the signal handlers in api.signals when a
+    token is deleted or its user or reviewer is saved.
+    """
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+
+        if token is None:
+            model = self.get_model()
+            try:
+                # from the primary: a token created a moment ago may not be on the replicas yet
+                token = (model.objects.using(DEFAULT_DB_ALIAS)
+                         .select_related('user__reviewer').get(key=key))
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            token_cache.set(key, token)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from rest_framework.request import Request
+
+from api.hashing import HashingUnavailable, hashing_service
+
+
+UserModel = get_user_model()
+
+
+class PooledPasswordBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords in the hashing pool, see api.hashing.
+    Raises HashingUnavailable (503) to API views when the pool is full;
+    other logins, e.g. Django Admin's, check the password in the request
+    thread then, as ModelBackend does.
+    """
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            return self._authenticate(request, username, password, **kwargs)
+        except HashingUnavailable:
+            # only DRF turns it into a 503, elsewhere it would be a 500
+            if isinstance(request, Request):
+                raise
+            return super().authenticate(request, username, password, **kwargs)
+
+    def _authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, so the response time does not tell which usernames exist
+            hashing_service.make_password(password)
+            return None
+
+        matches, must_update = hashing_service.check_password(password, user.password)
+        if not matches:
+            return None
+        if must_update:
+            user.password = hashing_service.make_password(password)
+            user.save(update_fields=['password'])
+
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,213 @@
+"""
+Bulk review ingestion and reviewer registration.
+
+A batch is handled in three passes:
+    1. every company hyperlink in the batch is resolved to a pk, and
+       all the companies are loaded with one IN query
+    2. each item is validated on its own with BulkReviewSerializer,
+       so one bad item does not reject the whole batch. A single
+       serializer instance is reused since building its fields costs
+       more than validating an item
+    3. the valid reviews are written with bulk_create in chunks,
+       in a single transaction together with the rating totals
+
+Reviewers are registered the same way, with the usernames checked
+for the whole batch in one query and the passwords hashed in parallel
+by the hashing pool, see api.hashing. A chunk with a username that was
+registered since the check is inserted again one user at a time, and
+the taken usernames are reported per item.
+"""
+from urllib.parse import urlparse
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.urls import Resolver404, get_script_prefix, resolve
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
+from rest_framework.serializers import as_serializer_error
+
+from api import stats
+from api.conditional import bump_reviewer_version
+from api.fields import url_template
+from api.feed import invalidate_company_reviews
+from api.hashing import hashing_service
+from api.models import Company, Review, Reviewer
+from api.serializers import BulkReviewerSerializer, BulkReviewSerializer
+
+
+def _company_pk_from_url(url):
+    """
+    The company pk a hyperlink points to, resolved the same way
+    as HyperlinkedRelatedField does
+    :param url: absolute or relative url
+    :return: pk, or None if the url does not point to a company
+    """
+    if not isinstance(url, str):
+        return None
+
+    path = urlparse(url).path
+    prefix = get_script_prefix()
+    if path.startswith(prefix):
+        path = '/' + path[len(prefix):]
+
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+
+    if match.url_name != 'company-detail':
+        return None
+    return match.kwargs.get('pk')
+
+
+def load_companies(items):
+    """
+    Load every company referenced by the batch in a single query
+    :param items: list of review dictionaries
+    :return: dictionary of pk -> Company
+    """
+    # other values are reported by the serializer, per item
+    urls = {item.get('company') for item in items
+            if isinstance(item, dict) and isinstance(item.get('company'), str)}
+    pks = {_company_pk_from_url(url) for url in urls}
+    pks.discard(None)
+    return Company.objects.in_bulk(pks)
+
+
+def create_reviews(items, request, chunk_size):
+    """
+    Validate and create a batch of reviews
+    :param items: list of review dictionaries
+    :param request: request object, for the reviewer and ip address
+    :param chunk_size: rows per INSERT
+    :return: list of per-item result dictionaries, in input order
+    """
+    context = {'request': request, 'companies': load_companies(items)}
+    serializer = BulkReviewSerializer(context=context)
+
+    results = []
+    reviews = []
+    for index, item in enumerate(items):
+        try:
+            validated_data = serializer.run_validation(item)
+        except ValidationError as exc:
+            results.append({'index': index, 'status': 'invalid',
+                            'errors': as_serializer_error(exc)})
+            continue
+
+        review = Review(**validated_data)
+        reviews.append(review)
+        results.append({'index': index, 'status': 'created', 'review': review})
+
+    with transaction.atomic():
+        for start in range(0, len(reviews), chunk_size):
+            Review.objects.bulk_create(reviews[start:start + chunk_size])
+        stats.apply_rating_changes((None, stats.rating_key(r)) for r in reviews)
+        if reviews:
+            bump_reviewer_version(reviews[0].reviewer_id)
+            invalidate_company_reviews(*{r.company_id for r in reviews})
+        transaction.on_commit(serializer.submissions.record)
+
+    for result in results:
+        review = result.pop('review', None)
+        # only some databases return the new primary keys from bulk_create
+        if review is not None and review.pk is not None:
+            result['url'] = reverse('review-detail', kwargs={'pk': review.pk}, request=request)
+
+    return results
+
+
+DUPLICATE_USERNAME_ERROR = {'username': ['A user with that username already exists.']}
+
+
+def _insert_users(entries):
+    """
+    Insert a chunk of users, one at a time if one of them can not be
+    :param entries: list of (result dictionary, unsaved User) tuples
+    :return: list of the inserted users
+    """
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create([user for _, user in entries])
+        return [user for _, user in entries]
+    except IntegrityError:
+        # a username was registered since it was checked
+        pass
+
+    users = []
+    for result, user in entries:
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+        except IntegrityError:
+            user.pk = None
+            result.update(status='invalid', errors=DUPLICATE_USERNAME_ERROR)
+        else:
+            users.append(user)
+    return users
+
+
+def create_reviewers(items, request, chunk_size, hashing=hashing_service):
+    """
+    Validate and register a batch of reviewers
+    :param items: list of reviewer dictionaries, as for ReviewerSerializer
+    :param request: request object for the reviewer urls, or None
+    :param chunk_size: rows per INSERT
+    :param hashing: HashingService to hash the passwords with
+    :return: list of per-item result dictionaries, in input order
+    :raise: HashingUnavailable when the hashing pool is full
+    """
+    serializer = BulkReviewerSerializer()
+
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            validated_data = serializer.run_validation(item)
+        except ValidationError as exc:
+            results.append({'index': index, 'status': 'invalid',
+                            'errors': as_serializer_error(exc)})
+            continue
+        result = {'index': index, 'status': 'created', 'username': validated_data['username']}
+        results.append(result)
+        valid.append((result, validated_data))
+
+    # usernames taken already, or earlier in the batch
+    taken = set(User.objects
+                .filter(username__in=[data['username'] for _, data in valid])
+                .values_list('username', flat=True))
+    new = []
+    for result, validated_data in valid:
+        if validated_data['username'] in taken:
+            result.update(status='invalid', errors=DUPLICATE_USERNAME_ERROR)
+        else:
+            taken.add(validated_data['username'])
+            new.append((result, validated_data))
+
+    passwords = hashing.make_passwords([data.pop('password') for _, data in new])
+    entries = []
+    reviewers = {}
+    for (result, validated_data), password in zip(new, passwords):
+        reviewers[validated_data['username']] = validated_data.pop('reviewer', {})
+        entries.append((result, User(password=password, **validated_data)))
+
+    with transaction.atomic():
+        for start in range(0, len(entries), chunk_size):
+            chunk = _insert_users(entries[start:start + chunk_size])
+            # only some databases return the new primary keys from bulk_create
+            pks = dict(User.objects
+                       .filter(username__in=[user.username for user in chunk])
+                       .values_list('username', 'pk'))
+            Reviewer.objects.bulk_create([
+                Reviewer(user_id=pks[user.username], **reviewers[user.username])
+                for user in chunk])
+            for user in chunk:
+                user.pk = pks[user.username]
+
+    if request is not None:
+        reviewer_url = url_template(request, 'reviewer-detail')
+        for result, user in entries:
+            if result['status'] == 'created':
+                result['url'] = reviewer_url(user.pk)
+
+    return results
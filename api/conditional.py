@@ -0,0 +1,202 @@
+"""
+Conditional GET support for the reviewer-scoped and company endpoints.
+
+Each reviewer has a data_version that is bumped on every write to the
+reviewer or to one of their reviews. Responses carry an ETag derived
+from that version and the request, and a Last-Modified of the reviewer's
+data_modified, so a client polling an unchanged resource gets a 304
+without the Review table being read. The version is cached, so a 304
+normally runs no queries at all.
+
+Companies are public, so their versions are only kept in the cache:
+one per company, for the detail endpoint, and one for the whole list.
+Both are bumped on every write to a company or to its rating totals.
+A version that is evicted from the cache starts again from the clock,
+so clients then get the data again rather than a stale 304.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.longpoll import WAIT_PARAM
+from api.models import Reviewer
+
+
+VERSION_CACHE_TIMEOUT = 3600
+
+
+def _version_cache_key(reviewer_id):
+    return 'api:reviewer-version:%s' % reviewer_id
+
+
+def bump_reviewer_version(reviewer_id):
+    """
+    Record a write to a reviewer's data.
+    Call inside the transaction that makes the write.
+    :param reviewer_id: reviewer pk
+    """
+    Reviewer.objects.filter(pk=reviewer_id).bump_version()
+
+    key = _version_cache_key(reviewer_id)
+    cache.delete(key)
+    # a concurrent reader may have cached the old version before we commit
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_reviewer_version(reviewer_id):
+    """
+    :param reviewer_id: reviewer pk
+    :return: (data_version, data_modified) tuple, or None if there is no such reviewer
+    """
+    key = _version_cache_key(reviewer_id)
+    version = cache.get(key)
+    if version is None:
+        version = (Reviewer.objects
+                   .filter(pk=reviewer_id)
+                   .values_list('data_version', 'data_modified')
+                   .first())
+        if version is None:
+            return None
+        cache.set(key, version, VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def _company_version_key(company_id):
+    return 'api:company-version:%s' % ('all' if company_id is None else company_id)
+
+
+def get_company_version(company_id=None):
+    """
+    :param company_id: company pk, or None for the version of the company list
+    :return: version number
+    """
+    key = _company_version_key(company_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_company_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # not cached: the next reader starts a new version
+        pass
+
+
+def bump_company_versions(*company_ids):
+    """
+    Record a write to companies or to their rating totals.
+    Call inside the transaction that makes the write.
+    :param company_ids: company pks
+    """
+    for key in {_company_version_key(pk) for pk in company_ids + (None,)}:
+        _bump_company_version(key)
+        # a concurrent reader may cache a response read before we commit
+        transaction.on_commit(lambda key=key: _bump_company_version(key))
+
+
+def make_etag(request, version):
+    """
+    :param request: request object
+    :param version: string identifying the version of the data
+    :return: quoted ETag of the representation of that data for the request
+    """
+    # the representation depends on the url (pagination cursor etc.) and
+    # the negotiated format as well as on the data, but not on the long poll wait
+    query = request.GET.copy()
+    query.pop(WAIT_PARAM, None)
+    key = '%s:%s?%s:%s' % (version, request.path, query.urlencode(),
+                           request.META.get('HTTP_ACCEPT', ''))
+    return quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def get_validators(request):
+    """
+    The ETag and Last-Modified timestamp for a request by a reviewer
+    :param request: request object
+    :return: (etag, last_modified timestamp) tuple, or None if the user is not a reviewer
+    """
+    try:
+        reviewer_id = request.user.reviewer.pk
+    except AttributeError:
+        return None
+
+    version = get_reviewer_version(reviewer_id)
+    if version is None:
+        return None
+    data_version, data_modified = version
+
+    etag = make_etag(request, '%s:%s:%s' % (reviewer_id, data_version, data_modified.isoformat()))
+    return etag, int(data_modified.timestamp())
+
+
+def is_not_modified(request, etag, last_modified):
+    """
+    Evaluate If-None-Match, or If-Modified-Since when there is no If-None-Match
+    :param last_modified: timestamp, or None if the data has none
+    :return: True if the client's copy is current
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+
+    if last_modified is None:
+        return False
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
+
+
+class ConditionalGetMixin:
+    """
+    View mixin that adds ETag and Last-Modified headers to GET responses
+    and answers 304 Not Modified when the data has not changed.
+    """
+    def get_validators(self, request):
+        """
+        :return: (etag, last_modified timestamp or None) tuple, or None to skip the checks
+        """
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        if is_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().get(request, *args, **kwargs)
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class ReviewerConditionalGetMixin(ConditionalGetMixin):
+    """
+    Conditional GET of the request reviewer's data
+    """
+    def get_validators(self, request):
+        return get_validators(request)
+
+
+class CompanyConditionalGetMixin(ConditionalGetMixin):
+    """
+    Conditional GET of a company, or of the company list when the url names none
+    """
+    def get_validators(self, request):
+        company_id = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        version = get_company_version(company_id)
+        return make_etag(request, 'company:%s:%s' % (company_id, version)), None
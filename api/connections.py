@@ -0,0 +1,317 @@
+"""
+Database connection lifetime, health checks and pooling.
+
+DATABASE_CONN_MAX_AGE keeps a thread's connection open across requests
+instead of opening one per request. A persistent connection can be
+dropped by the server or a proxy while it sits idle, so with
+DATABASE_CONN_HEALTH_CHECKS it is checked once, before the first query
+of each request, and replaced if it no longer works.
+
+Threaded servers (runserver, the ASGI handler's pool) would keep one
+connection per thread that ever served a request. With
+DATABASE_POOL_SIZE > 0 the threads of a process share a pool instead: a
+connection is taken from the pool when a request needs one and given
+back at the end of the request. At most DATABASE_POOL_SIZE connections
+are open per database; a request waits up to DATABASE_POOL_TIMEOUT
+seconds for a free one and fails after that. Idle pooled connections are
+closed once they are DATABASE_CONN_MAX_AGE seconds old and are health
+checked before they are handed out.
+
+The database backends in api.db_backends add this to Django's, and
+count the physical connections opened and the time requests wait for a
+connection, for the endpoint stats.
+"""
+import collections
+import os
+import threading
+import time
+
+from django.db import OperationalError
+
+from api.metrics import METRICS, Histogram
+
+
+class ConnectionPool:
+    """
+    Bounded set of DB-API connections to one database, shared by the threads of a process
+    """
+    def __init__(self, size, timeout, max_age=0, check=None):
+        """
+        :param size: maximum number of connections, idle or in use
+        :param timeout: seconds to wait for a free connection
+        :param max_age: seconds after which an idle connection is closed, 0 for no limit
+        :param check: optional callable taking a connection, returning whether it still works
+        """
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.check = check
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        # most recently used last, so that the connections in use stay warm
+        # and the others age out
+        self._idle = []
+        self._opened_at = {}
+        self.in_use = 0
+        self.timeouts = 0
+
+    def acquire(self, connect):
+        """
+        :param connect: callable opening a new connection, used when none is idle
+        :return: connection, to be given back with release() or discard()
+        :raise: OperationalError when no connection is free within the timeout
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise OperationalError("No free database connection within %s seconds" % self.timeout)
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = connect()
+                with self._lock:
+                    self._opened_at[id(connection)] = time.monotonic()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        """
+        Give a connection back for reuse
+        """
+        with self._lock:
+            self.in_use -= 1
+            self._idle.append(connection)
+        self._slots.release()
+
+    def discard(self, connection):
+        """
+        Close a connection that must not be reused, e.g. one in a broken transaction
+        """
+        with self._lock:
+            self.in_use -= 1
+        self._close(connection)
+        self._slots.release()
+
+    def close_idle(self):
+        """
+        Close every idle connection
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._close(connection)
+
+    def stats(self):
+        """
+        :return: dictionary of size, idle and in use connection counts and number of timeouts
+        """
+        with self._lock:
+            return {'size': self.size, 'idle': len(self._idle), 'in_use': self.in_use,
+                    'timeouts': self.timeouts}
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection = self._idle.pop()
+                opened_at = self._opened_at.get(id(connection), 0)
+            if self.max_age and time.monotonic() - opened_at > self.max_age:
+                self._close(connection)
+            elif self.check is not None and not self.check(connection):
+                self._close(connection)
+            else:
+                return connection
+
+    def _close(self, connection):
+        with self._lock:
+            self._opened_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            # it is going away either way
+            pass
+
+
+class ConnectionStats:
+    """
+    Physical connections opened and connection wait time per database alias
+    """
+    def __init__(self, window=60):
+        """
+        :param window: seconds over which the rate of new connections is measured
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._opened = {}
+        self._recent = {}
+        self._wait = {}
+
+    def record_open(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            self._opened[alias] = self._opened.get(alias, 0) + 1
+            recent = self._recent.setdefault(alias, collections.deque())
+            recent.append(now)
+            while recent[0] < now - self.window:
+                recent.popleft()
+
+    def record_wait(self, alias, milliseconds):
+        with self._lock:
+            histogram = self._wait.get(alias)
+            if histogram is None:
+                histogram = self._wait[alias] = Histogram(METRICS['total_ms'])
+            histogram.observe(milliseconds)
+
+    def stats(self):
+        """
+        :return: dictionary of alias -> {'opened', 'opened_per_second', 'wait_ms', 'pool'},
+            where opened_per_second is measured over the last `window` seconds, wait_ms
+            summarizes the time taken to get a connection, new or pooled, and pool is
+            None when the database is not pooled
+        """
+        now = time.monotonic()
+        seconds = min(self.window, now - self._started) or 1
+        with self._lock:
+            result = {}
+            for alias in set(self._opened) | set(self._wait):
+                recent = [t for t in self._recent.get(alias, ()) if t >= now - self.window]
+                wait = self._wait.get(alias)
+                result[alias] = {
+                    'opened': self._opened.get(alias, 0),
+                    'opened_per_second': round(len(recent) / seconds, 3),
+                    'wait_ms': wait.to_dict() if wait else None,
+                    'pool': None,
+                }
+        with _pools_lock:
+            pools = dict(_pools)
+        for alias, pool in pools.items():
+            result.setdefault(alias, {'opened': 0, 'opened_per_second': 0.0, 'wait_ms': None})
+            result[alias]['pool'] = pool.stats()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._started = time.monotonic()
+            self._opened.clear()
+            self._recent.clear()
+            self._wait.clear()
+
+
+connection_stats = ConnectionStats()
+
+_pools = {}
+_pools_lock = threading.Lock()
+# pools inherited by a forked child, kept referenced so that their sockets,
+# which the parent still uses, are not closed when they are collected
+_inherited_pools = []
+
+
+def _forget_pools():
+    _inherited_pools.extend(_pools.values())
+    _pools.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools)
+
+
+def _ping(connection):
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+def get_pool(alias, settings_dict):
+    """
+    :param alias: database alias
+    :param settings_dict: its DATABASES entry
+    :return: the process's ConnectionPool for the database, None if it is not pooled
+    """
+    size = settings_dict.get('POOL_SIZE') or 0
+    if size <= 0:
+        return None
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(
+                size, settings_dict.get('POOL_TIMEOUT', 10),
+                max_age=settings_dict.get('POOL_MAX_AGE') or 0,
+                check=_ping if settings_dict.get('CONN_HEALTH_CHECKS') else None)
+        return pool
+
+
+def close_pools():
+    """
+    Close the idle connections of every pool, e.g. before the process exits
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+class DatabaseWrapperMixin:
+    """
+    Adds health checks, pooling and connection metrics to a backend's DatabaseWrapper.
+    Reads the CONN_HEALTH_CHECKS and POOL_* keys of the settings_dict, see reviews/settings.py
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+
+        def connect():
+            connection = super(DatabaseWrapperMixin, self).get_new_connection(conn_params)
+            connection_stats.record_open(self.alias)
+            return connection
+
+        pool = self.pool
+        connection = connect() if pool is None else pool.acquire(connect)
+        connection_stats.record_wait(self.alias, (time.perf_counter() - start) * 1000)
+        # new, or checked by the pool
+        self.health_check_done = True
+        return connection
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('CONN_HEALTH_CHECKS') and not self.in_atomic_block):
+            self.health_check_done = True
+            if not self.is_usable():
+                # dropped while idle, e.g. by the server or a proxy
+                self.errors_occurred = True
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # called at the start and end of each request: check again before the next query
+        self.health_check_done = False
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        if (self.in_atomic_block or self.errors_occurred
+                or self.autocommit != self.settings_dict['AUTOCOMMIT']):
+            # its state is unknown
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
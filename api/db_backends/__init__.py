@@ -0,0 +1,4 @@
+"""
+Django database backends with the connection management of api.connections.
+Set in DATABASES by reviews/settings.py in place of Django's own.
+"""
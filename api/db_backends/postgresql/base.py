@@ -0,0 +1,9 @@
+from django.db.backends.postgresql import base
+
+from api.connections import DatabaseWrapperMixin
+
+
+class DatabaseWrapper(DatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    Django's PostgreSQL backend, see api.connections
+    """
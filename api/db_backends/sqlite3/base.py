@@ -0,0 +1,15 @@
+from django.db.backends.sqlite3 import base
+
+from api.connections import DatabaseWrapperMixin
+
+
+class DatabaseWrapper(DatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    Django's SQLite backend, see api.connections
+    """
+    @property
+    def pool(self):
+        # an in-memory database lives and dies with its one connection
+        if self.is_in_memory_db():
+            return None
+        return super().pool
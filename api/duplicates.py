@@ -0,0 +1,170 @@
+"""
+Near-duplicate review detection.
+
+Each new review gets a 64 bit SimHash of its title and summary: texts
+that share most of their word triples get fingerprints that differ in
+a few bits, so a near-duplicate is a fingerprint within
+DUPLICATE_REVIEW_MAX_DISTANCE bits of a recent one. Case, punctuation
+and spacing are ignored. Unrelated texts differ in 32 bits on average,
+and a one word edit of a short review in 5 to 10.
+
+Recent fingerprints are kept in the cache, in two short lists per
+company: one per client IP and one per reviewer. Each list holds the
+last DUPLICATE_REVIEW_HISTORY submissions of the last
+DUPLICATE_REVIEW_WINDOW seconds, so a check is one get_many() and a few
+dozen XORs, whatever the size of the Review table.
+
+A review is added to the lists only once it is saved, when its
+transaction commits. The lists are read, extended and written back
+without a lock, so two near-identical reviews sent at the same moment
+can both get through.
+"""
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+KEY_PREFIX = 'api:recent-reviews:'
+
+REJECT = 'reject'
+FLAG = 'flag'
+OFF = 'off'
+ACTIONS = (REJECT, FLAG, OFF)
+
+MASK = (1 << 64) - 1
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _features(text):
+    """
+    :return: set of the word triples of the text, or all of its words
+        as one feature if it is shorter
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _hash(feature):
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text):
+    """
+    :param text: text to fingerprint
+    :return: 64 bit SimHash, bit i is set if bit i is set in most feature hashes
+    """
+    features = _features(text)
+
+    # add up the bits of the feature hashes in 64 lanes at once:
+    # planes[i] holds bit i of each lane's count
+    planes = []
+    for feature in features:
+        carry = _hash(feature)
+        for i, plane in enumerate(planes):
+            planes[i] = plane ^ carry
+            carry &= plane
+            if not carry:
+                break
+        if carry:
+            planes.append(carry)
+
+    # the lanes whose count is at least a strict majority
+    threshold = len(features) // 2 + 1
+    greater, equal = 0, MASK
+    for i in range(max(len(planes), threshold.bit_length()) - 1, -1, -1):
+        plane = planes[i] if i < len(planes) else 0
+        if threshold >> i & 1:
+            equal &= plane
+        else:
+            greater |= equal & plane
+            equal &= ~plane & MASK
+    return greater | equal
+
+
+def distance(a, b):
+    """
+    :return: number of bits that differ between two fingerprints
+    """
+    return bin(a ^ b).count('1')
+
+
+def _keys(company_id, ip_address, reviewer_id):
+    keys = []
+    if ip_address:
+        digest = hashlib.md5(ip_address.encode('utf-8')).hexdigest()
+        keys.append('%sip:%s:%s' % (KEY_PREFIX, company_id, digest))
+    if reviewer_id is not None:
+        keys.append('%sreviewer:%s:%s' % (KEY_PREFIX, company_id, reviewer_id))
+    return keys
+
+
+class Submissions:
+    """
+    New reviews, checked against the recent submissions and against each
+    other, and added to the recent submissions once they are saved
+    """
+    def __init__(self):
+        # key -> list of (submitted, fingerprint) of the reviews added
+        self._pending = {}
+
+    def is_duplicate(self, company_id, ip_address, reviewer_id, fingerprint, now=None):
+        """
+        Check a new review against the recent submissions to the company
+        from the same IP or reviewer, and the ones added since the last record()
+        :param company_id: company pk
+        :param ip_address: client IP, or None
+        :param reviewer_id: reviewer pk, or None
+        :param fingerprint: simhash() of the title and summary
+        :param now: current time, for tests
+        :return: True if the review is a near-duplicate of one of them
+        """
+        now = time.time() if now is None else now
+        window = settings.DUPLICATE_REVIEW_WINDOW
+        max_distance = settings.DUPLICATE_REVIEW_MAX_DISTANCE
+
+        keys = _keys(company_id, ip_address, reviewer_id)
+        recent = cache.get_many(keys)
+        for key in keys:
+            entries = [entry for entry in recent.get(key, ()) if entry[0] > now - window]
+            entries.extend(self._pending.get(key, ()))
+            if any(distance(fingerprint, other) <= max_distance for _, other in entries):
+                return True
+        return False
+
+    def add(self, company_id, ip_address, reviewer_id, fingerprint, now=None):
+        """
+        Add a review that is to be saved, see is_duplicate() for the parameters
+        """
+        now = time.time() if now is None else now
+        for key in _keys(company_id, ip_address, reviewer_id):
+            entries = self._pending.setdefault(key, [])
+            entries.append((now, fingerprint))
+            del entries[:-settings.DUPLICATE_REVIEW_HISTORY]
+
+    def record(self, now=None):
+        """
+        Add the reviews added since the last call to the recent submissions.
+        Call once they are saved, e.g. with transaction.on_commit()
+        :param now: current time, for tests
+        """
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = time.time() if now is None else now
+        window = settings.DUPLICATE_REVIEW_WINDOW
+
+        recent = cache.get_many(list(pending))
+        updated = {}
+        for key, added in pending.items():
+            entries = [entry for entry in recent.get(key, ()) if entry[0] > now - window]
+            entries.extend(added)
+            updated[key] = entries[-settings.DUPLICATE_REVIEW_HISTORY:]
+        cache.set_many(updated, window)
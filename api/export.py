@@ -0,0 +1,86 @@
+"""
+Streaming export of a reviewer's reviews.
+
+Rows are read with values_list().iterator() and turned into plain
+lists by ReviewRowSerializer, so memory use stays flat no matter how
+many reviews are exported. The output matches ReviewSerializer.
+"""
+import csv
+import json
+
+from rest_framework import serializers
+
+from api.fields import url_template
+
+
+class ReviewRowSerializer:
+    """
+    Lightweight serializer for exporting Review rows.
+    Reads the columns in `columns` and writes the fields in `fields`
+    """
+    fields = ('url', 'rating', 'title', 'summary', 'ip_address',
+              'submission_date', 'last_modified', 'company', 'reviewer')
+    columns = ('id', 'rating', 'title', 'summary', 'ip_address',
+               'submission_date', 'last_modified', 'company_id', 'reviewer_id')
+
+    def __init__(self, request):
+        self.review_url = url_template(request, 'review-detail')
+        self.company_url = url_template(request, 'company-detail')
+        self.reviewer_url = url_template(request, 'reviewer-detail')
+        self.date_field = serializers.DateTimeField()
+
+    def to_row(self, values):
+        """
+        :param values: tuple of column values, as listed in `columns`
+        :return: list of field values, as listed in `fields`
+        """
+        (pk, rating, title, summary, ip_address,
+         submitted, modified, company_id, reviewer_id) = values
+        return [
+            self.review_url(pk),
+            rating,
+            title,
+            summary,
+            ip_address,
+            self.date_field.to_representation(submitted),
+            self.date_field.to_representation(modified),
+            self.company_url(company_id),
+            self.reviewer_url(reviewer_id),
+        ]
+
+
+class Echo:
+    """
+    File-like object that hands back what is written, for csv.writer
+    """
+    def write(self, value):
+        return value
+
+
+def stream_ndjson(rows, row_serializer):
+    """
+    :param rows: iterable of column value tuples
+    :param row_serializer: ReviewRowSerializer
+    :return: generator of NDJSON lines
+    """
+    fields = row_serializer.fields
+    for values in rows:
+        yield json.dumps(dict(zip(fields, row_serializer.to_row(values)))) + '\n'
+
+
+def stream_csv(rows, row_serializer):
+    """
+    :param rows: iterable of column value tuples
+    :param row_serializer: ReviewRowSerializer
+    :return: generator of CSV lines, starting with a header
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(row_serializer.fields)
+    for values in rows:
+        yield writer.writerow(row_serializer.to_row(values))
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', stream_ndjson),
+    'csv': ('text/csv', stream_csv),
+}
@@ -0,0 +1,147 @@
+"""
+Cache of the public company reviews feed.
+
+Serialized pages are cached per company and per the inputs a page
+depends on: the cursor, page size, ?fields= and ?exclude= and the
+negotiated format. Other query parameters and the host are left out of
+the key, so that they can not be used to get around the cache; the
+next and previous links are cached without them, and made absolute
+again for each request. Every company has a generation number that
+is part of the page keys, so a write to one of its reviews drops all
+of that company's pages at once, by bumping the generation, and leaves
+every other company's pages alone.
+
+Pages are built from the primary, not a read replica: a page built
+from a replica that has not caught up with a write yet would be
+cached under the generation that write started, and served until the
+next one.
+
+On a miss only one request builds the page: it takes a lock with
+cache.add(), and other requests for the same page wait for the result
+instead of running the same queries. If the build fails the lock is
+released and the next waiting request tries.
+"""
+import hashlib
+import json
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.settings import api_settings
+
+from api.fieldsets import EXCLUDE_PARAM, FIELDS_PARAM
+from api.pagination import CompanyReviewPagination
+from api.replicas import primary_reads
+
+
+# how often a request waiting for another to build a page checks the cache
+LOCK_POLL_INTERVAL = 0.05
+
+# the query parameters a page depends on
+PAGE_PARAMS = (CompanyReviewPagination.cursor_query_param,
+               CompanyReviewPagination.page_size_query_param,
+               FIELDS_PARAM, EXCLUDE_PARAM)
+
+# the page links, cached as a path and the PAGE_PARAMS and ?format=
+LINKS = ('next', 'previous')
+
+
+def _generation_key(company_id):
+    return 'api:company-reviews:generation:%s' % company_id
+
+
+def get_generation(company_id):
+    """
+    :param company_id: company pk
+    :return: the company's current generation number
+    """
+    key = _generation_key(company_id)
+    generation = cache.get(key)
+    if generation is None:
+        # start from the clock so that pages cached under a generation
+        # that was evicted from the cache are never served again
+        cache.add(key, int(time.time() * 1000000), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # not cached: the next reader starts a new generation
+        pass
+
+
+def invalidate_company_reviews(*company_ids):
+    """
+    Drop the cached feed pages of the companies.
+    Call inside the transaction that writes their reviews.
+    :param company_ids: company pks
+    """
+    for key in {_generation_key(pk) for pk in company_ids}:
+        _bump_generation(key)
+        # a concurrent reader may cache a page read before we commit
+        transaction.on_commit(lambda key=key: _bump_generation(key))
+
+
+def _page_key(company_id, request):
+    params = [(name, request.GET[name]) for name in PAGE_PARAMS if name in request.GET]
+    renderer = getattr(request, 'accepted_renderer', None)
+    page = json.dumps([params, renderer.format if renderer is not None else None])
+    return 'api:company-reviews:%s:%s:%s' % (
+        company_id, get_generation(company_id), hashlib.md5(page.encode('utf-8')).hexdigest())
+
+
+def _strip_link(url):
+    parts = urlsplit(url)
+    kept = PAGE_PARAMS + (api_settings.URL_FORMAT_OVERRIDE,)
+    query = [(name, value) for name, value in parse_qsl(parts.query) if name in kept]
+    return urlunsplit(('', '', parts.path, urlencode(query), ''))
+
+
+def _with_links(data, make_link):
+    data = data.copy()
+    for name in LINKS:
+        if data.get(name):
+            data[name] = make_link(data[name])
+    return data
+
+
+def get_page(company_id, request, build):
+    """
+    Return the cached page for this request, or build and cache it
+    :param company_id: company pk
+    :param request: request object, after content negotiation
+    :param build: callable returning the serialized page
+    :return: serialized page
+    """
+    return _with_links(_get_page(company_id, request, build), request.build_absolute_uri)
+
+
+def _get_page(company_id, request, build):
+    key = _page_key(company_id, request)
+
+    lock_key = key + ':lock'
+    deadline = time.monotonic() + settings.COMPANY_REVIEWS_LOCK_WAIT
+    while True:
+        data = cache.get(key)
+        if data is not None:
+            return data
+
+        if cache.add(lock_key, 1, settings.COMPANY_REVIEWS_LOCK_TIMEOUT):
+            try:
+                with primary_reads():
+                    data = _with_links(build(), _strip_link)
+                cache.set(key, data, settings.COMPANY_REVIEWS_CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock_key)
+            return data
+
+        # another request is building this page
+        if time.monotonic() >= deadline:
+            # it is too slow, don't keep the client waiting any longer
+            return _with_links(build(), _strip_link)
+        time.sleep(LOCK_POLL_INTERVAL)
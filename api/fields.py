@@ -0,0 +1,73 @@
+"""
+Hyperlinked fields that avoid per-object work.
+
+DRF's hyperlinked fields call reverse() for every object they render,
+which dominates the time spent serializing a long list. The fields here
+reverse each view name once per request and build the remaining urls
+with string formatting. The output is the same.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+
+# any pk that the url patterns accept, replaced in the reversed url
+URL_PK_PLACEHOLDER = 987654321
+
+
+def url_template(request, view_name):
+    """
+    Reverse a detail url once and return a function that builds the url
+    for any pk by string formatting.
+    :param request: request object, for absolute urls
+    :param view_name: url name with a single pk argument
+    :return: function of pk -> url
+    """
+    url = reverse(view_name, kwargs={'pk': URL_PK_PLACEHOLDER}, request=request)
+    prefix, suffix = url.rsplit(str(URL_PK_PLACEHOLDER), 1)
+    return lambda pk: '%s%s%s' % (prefix, pk, suffix)
+
+
+class FastHyperlinkMixin:
+    """
+    Builds urls from a template cached in the serializer context,
+    which lives for one request and is shared by every row of a list.
+    """
+    def get_url(self, obj, view_name, request, format):
+        if self.lookup_field != 'pk' or self.lookup_url_kwarg != 'pk' or format:
+            return super().get_url(obj, view_name, request, format)
+
+        # Unsaved objects will not yet have a valid URL.
+        if obj.pk in (None, ''):
+            return None
+
+        templates = self.context.setdefault('url_templates', {})
+        template = templates.get(view_name)
+        if template is None:
+            template = templates[view_name] = url_template(request, view_name)
+        return template(obj.pk)
+
+
+class FastHyperlinkedRelatedField(FastHyperlinkMixin, serializers.HyperlinkedRelatedField):
+    pass
+
+
+class FastHyperlinkedIdentityField(FastHyperlinkMixin, serializers.HyperlinkedIdentityField):
+    pass
+
+
+class PrefetchedHyperlinkedRelatedField(FastHyperlinkedRelatedField):
+    """
+    Hyperlinked field that finds the related object in a dictionary of
+    {pk: object} that the caller loaded up front and put in the serializer
+    context, instead of running a query for each value.
+    """
+    def __init__(self, context_key, **kwargs):
+        self.context_key = context_key
+        super().__init__(**kwargs)
+
+    def get_object(self, view_name, view_args, view_kwargs):
+        try:
+            return self.context[self.context_key][view_kwargs[self.lookup_url_kwarg]]
+        except KeyError:
+            raise ObjectDoesNotExist()
@@ -0,0 +1,181 @@
+"""
+Sparse fieldsets for the review and company endpoints.
+
+GET requests can ask for a subset of the fields with ?fields=a,b or
+leave some out with ?exclude=a,b. The serializer only builds the
+requested fields, and the queryset only SELECTs the columns that those
+fields read, so leaving out a review's summary saves reading, encoding
+and sending it.
+
+Serializers take part with SparseFieldsetSerializerMixin, views with
+SparseFieldsetMixin. A serializer field whose source is not a model
+field (a property, say) is mapped to the columns it reads through
+Meta.fieldset_sources; without a mapping the queryset is left as is.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+FIELDS_PARAM = 'fields'
+EXCLUDE_PARAM = 'exclude'
+
+
+def parse_field_names(value):
+    """
+    :param value: comma separated field names
+    :return: list of field names
+    """
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def select_fields(available, fields=None, exclude=None):
+    """
+    :param available: list of the serializer's field names
+    :param fields: ?fields= value, or None
+    :param exclude: ?exclude= value, or None
+    :return: list of the field names to render, in serializer order
+    :raise: ValidationError on unknown field names, or if no field is left
+    """
+    errors = {}
+    selected = list(available)
+    for param, value in ((FIELDS_PARAM, fields), (EXCLUDE_PARAM, exclude)):
+        if value is None:
+            continue
+        names = parse_field_names(value)
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            errors[param] = ["Unknown field(s): %s" % ', '.join(unknown)]
+        elif param == FIELDS_PARAM:
+            selected = [name for name in selected if name in names]
+        else:
+            selected = [name for name in selected if name not in names]
+
+    if not errors and not selected:
+        errors[FIELDS_PARAM] = ["At least one field must be selected"]
+    if errors:
+        raise ValidationError(errors)
+    return selected
+
+
+def _select_related_paths(select_related, prefix=''):
+    """
+    Flatten a Query.select_related dictionary into lookup paths
+    """
+    paths = []
+    for name, nested in select_related.items():
+        path = prefix + name
+        paths.append(path)
+        paths.extend(_select_related_paths(nested, path + '__'))
+    return paths
+
+
+def sparse_queryset(queryset, fields, sources=None, required=()):
+    """
+    Restrict a queryset to the columns that the serializer fields read
+    :param queryset: model queryset
+    :param fields: dictionary of name -> bound serializer field, e.g. serializer.fields
+    :param sources: dictionary of field name -> model field names, for fields
+        whose source is not a model field
+    :param required: model field names to load regardless, e.g. the pagination ordering
+    :return: queryset with only() and select_related() applied, or the queryset
+        as is if some field reads something that is not a model field
+    """
+    meta = queryset.model._meta
+    sources = sources or {}
+    columns = {meta.pk.name}
+    columns.update(name.lstrip('-') for name in required)
+
+    for name, field in fields.items():
+        if name in sources:
+            columns.update(sources[name])
+        elif isinstance(field, serializers.HyperlinkedIdentityField):
+            # built from the pk
+            continue
+        elif field.source == '*':
+            return queryset
+        else:
+            columns.add(field.source_attrs[0])
+
+    concrete = set()
+    for name in columns:
+        try:
+            model_field = meta.get_field(name)
+        except FieldDoesNotExist:
+            if name in queryset.query.annotations:
+                continue
+            return queryset
+        # reverse relations are loaded by select_related, or by a query of their own
+        if model_field.concrete:
+            concrete.add(name)
+
+    select_related = queryset.query.select_related
+    if isinstance(select_related, dict):
+        # a relation left out of only() can not be select_related
+        paths = [path for path in _select_related_paths(select_related)
+                 if path.split('__')[0] in columns]
+        queryset = queryset.select_related(None)
+        if paths:
+            queryset = queryset.select_related(*paths)
+
+    return queryset.only(*concrete)
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Serializer mixin that builds only the fields listed in context['fieldset']
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.context.get('fieldset')
+        if fieldset is not None:
+            for name in list(fields):
+                if name not in fieldset:
+                    del fields[name]
+        return fields
+
+
+class SparseFieldsetMixin:
+    """
+    View mixin for ?fields= and ?exclude= on GET requests.
+    Passes the selected field names to the serializer and
+    defers the columns that no selected field reads.
+    """
+    def get_fieldset(self):
+        """
+        :return: list of field names to render, or None for every field
+        :raise: ValidationError on an invalid selection
+        """
+        if not hasattr(self, '_fieldset'):
+            params = self.request.query_params
+            if self.request.method not in SAFE_METHODS or (
+                    FIELDS_PARAM not in params and EXCLUDE_PARAM not in params):
+                self._fieldset = None
+                return None
+
+            # every field, to check the selection against
+            serializer = self.get_serializer_class()(context=super().get_serializer_context())
+            fieldset = select_fields(list(serializer.fields),
+                                     params.get(FIELDS_PARAM), params.get(EXCLUDE_PARAM))
+            self._fieldset_fields = {name: serializer.fields[name] for name in fieldset}
+            self._fieldset_sources = getattr(serializer.Meta, 'fieldset_sources', {})
+            self._fieldset = fieldset
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_fieldset() is None:
+            return queryset
+
+        # the pagination reads its ordering fields from every row of the page
+        paginator = self.paginator
+        required = (paginator.get_ordering(self.request, queryset, self)
+                    if paginator is not None else ())
+        return sparse_queryset(queryset, self._fieldset_fields,
+                               self._fieldset_sources, required)
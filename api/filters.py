@@ -1,5 +1,12 @@
+import datetime
+
+from django.db.models import Func
+from django.utils import timezone
 from rest_framework import filters
 
+from api.search import search_reviews
+from api.serializers import ReviewFilterSerializer
+
 
 # https://www.django-rest-framework.org/api-guide/filtering/#setting-filter-backends
 class IsUserFilterBackend(filters.BaseFilterBackend):
@@ -47,3 +54,139 @@ class IsReviewerFilterBackend(filters.BaseFilterBackend):
             reviewer = None
 
         return reviews_qs.filter(reviewer=reviewer)
+
+
+class ReviewSearchFilterBackend(filters.BaseFilterBackend):
+    """
+    Full-text search over review titles and summaries with ?q=
+    """
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        """
+        Matching reviews are annotated with a `search_rank`,
+        which the pagination orders by. Views can narrow the
+        index lookup with a get_search_scope() method, see api.search.
+
+        :param request: request object
+        :param queryset: Reviews queryset
+        :param view: view instance
+        :return: filtered queryset, or the queryset as is without ?q=
+        """
+        query = request.query_params.get(self.search_param)
+        if query is None:
+            return queryset
+        get_scope = getattr(view, 'get_search_scope', None)
+        return search_reviews(queryset, query, get_scope() if get_scope else None)
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def prefix_range(prefix):
+    """
+    The range of strings that start with prefix, for a filter that
+    an index on the column can answer on every database, unlike LIKE
+    :param prefix: non-empty string
+    :return: (lowest, upper bound) tuple, the upper bound is excluded or None
+    """
+    for i in range(len(prefix) - 1, -1, -1):
+        if ord(prefix[i]) < 0x10ffff:
+            return prefix, prefix[:i] + chr(ord(prefix[i]) + 1)
+    return prefix, None
+
+
+class Unindexed(Func):
+    """
+    A column in a form that SQLite does not look up in an index, +column.
+
+    Without statistics SQLite's planner prefers an index range on a filtered
+    column to the index that returns the rows in the requested order, and
+    then sorts every matching row. Filtering on Unindexed(column) leaves it
+    the index of the ordering. Other databases get the column as is.
+    """
+    template = '%(expressions)s'
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='+%(expressions)s', **extra_context)
+
+
+class ReviewFilterBackend(filters.BaseFilterBackend):
+    """
+    Filter reviews with ?rating_min=, ?rating_max=, ?company=<pk>,
+    and ?submitted_from= / ?submitted_to= (YYYY-MM-DD, inclusive).
+
+    Every filter and ordering of ReviewPagination is served by one of the
+    (reviewer|company, submission_date|rating) indexes: range filters on
+    a column other than the one the page is ordered by are checked
+    against the rows read from the ordering's index.
+    """
+    def filter_queryset(self, request, queryset, view):
+        """
+        :param request: request object
+        :param queryset: Reviews queryset
+        :param view: view instance
+        :return: filtered queryset
+        :raise: ValidationError on invalid parameters
+        """
+        params = ReviewFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if 'company' in params:
+            queryset = queryset.filter(company_id=params['company'])
+
+        ranges = []
+        if 'rating_min' in params:
+            ranges.append(('rating', 'gte', params['rating_min']))
+        if 'rating_max' in params:
+            ranges.append(('rating', 'lte', params['rating_max']))
+        if 'submitted_from' in params:
+            ranges.append(('submission_date', 'gte', _start_of_day(params['submitted_from'])))
+        if 'submitted_to' in params:
+            ranges.append(('submission_date', 'lt', _start_of_day(
+                params['submitted_to'] + datetime.timedelta(days=1))))
+        if not ranges:
+            return queryset
+
+        ordered_by = self.get_ordering_column(request, queryset, view)
+        for column, lookup, value in ranges:
+            if column != ordered_by:
+                alias = '%s_unindexed' % column
+                if alias not in queryset.query.annotations:
+                    queryset = queryset.annotate(**{alias: Unindexed(column)})
+                column = alias
+            queryset = queryset.filter(**{'%s__%s' % (column, lookup): value})
+        return queryset
+
+    @staticmethod
+    def get_ordering_column(request, queryset, view):
+        """
+        :return: the column the view's pagination orders by first, or None
+        """
+        paginator = getattr(view, 'paginator', None)
+        if paginator is None or not hasattr(paginator, 'get_ordering'):
+            return None
+        return paginator.get_ordering(request, queryset, view)[0].lstrip('-')
+
+
+class CompanyNameFilterBackend(filters.BaseFilterBackend):
+    """
+    Filter companies by name prefix with ?name= (case sensitive)
+    """
+    name_param = 'name'
+
+    def filter_queryset(self, request, queryset, view):
+        """
+        :param request: request object
+        :param queryset: Company queryset
+        :param view: view instance
+        :return: filtered queryset, or the queryset as is without ?name=
+        """
+        prefix = request.query_params.get(self.name_param)
+        if not prefix:
+            return queryset
+        lowest, upper = prefix_range(prefix)
+        queryset = queryset.filter(name__gte=lowest)
+        return queryset.filter(name__lt=upper) if upper is not None else queryset
@@ -0,0 +1,227 @@
+"""
+Password hashing in a process pool.
+
+PBKDF2 keeps a request thread busy for a long time, so registration,
+password changes and token-auth hash in a small pool of worker
+processes instead. The number of hashes waiting for the pool is
+bounded: beyond it requests fail fast with 503 and Retry-After rather
+than tying up more request threads.
+
+With PASSWORD_HASHING_POOL_SIZE = 0 hashing runs in the request
+thread, as Django does by default.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions, status
+
+from api.metrics import METRICS, Histogram
+
+
+# passwords per pool job of make_passwords, small so that a chunk is soon done
+BULK_CHUNK_SIZE = 4
+
+
+class HashingUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _('Too many password requests, try again shortly.')
+    default_code = 'hashing_unavailable'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        # sent as Retry-After by the exception handler
+        self.wait = wait
+
+
+def _init_worker():
+    # needed when workers are spawned rather than forked
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+    import django
+    django.setup()
+
+
+def _make_password(password):
+    return hashers.make_password(password)
+
+
+def _make_passwords(passwords):
+    return [hashers.make_password(password) for password in passwords]
+
+
+def _check_password(password, encoded):
+    """
+    :return: (matches, the hash should be upgraded) tuple
+    """
+    if not hashers.check_password(password, encoded):
+        return False, False
+    try:
+        return True, hashers.identify_hasher(encoded).must_update(encoded)
+    except ValueError:  # pragma: no cover
+        return True, False
+
+
+class HashingService:
+    """
+    Bounded process pool for password hashing, with per-operation latency
+    """
+    def __init__(self, pool_size, queue_limit, timeout, retry_after, reserved_workers=1):
+        """
+        :param pool_size: worker processes, 0 to hash in the calling thread
+        :param queue_limit: hashes allowed to wait for a free worker
+        :param timeout: seconds to wait for a hash before giving up
+        :param retry_after: Retry-After seconds sent when the pool is full
+        :param reserved_workers: workers that make_passwords leaves free for single
+            hashes, 0 for a pool that only hashes batches
+        """
+        self.pool_size = pool_size
+        self.reserved_workers = reserved_workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(pool_size + queue_limit) if pool_size else None
+        self._executor = None
+        self._lock = threading.Lock()
+        self._latency = {}
+        self.rejected = 0
+
+    def make_password(self, password):
+        """
+        :param password: raw password
+        :return: encoded password for User.password
+        :raise: HashingUnavailable when the pool is full
+        """
+        return self._run('make_password', _make_password, password)
+
+    def make_passwords(self, passwords):
+        """
+        Hash many passwords, e.g. for an import.
+        The batch is sent to the pool BULK_CHUNK_SIZE passwords at a time,
+        each chunk holding a queue slot, and leaves reserved_workers free,
+        so that logins and signups are not queued behind it. It is not
+        subject to the timeout.
+        :param passwords: list of raw passwords
+        :return: list of encoded passwords, in the same order
+        :raise: HashingUnavailable when the pool is full
+        """
+        if self._slots is None:
+            return _make_passwords(passwords)
+        if not passwords:
+            return []
+
+        if not self._slots.acquire(blocking=False):
+            self._reject()
+        in_flight = threading.BoundedSemaphore(max(1, self.pool_size - self.reserved_workers))
+
+        def release(future):
+            self._slots.release()
+            in_flight.release()
+
+        start = time.perf_counter()
+        futures = []
+        try:
+            for index in range(0, len(passwords), BULK_CHUNK_SIZE):
+                in_flight.acquire()
+                # the first chunk has its slot already, the others wait for one
+                if index:
+                    self._slots.acquire()
+                try:
+                    future = self._get_executor().submit(
+                        _make_passwords, passwords[index:index + BULK_CHUNK_SIZE])
+                except BaseException:
+                    release(None)
+                    raise
+                future.add_done_callback(release)
+                futures.append(future)
+            encoded = []
+            for future in futures:
+                encoded.extend(future.result())
+        except BrokenProcessPool:
+            self._restart()
+
+        self._observe('make_password', (time.perf_counter() - start) * 1000 / len(passwords))
+        return encoded
+
+    def check_password(self, password, encoded):
+        """
+        :param password: raw password
+        :param encoded: User.password
+        :return: (matches, the hash should be upgraded) tuple
+        :raise: HashingUnavailable when the pool is full
+        """
+        return self._run('check_password', _check_password, password, encoded)
+
+    def stats(self):
+        """
+        :return: latency summary per operation, in milliseconds, and the number of rejections
+        """
+        with self._lock:
+            result = {name: histogram.to_dict() for name, histogram in self._latency.items()}
+            result['rejected'] = self.rejected
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _run(self, name, function, *args):
+        start = time.perf_counter()
+        if self._slots is None:
+            result = function(*args)
+        else:
+            if not self._slots.acquire(blocking=False):
+                self._reject()
+            try:
+                future = self._get_executor().submit(function, *args)
+            except BrokenProcessPool:
+                self._slots.release()
+                self._restart()
+            # the slot is held until the worker is done, even if we stop waiting
+            future.add_done_callback(lambda future: self._slots.release())
+            try:
+                result = future.result(timeout=self.timeout)
+            except TimeoutError:
+                self._reject()
+            except BrokenProcessPool:
+                self._restart()
+
+        self._observe(name, (time.perf_counter() - start) * 1000)
+        return result
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size,
+                                                     initializer=_init_worker)
+            return self._executor
+
+    def _observe(self, name, milliseconds):
+        with self._lock:
+            histogram = self._latency.get(name)
+            if histogram is None:
+                histogram = self._latency[name] = Histogram(METRICS['total_ms'])
+            histogram.observe(milliseconds)
+
+    def _restart(self):
+        # a worker died, start a new pool for the next request
+        self.shutdown()
+        self._reject()
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        raise HashingUnavailable(wait=self.retry_after)
+
+
+hashing_service = HashingService(
+    pool_size=settings.PASSWORD_HASHING_POOL_SIZE,
+    queue_limit=settings.PASSWORD_HASHING_QUEUE_LIMIT,
+    timeout=settings.PASSWORD_HASHING_TIMEOUT,
+    retry_after=settings.PASSWORD_HASHING_RETRY_AFTER,
+)
@@ -0,0 +1,227 @@
+"""
+Durable background jobs.
+
+Side effects of a write that its response does not need are queued as
+Job rows instead of being run in the request. enqueue() inserts the row
+in the write's transaction, so a job commits or rolls back with its
+write and survives restarts, and the run_workers command runs the jobs
+in a pool of worker processes.
+
+A worker claims up to JOB_BATCH_SIZE due jobs of the same kind and
+hands all their payloads to the kind's handler at once, so a handler
+can merge them, e.g. into one UPDATE per row. The handler runs in a
+transaction that also deletes the jobs, so a batch takes effect exactly
+once as long as its handler only writes to the database.
+
+Claims are leases: the jobs of a worker that died are claimed again
+JOB_LEASE seconds later. When a batch fails, its jobs are run one at a
+time, so that one bad job does not hold back the others. A failing job
+is retried after JOB_RETRY_DELAY seconds, doubled after each attempt up
+to JOB_MAX_RETRY_DELAY, and is marked failed after JOB_MAX_ATTEMPTS
+attempts. Failed jobs are kept for inspection and can be retried from
+Django Admin.
+"""
+import datetime
+import json
+import os
+import socket
+import traceback
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from api.models import Job
+
+
+# job kind -> dotted path of its handler, a callable taking a list of payloads
+HANDLERS = {
+    'daily-ratings': 'api.stats.apply_daily_rating_jobs',
+}
+
+
+class LeaseExpired(Exception):
+    """
+    Another worker claimed the jobs while their handler ran
+    """
+
+
+def enqueue(kind, payload, delay=0):
+    """
+    Queue a job.
+    Call inside the transaction that makes the write the job belongs to.
+    :param kind: one of HANDLERS
+    :param payload: JSON serializable handler argument
+    :param delay: seconds before the job is run
+    :return: Job object
+    """
+    if kind not in HANDLERS:
+        raise ValueError("Unknown job kind: %s" % kind)
+    now = timezone.now()
+    return Job.objects.create(kind=kind, payload=json.dumps(payload), created=now,
+                              run_at=now + datetime.timedelta(seconds=delay))
+
+
+def retry_delay(attempts):
+    """
+    :param attempts: number of failed attempts
+    :return: seconds to wait before the next one
+    """
+    return min(settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), settings.JOB_MAX_RETRY_DELAY)
+
+
+def worker_name():
+    return '%s:%s' % (socket.gethostname()[:30], os.getpid())
+
+
+def _due(now, kinds=None):
+    jobs = (Job.objects
+            .filter(failed=False, run_at__lte=now)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now)))
+    if kinds is not None:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.order_by('run_at', 'id')
+
+
+def claim(batch_size, kinds=None, now=None):
+    """
+    Lease the oldest due job and up to batch_size - 1 more of its kind
+    :param batch_size: maximum number of jobs
+    :param kinds: only claim jobs of these kinds, default all
+    :param now: current time, for tests
+    :return: list of claimed Job objects, oldest first
+    """
+    now = now or timezone.now()
+    kind = _due(now, kinds).values_list('kind', flat=True).first()
+    if kind is None:
+        return []
+
+    ids = list(_due(now).filter(kind=kind).values_list('pk', flat=True)[:batch_size])
+    # unique per claim, so that a worker can tell its jobs were claimed again
+    token = '%s:%s' % (worker_name(), uuid.uuid4().hex[:12])
+    # the due conditions are checked again by the UPDATE, so of two
+    # workers claiming the same job only one gets it
+    _due(now).filter(pk__in=ids).update(
+        locked_by=token, locked_until=now + datetime.timedelta(seconds=settings.JOB_LEASE))
+    return list(Job.objects.filter(pk__in=ids, locked_by=token).order_by('run_at', 'id'))
+
+
+def _run(jobs):
+    handler = import_string(HANDLERS[jobs[0].kind])
+    with transaction.atomic():
+        handler([json.loads(job.payload) for job in jobs])
+        deleted, _ = Job.objects.filter(pk__in=[job.pk for job in jobs],
+                                        locked_by=jobs[0].locked_by).delete()
+        if deleted != len(jobs):
+            raise LeaseExpired()
+
+
+def _fail(job, error, now=None):
+    now = now or timezone.now()
+    attempts = job.attempts + 1
+    values = {'attempts': attempts, 'last_error': error, 'locked_by': '', 'locked_until': None}
+    if attempts >= settings.JOB_MAX_ATTEMPTS:
+        values['failed'] = True
+    else:
+        values['run_at'] = now + datetime.timedelta(seconds=retry_delay(attempts))
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**values)
+
+
+def run_batch(jobs):
+    """
+    Run claimed jobs of one kind, see above
+    :param jobs: list of Job objects from claim()
+    :return: (number of jobs done, number of jobs that failed) tuple
+    """
+    try:
+        _run(jobs)
+        return len(jobs), 0
+    except LeaseExpired:
+        # the worker that claimed them again runs them
+        return 0, 0
+    except Exception:
+        if len(jobs) == 1:
+            _fail(jobs[0], traceback.format_exc())
+            return 0, 1
+
+    done = failed = 0
+    for job in jobs:
+        job_done, job_failed = run_batch([job])
+        done += job_done
+        failed += job_failed
+    return done, failed
+
+
+def run_pending(batch_size=None, kinds=None):
+    """
+    Run due jobs in this process until there are none left
+    :param batch_size: jobs per batch, default JOB_BATCH_SIZE
+    :param kinds: only run jobs of these kinds, default all
+    :return: (number of jobs done, number of jobs that failed) tuple
+    """
+    batch_size = batch_size or settings.JOB_BATCH_SIZE
+    done = failed = 0
+    while True:
+        jobs = claim(batch_size, kinds)
+        if not jobs:
+            return done, failed
+        batch_done, batch_failed = run_batch(jobs)
+        done += batch_done
+        failed += batch_failed
+
+
+def retry(jobs):
+    """
+    Queue failed jobs again, with their attempts reset
+    :param jobs: Job queryset
+    :return: number of jobs queued
+    """
+    return jobs.filter(failed=True).update(failed=False, attempts=0, run_at=timezone.now(),
+                                           locked_by='', locked_until=None)
+
+
+def queue_stats(now=None):
+    """
+    :param now: current time, for tests
+    :return: dict of kind -> {'pending', 'failed', 'oldest_pending_seconds'},
+        where the age of the oldest pending job is how far behind the workers are
+    """
+    now = now or timezone.now()
+    rows = (Job.objects
+            .order_by()
+            .values('kind', 'failed')
+            .annotate(count=Count('id'), oldest=Min('created')))
+    stats = {}
+    for row in rows:
+        kind_stats = stats.setdefault(row['kind'], {'pending': 0, 'failed': 0,
+                                                    'oldest_pending_seconds': None})
+        if row['failed']:
+            kind_stats['failed'] = row['count']
+        else:
+            kind_stats['pending'] = row['count']
+            kind_stats['oldest_pending_seconds'] = round((now - row['oldest']).total_seconds(), 3)
+    return stats
+
+
+def work(stop, batch_size=None, poll_interval=None, log=None):
+    """
+    Run jobs as they become due, until stop is set
+    :param stop: threading or multiprocessing Event
+    :param batch_size: jobs per batch, default JOB_BATCH_SIZE
+    :param poll_interval: seconds between checks of an empty queue, default JOB_POLL_INTERVAL
+    :param log: optional callable taking a progress message
+    """
+    batch_size = batch_size or settings.JOB_BATCH_SIZE
+    poll_interval = poll_interval or settings.JOB_POLL_INTERVAL
+    log = log or (lambda message: None)
+    while not stop.is_set():
+        close_old_connections()
+        jobs = claim(batch_size)
+        if not jobs:
+            stop.wait(poll_interval)
+            continue
+        done, failed = run_batch(jobs)
+        log("%s: %d %s jobs done, %d failed" % (worker_name(), done, jobs[0].kind, failed))
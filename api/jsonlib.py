@@ -0,0 +1,65 @@
+"""
+JSON encoding and decoding with the fastest library installed.
+
+orjson is used when it is installed, then ujson, then the standard
+library json module. All of them produce compact UTF-8 JSON. Types the
+library does not encode itself (lazy translations, Decimal with ujson
+or orjson, and so on) are encoded as DRF's JSONEncoder encodes them.
+"""
+import json
+
+from rest_framework.utils import encoders
+from rest_framework.utils.json import strict_constant
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+
+_encoder = encoders.JSONEncoder()
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    # datetimes as DRF writes them: ISO 8601, with Z for UTC
+    _ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps(data):
+        """
+        :param data: data to encode
+        :return: JSON bytes
+        :raise: TypeError if some value can not be encoded
+        """
+        return orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS)
+
+    loads = orjson.loads
+
+elif ujson is not None:  # pragma: no cover
+    BACKEND = 'ujson'
+
+    def dumps(data):
+        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False,
+                           default=_default).encode('utf-8')
+
+    loads = ujson.loads
+
+else:  # pragma: no cover
+    BACKEND = 'json'
+
+    def dumps(data):
+        return json.dumps(data, cls=encoders.JSONEncoder, ensure_ascii=False,
+                          allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data, parse_constant=strict_constant)
@@ -0,0 +1,127 @@
+"""
+Company leaderboards.
+
+Ranking on demand would sort every company on every request, so each
+board is materialized in CompanyRank: one row per ranked company with
+its rank, rebuilt for the whole board at once by rebuild(), which the
+rebuild_leaderboards command runs on a schedule. Reads are then index
+lookups: the top N of a board is a range of (board, rank), and the rank
+of a company is one (board, company) row.
+
+The scores come from the rating totals that review writes keep up to
+date (see api.stats), so a rebuild reads one row per company, or per
+company and day, rather than every review.
+
+top-rated
+    Bayesian average rating: the company's ratings plus
+    LEADERBOARD_PRIOR_WEIGHT ratings at the mean of all reviews, so that
+    a few 5 star reviews do not top the board. Companies need at least
+    LEADERBOARD_MIN_REVIEWS reviews.
+
+most-reviewed
+    Number of reviews in the last LEADERBOARD_RECENT_DAYS days, today included.
+
+Ties go to the company with more reviews, then to the older company.
+"""
+import datetime
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Sum, Value
+from django.utils import timezone
+
+from api.models import CompanyDailyRating, CompanyRank, CompanyRatingStats
+
+
+BOARDS = tuple(board for board, _ in CompanyRank.BOARDS)
+
+
+def top_rated_scores():
+    """
+    :return: iterator of (company_id, score, review_count) tuples, best first
+    """
+    totals = CompanyRatingStats.objects.aggregate(reviews=Sum('review_count'),
+                                                  ratings=Sum('rating_sum'))
+    prior_mean = totals['ratings'] / totals['reviews'] if totals['reviews'] else 0
+    weight = float(settings.LEADERBOARD_PRIOR_WEIGHT)
+
+    score = ExpressionWrapper((Value(weight * prior_mean) + F('rating_sum')) /
+                              (Value(weight) + F('review_count')),
+                              output_field=FloatField())
+    return (CompanyRatingStats.objects
+            .filter(review_count__gte=max(settings.LEADERBOARD_MIN_REVIEWS, 1))
+            .annotate(score=score)
+            .order_by('-score', '-review_count', 'company_id')
+            .values_list('company_id', 'score', 'review_count')
+            .iterator())
+
+
+def most_reviewed_scores(today=None):
+    """
+    :param today: last day counted, default today (UTC)
+    :return: iterator of (company_id, score, review_count) tuples, best first
+    """
+    today = today or timezone.localdate()
+    first_day = today - datetime.timedelta(days=settings.LEADERBOARD_RECENT_DAYS - 1)
+    return (CompanyDailyRating.objects
+            .filter(day__gte=first_day, day__lte=today)
+            .values('company_id')
+            .annotate(recent=Sum('review_count'))
+            .filter(recent__gt=0)
+            .order_by('-recent', 'company_id')
+            .values_list('company_id', 'recent', 'recent')
+            .iterator())
+
+
+SCORES = {
+    CompanyRank.TOP_RATED: top_rated_scores,
+    CompanyRank.MOST_REVIEWED: most_reviewed_scores,
+}
+
+
+def rebuild(board, batch_size=5000):
+    """
+    Replace the ranks of a board with freshly computed ones.
+    Readers see the previous ranks until the new ones are committed.
+    :param board: one of BOARDS
+    :param batch_size: rows per INSERT
+    :return: number of companies ranked
+    """
+    refreshed = timezone.now()
+    ranks = (CompanyRank(board=board, rank=rank, company_id=company_id,
+                         score=score, review_count=review_count, refreshed=refreshed)
+             for rank, (company_id, score, review_count) in enumerate(SCORES[board](), 1))
+
+    count = 0
+    with transaction.atomic():
+        CompanyRank.objects.filter(board=board).delete()
+        while True:
+            batch = list(islice(ranks, batch_size))
+            if not batch:
+                break
+            CompanyRank.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def top(board, limit):
+    """
+    :param board: one of BOARDS
+    :param limit: number of ranks
+    :return: queryset of the board's first `limit` CompanyRank rows, with their companies
+    """
+    return (CompanyRank.objects
+            .filter(board=board, rank__lte=limit)
+            .select_related('company__rating_stats')
+            .order_by('rank'))
+
+
+def company_ranks(company_id):
+    """
+    :param company_id: company pk
+    :return: dict of board -> CompanyRank, or None where the company is not ranked
+    """
+    ranks = dict.fromkeys(BOARDS)
+    ranks.update((rank.board, rank) for rank in CompanyRank.objects.filter(company_id=company_id))
+    return ranks
@@ -0,0 +1,92 @@
+"""
+Long polling of the read endpoints.
+
+A GET with If-None-Match and ?wait=<seconds> to a view with
+`long_poll = True` is held until the response would change, instead of
+getting an immediate 304 Not Modified: the request is run again every
+LONG_POLL_INTERVAL seconds, for up to ?wait= (at most
+LONG_POLL_MAX_WAIT) seconds, and the first response that is not a 304
+is returned. Clients that poll for changes then get them as they
+happen, with one request per change rather than per interval.
+
+Under ASGI (see api.asgi) the handler waits on the event loop, and only
+the re-checks take a thread, so a waiting client costs a coroutine.
+Under WSGI a waiting client would hold a server thread, so ?wait= is
+ignored there unless LONG_POLL_WSGI is set, in which case
+LongPollMiddleware waits in the request thread.
+
+Re-checks are marked with `long_poll_retry` on the request, so that the
+rate limits and the endpoint stats count a long poll once.
+"""
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+WAIT_PARAM = 'wait'
+
+# set in request.META by api.asgi, which does the waiting itself
+ASYNC_KEY = 'reviews.long_poll.async'
+
+
+def _allows_long_poll(request):
+    match = request.resolver_match
+    view_class = getattr(match.func, 'view_class', None) if match is not None else None
+    return getattr(view_class, 'long_poll', False)
+
+
+def get_wait(request, response):
+    """
+    :param request: request object, after the view ran
+    :param response: its response
+    :return: seconds to wait for a change, or None if the response is final
+    """
+    if response.status_code != 304 or request.method not in ('GET', 'HEAD'):
+        return None
+    if 'HTTP_IF_NONE_MATCH' not in request.META or not _allows_long_poll(request):
+        return None
+    try:
+        wait = float(request.GET[WAIT_PARAM])
+    except (KeyError, ValueError):
+        return None
+    if not wait > 0:
+        return None
+    return min(wait, settings.LONG_POLL_MAX_WAIT)
+
+
+def mark_retry(request):
+    """
+    Mark a request that is run again to see if it changed
+    :param request: request object
+    """
+    request.long_poll_retry = True
+
+
+class LongPollMiddleware:
+    """
+    Hold ?wait= requests that would get a 304 until they would not, under WSGI, see above.
+    Put it first, so that every re-check goes through the whole stack.
+    Enable with LONG_POLL_WSGI = true.
+    """
+    def __init__(self, get_response):
+        if not settings.LONG_POLL_WSGI:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        wait = get_wait(request, response)
+        if wait is None or request.META.get(ASYNC_KEY):
+            return response
+
+        deadline = time.monotonic() + wait
+        mark_retry(request)
+        while response.status_code == 304:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(settings.LONG_POLL_INTERVAL, remaining))
+            response.close()
+            response = self.get_response(request)
+        return response
@@ -0,0 +1,61 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import jobs
+from api.models import Company, CompanyDailyRating
+from api.stats import DAILY_RATINGS_JOB, aggregate_daily_ratings
+
+
+class Command(BaseCommand):
+    """
+    Recompute CompanyDailyRating from the Review table.
+
+    Companies are processed in pk order, a chunk at a time, and the daily
+    totals of a chunk are streamed from the database and inserted in
+    batches, so memory use is bounded no matter how long the history is.
+    Each chunk is replaced in its own transaction, after the queued
+    daily-ratings jobs are run, so that the writes they hold are neither
+    lost nor counted twice. Stop the run_workers workers first.
+    """
+    help = "Recompute the per-company daily rating totals from the reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of companies to recompute per transaction")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        batch_size = options['batch_size']
+        last_pk = 0
+        companies = 0
+        days = 0
+
+        while True:
+            company_ids = list(Company.objects
+                               .filter(pk__gt=last_pk)
+                               .order_by('pk')
+                               .values_list('pk', flat=True)[:chunk_size])
+            if not company_ids:
+                break
+
+            with transaction.atomic():
+                jobs.run_pending(kinds=[DAILY_RATINGS_JOB])
+                CompanyDailyRating.objects.filter(company_id__in=company_ids).delete()
+                rows = aggregate_daily_ratings(company_ids)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    CompanyDailyRating.objects.bulk_create(batch)
+                    days += len(batch)
+
+            companies += len(company_ids)
+            last_pk = company_ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write("Backfilled %d companies, %d company days" % (companies, days))
+
+        self.stdout.write("Backfilled %d companies, %d company days" % (companies, days))
@@ -0,0 +1,30 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.metrics import endpoint_stats
+
+
+class Command(BaseCommand):
+    """
+    Print the per-endpoint request metrics as JSON.
+
+    The metrics are kept in the memory of each server process, so this
+    reads the snapshots the processes publish to the cache every
+    ENDPOINT_STATS_PUBLISH_INTERVAL seconds. With the default per-process
+    cache nothing is shared and the report is empty.
+    """
+    help = "Print per-endpoint query count and latency histograms"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append', dest='routes',
+                            help="Only report this route name, e.g. review-list (repeatable)")
+        parser.add_argument('--indent', type=int, default=2,
+                            help="JSON indentation")
+
+    def handle(self, *args, **options):
+        report = endpoint_stats.report()
+        if options['routes']:
+            report = {route: summary for route, summary in report.items()
+                      if route in options['routes']}
+        self.stdout.write(json.dumps(report, indent=options['indent']))
@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Company, Review, Reviewer
+
+
+class Command(BaseCommand):
+    """
+    Print the query plan of every SELECT the API endpoints run.
+
+    Each endpoint is called through its view (so filter backends and
+    pagination are applied exactly as for a real request), the SQL it
+    runs is captured, and each SELECT is run again under EXPLAIN.
+    """
+    help = "Print EXPLAIN output for the queries run by each API endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviewer', type=int,
+                            help="Reviewer pk to run the reviewer-scoped endpoints as")
+        parser.add_argument('--analyze', action='store_true',
+                            help="Run EXPLAIN ANALYZE (PostgreSQL only)")
+
+    def handle(self, *args, **options):
+        reviewer = self._get_reviewer(options['reviewer'])
+        user = reviewer.user
+        company = Company.objects.order_by('pk').first()
+        review = Review.objects.filter(reviewer=reviewer).order_by('pk').first()
+
+        explain_options = {}
+        if options['analyze']:
+            if connection.vendor != 'postgresql':
+                raise CommandError("--analyze is only supported on PostgreSQL")
+            explain_options['analyze'] = True
+        self.prefix = connection.ops.explain_query_prefix(**explain_options)
+
+        # (route name, url kwargs, also explain the page after the first)
+        endpoints = [
+            ('company-list', {}, True),
+            ('company-detail', {'pk': company.pk} if company else None, False),
+            ('review-list', {}, True),
+            ('review-detail', {'pk': review.pk} if review else None, False),
+            ('reviewer-detail', {'pk': user.pk}, False),
+        ]
+
+        for name, kwargs, follow_next in endpoints:
+            if kwargs is None:
+                self.stdout.write("\n== %s: skipped, no rows to look up" % name)
+                continue
+
+            url = reverse(name, kwargs=kwargs)
+            response = self._explain_endpoint(name, url, user)
+
+            next_url = getattr(response, 'data', {}).get('next') if follow_next else None
+            if next_url:
+                self._explain_endpoint(name + ' (next page)', next_url, user)
+
+    def _get_reviewer(self, pk):
+        reviewers = Reviewer.objects.select_related('user').order_by('pk')
+        reviewer = reviewers.filter(pk=pk).first() if pk else reviewers.first()
+        if reviewer is None:
+            raise CommandError("No reviewer found to run the queries as")
+        return reviewer
+
+    def _explain_endpoint(self, label, url, user):
+        """
+        Call the view for the url and explain each SELECT it ran.
+        :param label: heading for the output
+        :param url: url to GET
+        :param user: user to authenticate as
+        :return: view response
+        """
+        request = APIRequestFactory().get(url, SERVER_NAME='localhost')
+        force_authenticate(request, user=user)
+        match = resolve(request.path)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = match.func(request, *match.args, **match.kwargs)
+
+        self.stdout.write("\n== %s: GET %s -> %s" % (label, url, response.status_code))
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            self.stdout.write("\n-- %s" % sql)
+            with connection.cursor() as cursor:
+                cursor.execute('%s %s' % (self.prefix, sql))
+                for row in cursor.fetchall():
+                    self.stdout.write('   ' + ' '.join(str(col) for col in row))
+        return response
@@ -0,0 +1,90 @@
+import csv
+import json
+import os
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import create_reviewers
+from api.hashing import HashingService
+from api.parsers import csv_rows
+
+
+class Command(BaseCommand):
+    """
+    Register reviewers from a CSV (with a header row) or NDJSON file.
+
+    Rows have the fields of the reviewers endpoint: username, password,
+    and optionally first_name, last_name, email, bio and website.
+    The file is read a batch at a time and each batch is registered in
+    its own transaction, with the passwords hashed on every core.
+    Invalid rows are reported and skipped.
+    """
+    help = "Register reviewers in bulk from a CSV or NDJSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or NDJSON file")
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help="File format, by default taken from the file extension")
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of rows to register per transaction")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Rows per INSERT")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Password hashing processes, 0 to hash in this process")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        # no logins share this pool
+        hashing = HashingService(pool_size=options['workers'], queue_limit=0,
+                                 timeout=None, retry_after=0, reserved_workers=0)
+
+        created = 0
+        failed = 0
+        try:
+            with open(path, newline='', encoding='utf-8') as input_file:
+                rows = self._read_rows(input_file, file_format)
+                first_row = 1
+                while True:
+                    batch = list(islice(rows, options['batch_size']))
+                    if not batch:
+                        break
+
+                    results = create_reviewers(batch, None, options['chunk_size'], hashing)
+                    for result in results:
+                        if result['status'] == 'created':
+                            created += 1
+                        else:
+                            failed += 1
+                            self.stderr.write("Row %d: %s" % (first_row + result['index'],
+                                                             json.dumps(result['errors'])))
+
+                    first_row += len(batch)
+                    if options['verbosity'] > 1:
+                        self.stdout.write("Processed %d rows" % (first_row - 1))
+        except (OSError, csv.Error, UnicodeDecodeError) as exc:
+            raise CommandError(str(exc))
+        finally:
+            hashing.shutdown()
+
+        self.stdout.write("Registered %d reviewers, %d rows failed" % (created, failed))
+
+    @staticmethod
+    def _read_rows(input_file, file_format):
+        """
+        :return: generator of row dictionaries; an unparseable NDJSON line
+            is passed on as is, and reported as invalid
+        """
+        if file_format == 'csv':
+            yield from csv_rows(input_file)
+            return
+
+        for line in input_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
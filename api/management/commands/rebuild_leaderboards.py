@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import leaderboard
+
+
+class Command(BaseCommand):
+    """
+    Recompute the company leaderboards from the rating totals.
+
+    The leaderboards are not updated as reviews are written, so run this
+    on a schedule, e.g. every few minutes from cron; the ranks served by
+    the API are as old as the last run. Each board is replaced in its own
+    transaction.
+    """
+    help = "Recompute the company leaderboards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('boards', nargs='*',
+                            help="Boards to rebuild, default all of %s" % ', '.join(leaderboard.BOARDS))
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per INSERT")
+
+    def handle(self, *args, **options):
+        boards = options['boards'] or leaderboard.BOARDS
+        for board in boards:
+            if board not in leaderboard.BOARDS:
+                raise CommandError("%s is not one of %s" % (board, ', '.join(leaderboard.BOARDS)))
+
+        for board in boards:
+            count = leaderboard.rebuild(board, options['batch_size'])
+            self.stdout.write("Ranked %d companies on %s" % (count, board))
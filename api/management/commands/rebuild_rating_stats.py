@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.conditional import bump_company_versions
+from api.models import Company, CompanyRatingStats
+from api.stats import aggregate_rating_stats
+
+
+class Command(BaseCommand):
+    """
+    Recompute CompanyRatingStats from the Review table.
+
+    Companies are processed in pk order, a chunk at a time, so memory use
+    is bounded by the chunk size no matter how many reviews there are.
+    Each chunk is replaced in its own transaction.
+    """
+    help = "Recompute the per-company rating totals from the reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of companies to recompute per transaction")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_pk = 0
+        companies = 0
+
+        while True:
+            company_ids = list(Company.objects
+                               .filter(pk__gt=last_pk)
+                               .order_by('pk')
+                               .values_list('pk', flat=True)[:chunk_size])
+            if not company_ids:
+                break
+
+            with transaction.atomic():
+                CompanyRatingStats.objects.filter(company_id__in=company_ids).delete()
+                CompanyRatingStats.objects.bulk_create(aggregate_rating_stats(company_ids))
+                bump_company_versions(*company_ids)
+
+            companies += len(company_ids)
+            last_pk = company_ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write("Rebuilt rating totals for %d companies" % companies)
+
+        self.stdout.write("Rebuilt rating totals for %d companies" % companies)
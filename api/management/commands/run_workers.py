@@ -0,0 +1,86 @@
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, OutputWrapper
+from django.db import connections
+
+
+def _run_worker(stop, batch_size, verbose):
+    # needed when workers are spawned rather than forked
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+    import django
+    django.setup()
+    from api import jobs
+
+    # Ctrl-C reaches the whole process group, let the parent stop the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # as the command's self.stderr, which can not be passed to a spawned process
+    log = OutputWrapper(sys.stderr).write if verbose else None
+    jobs.work(stop, batch_size, log=log)
+
+
+class Command(BaseCommand):
+    """
+    Run the background jobs queued by the API, see api.jobs.
+
+    Starts --processes worker processes, which claim and run batches of
+    due jobs and check an empty queue every JOB_POLL_INTERVAL seconds.
+    A worker that dies is replaced; the jobs it held are run again once
+    their lease expires. On SIGINT or SIGTERM the workers finish their
+    current batch and exit.
+
+    With --once the due jobs are run in this process, e.g. from cron,
+    and the command exits.
+    """
+    help = "Run the queued background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=settings.JOB_WORKERS,
+                            help="Number of worker processes")
+        parser.add_argument('--batch-size', type=int, default=settings.JOB_BATCH_SIZE,
+                            help="Jobs of the same kind run together")
+        parser.add_argument('--once', action='store_true',
+                            help="Run the due jobs in this process and exit")
+
+    def handle(self, *args, **options):
+        from api import jobs
+
+        if options['once']:
+            done, failed = jobs.run_pending(options['batch_size'])
+            self.stdout.write("%d jobs done, %d failed" % (done, failed))
+            return
+
+        # forked workers must not share this process's connections
+        connections.close_all()
+        stop = multiprocessing.Event()
+        self.stopping = False
+
+        def request_stop(signum, frame):
+            self.stopping = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+
+        workers = [None] * options['processes']
+        try:
+            while not self.stopping:
+                for i, worker in enumerate(workers):
+                    if worker is not None and worker.is_alive():
+                        continue
+                    if worker is not None:
+                        self.stderr.write("Worker %d exited with %s, restarting" % (i, worker.exitcode))
+                    workers[i] = multiprocessing.Process(
+                        target=_run_worker, name='jobs-%d' % i,
+                        args=(stop, options['batch_size'], options['verbosity'] > 1))
+                    workers[i].start()
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+        stop.set()
+        for worker in workers:
+            worker.join()
+        self.stdout.write("Stopped %d workers" % len(workers))
@@ -0,0 +1,48 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """
+    Copy the SQLite primary database over the SQLite replica files.
+
+    SQLite has no replication, so for local development each replica in
+    DATABASE_REPLICAS points at a file of its own, and this command
+    stands in for replication. Replicas lag behind the primary until it
+    is run again, which is what the replica routing has to cope with.
+    """
+    help = "Copy the SQLite primary database to the SQLite replicas"
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*',
+                            help="Replica aliases to copy to, default all of DATABASE_REPLICAS")
+
+    def handle(self, *args, **options):
+        aliases = options['replicas'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError("There are no DATABASE_REPLICAS")
+
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError("%s is not one of the DATABASE_REPLICAS" % alias)
+            replica = connections[alias].settings_dict
+            for name in (DEFAULT_DB_ALIAS, alias):
+                if connections[name].vendor != 'sqlite':
+                    raise CommandError("%s is not an SQLite database" % name)
+            if replica['NAME'] == primary['NAME']:
+                raise CommandError("%s is the primary database file" % alias)
+
+        for alias in aliases:
+            source = sqlite3.connect(primary['NAME'])
+            target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                # a consistent copy, even while the primary is being written
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write("Copied %s to %s" % (primary['NAME'], alias))
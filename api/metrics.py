@@ -0,0 +1,228 @@
+"""
+In-process per-endpoint request metrics.
+
+EndpointStatsMiddleware records, for every request, the route name, the
+number of SQL queries and the time spent in them, the time spent
+serializing objects (see SerializeTimerMixin), the time spent rendering
+the serialized data, the total time and the response size. The values
+go into fixed-bucket histograms, so recording is a bisect and a few
+additions under a lock.
+
+Each process publishes a snapshot of its histograms to Django's cache
+every ENDPOINT_STATS_PUBLISH_INTERVAL seconds. The admin endpoint and
+the dump_endpoint_stats command merge the published snapshots, which
+needs a cache shared between processes (memcached, redis, database...).
+"""
+import bisect
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _bucket_bounds(smallest, largest):
+    """
+    Bucket upper bounds in a 1-2-5 series, e.g. 0.1, 0.2, 0.5, 1, 2, 5 ...
+    """
+    bounds = []
+    decade = smallest
+    while decade <= largest:
+        bounds.extend(decade * step for step in (1, 2, 5))
+        decade *= 10
+    return bounds
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with percentile estimates
+    """
+    def __init__(self, bounds, counts=None, total=0, minimum=None, maximum=None):
+        self.bounds = bounds
+        # the last bucket holds everything above the largest bound
+        self.counts = counts or [0] * (len(bounds) + 1)
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def percentile(self, fraction):
+        """
+        The upper bound of the bucket holding the given fraction of observations
+        """
+        count = self.count
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.maximum
+        return self.maximum  # pragma: no cover
+
+    def to_dict(self):
+        count = self.count
+        return {
+            'count': count,
+            'mean': self.total / count if count else None,
+            'min': self.minimum,
+            'max': self.maximum,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+        }
+
+    def to_state(self):
+        return [self.counts, self.total, self.minimum, self.maximum]
+
+    @classmethod
+    def from_state(cls, bounds, state):
+        counts, total, minimum, maximum = state
+        return cls(bounds, list(counts), total, minimum, maximum)
+
+
+# metric name -> bucket bounds
+METRICS = {
+    'total_ms': _bucket_bounds(0.1, 10000),
+    'sql_ms': _bucket_bounds(0.1, 10000),
+    'serialize_ms': _bucket_bounds(0.1, 10000),
+    'render_ms': _bucket_bounds(0.1, 10000),
+    'queries': [0] + _bucket_bounds(1, 1000),
+    'response_bytes': _bucket_bounds(100, 10 ** 8),
+}
+
+
+def add_serialize_time(request, seconds):
+    """
+    :param request: Django or DRF request object, or None
+    :param seconds: time spent serializing for it
+    """
+    request = getattr(request, '_request', request)
+    if request is not None:
+        total = getattr(request, '_endpoint_stats_serialize', 0.0)
+        request._endpoint_stats_serialize = total + seconds
+
+
+class SerializeTimerMixin:
+    """
+    Serializer mixin that adds the time taken by to_representation to the
+    request's serialize_ms. Nested serializers are counted in their parent's time
+    """
+    def to_representation(self, instance):
+        root = self.root
+        if root is not self and root is not self.parent:
+            return super().to_representation(instance)
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            add_serialize_time(self.context.get('request'), time.perf_counter() - start)
+
+
+class EndpointStats:
+    """
+    Histograms of the request metrics, per route name
+    """
+    registry_key = 'api:endpoint-stats:processes'
+
+    def __init__(self, publish_interval):
+        self.publish_interval = publish_interval
+        self.process_key = 'api:endpoint-stats:%s:%s' % (socket.gethostname(), os.getpid())
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._next_publish = time.monotonic() + publish_interval
+
+    def record(self, route, **values):
+        """
+        Record one request
+        :param route: route name, e.g. review-list
+        :param values: metric name -> value, for the names in METRICS
+        """
+        with self._lock:
+            histograms = self._routes.get(route)
+            if histograms is None:
+                histograms = self._routes[route] = {
+                    name: Histogram(bounds) for name, bounds in METRICS.items()}
+            for name, value in values.items():
+                histograms[name].observe(value)
+
+            publish = time.monotonic() >= self._next_publish
+            if publish:
+                self._next_publish = time.monotonic() + self.publish_interval
+
+        if publish:
+            self.publish()
+
+    def snapshot(self):
+        """
+        :return: {route: {metric: histogram state}} for this process
+        """
+        with self._lock:
+            return {route: {name: h.to_state() for name, h in histograms.items()}
+                    for route, histograms in self._routes.items()}
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+    def publish(self):
+        """
+        Store this process's snapshot in the shared cache
+        """
+        timeout = max(self.publish_interval * 10, 300)
+        cache.set(self.process_key, self.snapshot(), timeout)
+
+        processes = set(cache.get(self.registry_key) or ())
+        if self.process_key not in processes:
+            processes.add(self.process_key)
+            cache.set(self.registry_key, processes, None)
+
+    def report(self, include_published=True):
+        """
+        Summaries per route, merged over this process and the
+        snapshots other processes published
+        :return: {route: {metric: summary dictionary}}
+        """
+        snapshots = [self.snapshot()]
+        if include_published:
+            processes = set(cache.get(self.registry_key) or ())
+            processes.discard(self.process_key)
+            published = cache.get_many(list(processes))
+            snapshots.extend(published.values())
+
+        merged = {}
+        for snapshot in snapshots:
+            for route, states in snapshot.items():
+                histograms = merged.setdefault(route, {
+                    name: Histogram(bounds) for name, bounds in METRICS.items()})
+                for name, state in states.items():
+                    if name in histograms:
+                        histograms[name].merge(Histogram.from_state(METRICS[name], state))
+
+        return {route: {name: h.to_dict() for name, h in histograms.items()}
+                for route, histograms in sorted(merged.items())}
+
+
+endpoint_stats = EndpointStats(publish_interval=settings.ENDPOINT_STATS_PUBLISH_INTERVAL)
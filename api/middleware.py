@@ -0,0 +1,134 @@
+import contextvars
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from api import replicas
+from api.metrics import endpoint_stats
+
+
+class QueryTimer:
+    """
+    Database execute wrapper that counts queries and adds up their time
+    """
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+class EndpointStatsMiddleware:
+    """
+    Record query count, SQL time, serialize time, render time, total time and
+    response size of every request in api.metrics.endpoint_stats, keyed by route name.
+    Render time is that of the renderer only, serializing objects is serialize time.
+
+    Only the request/response cycle is measured: queries run while a
+    streaming response is iterated are not counted. A long poll is
+    recorded once, its re-checks are not (see api.longpoll).
+    Disable with ENDPOINT_STATS_ENABLED = false.
+    """
+    def __init__(self, get_response):
+        if not settings.ENDPOINT_STATS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if getattr(request, 'long_poll_retry', False):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        request._endpoint_stats_render = 0.0
+        request._endpoint_stats_serialize = 0.0
+        start = time.perf_counter()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        route = (match.view_name if match else None) or 'unmatched'
+        if response.streaming:
+            response_bytes = int(response.get('Content-Length') or 0)
+        else:
+            response_bytes = len(response.content)
+
+        endpoint_stats.record(
+            route,
+            total_ms=total * 1000,
+            sql_ms=timer.seconds * 1000,
+            serialize_ms=request._endpoint_stats_serialize * 1000,
+            render_ms=request._endpoint_stats_render * 1000,
+            queries=timer.queries,
+            response_bytes=response_bytes,
+        )
+        return response
+
+    def process_template_response(self, request, response):
+        """
+        DRF responses are rendered after this hook returns,
+        so time from here to the post-render callback
+        """
+        start = time.perf_counter()
+
+        def rendered(response):
+            request._endpoint_stats_render = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def _iterate_in_context(context, iterator):
+    """
+    Run each step of an iterator in the given context
+    """
+    while True:
+        try:
+            yield context.run(next, iterator)
+        except StopIteration:
+            return
+
+
+class ReplicaReadMiddleware:
+    """
+    Read from the replicas for GET and HEAD requests, unless the client
+    made a write request in the last DATABASE_REPLICA_PIN_SECONDS,
+    see api.replicas. Not used when there are no DATABASE_REPLICAS.
+    """
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in SAFE_METHODS:
+            try:
+                return self.get_response(request)
+            finally:
+                replicas.pin_to_primary(request)
+
+        if replicas.is_pinned_to_primary(request):
+            return self.get_response(request)
+
+        with replicas.replica_reads():
+            response = self.get_response(request)
+            context = contextvars.copy_context()
+        if response.streaming:
+            # streamed after this returns, keep reading from the replicas
+            response.streaming_content = _iterate_in_context(
+                context, iter(response.streaming_content))
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def set_last_modified(apps, schema_editor):
+    Review = apps.get_model('api', 'Review')
+    Review.objects.update(last_modified=models.F('submission_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_company_rating_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='last_modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reviewer',
+            name='data_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='reviewer',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(set_last_modified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.1 on 2026-10-18 20:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_company_daily_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompanyRank',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('top-rated', 'Top rated'), ('most-reviewed', 'Most reviewed recently')], max_length=16)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('review_count', models.PositiveIntegerField()),
+                ('refreshed', models.DateTimeField()),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='api.Company')),
+            ],
+            options={
+                'unique_together': {('board', 'company'), ('board', 'rank')},
+            },
+        ),
+    ]
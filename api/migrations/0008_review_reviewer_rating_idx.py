@@ -0,0 +1,17 @@
+# Generated by Django 2.2.1 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_company_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewer', 'rating', 'id'], name='review_reviewer_rating_idx'),
+        ),
+    ]
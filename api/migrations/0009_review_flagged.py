@@ -0,0 +1,18 @@
+# Generated by Django 2.2.1 on 2026-10-18 20:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_review_reviewer_rating_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='flagged',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 2.2.1 on 2026-10-18 21:15
+
+from django.db import migrations
+
+from api.stats import TOTAL_FIELDS, aggregate_rating_stats
+
+
+CHUNK_SIZE = 1000
+
+
+def backfill_rating_stats(apps, schema_editor):
+    """
+    Count the reviews written before the totals were kept, or outside the API
+    """
+    Company = apps.get_model('api', 'Company')
+    CompanyRatingStats = apps.get_model('api', 'CompanyRatingStats')
+    company_ids = list(Company.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(company_ids), CHUNK_SIZE):
+        chunk = company_ids[start:start + CHUNK_SIZE]
+        CompanyRatingStats.objects.filter(company_id__in=chunk).delete()
+        CompanyRatingStats.objects.bulk_create(
+            CompanyRatingStats(company_id=row.company_id,
+                               **{field: getattr(row, field) for field in TOTAL_FIELDS})
+            for row in aggregate_rating_stats(chunk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rating_stats, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models import F
+from django.utils import timezone
 
 
 class Company(models.Model):
@@ -10,9 +12,35 @@ class Company(models.Model):
     name = models.CharField(max_length=64)
     website = models.URLField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # company list pagination
+            models.Index(fields=['name', 'id'], name='company_name_id_idx'),
+        ]
+
     def __str__(self):  # pragma: no cover
         return self.name
 
+    @property
+    def ratings(self):
+        """
+        The company's rating totals, or empty totals if it has no reviews yet
+        """
+        try:
+            return self.rating_stats
+        except CompanyRatingStats.DoesNotExist:
+            return CompanyRatingStats(company=self)
+
+
+class ReviewerQuerySet(models.QuerySet):
+    def bump_version(self):
+        """
+        Mark the reviewers' data as changed, see api.conditional
+        :return: number of rows updated
+        """
+        return self.update(data_version=F('data_version') + 1,
+                           data_modified=timezone.now())
+
 
 class Reviewer(models.Model):
     """
@@ -22,6 +50,12 @@ class Reviewer(models.Model):
     bio = models.TextField(blank=True)
     website = models.URLField(null=True, blank=True)
 
+    # bumped on every write to the reviewer or their reviews
+    data_version = models.PositiveIntegerField(default=0, editable=False)
+    data_modified = models.DateTimeField(default=timezone.now, editable=False)
+
+    objects = ReviewerQuerySet.as_manager()
+
     def __str__(self):  # pragma: no cover
         return self.user.username
 
@@ -36,8 +70,136 @@ class Review(models.Model):
     summary = models.CharField(max_length=10000)
     ip_address = models.GenericIPAddressField()
     submission_date = models.DateTimeField(auto_now_add=True)
+    last_modified = models.DateTimeField(auto_now=True)
     company = models.ForeignKey(Company, on_delete=models.PROTECT)
     reviewer = models.ForeignKey(Reviewer, on_delete=models.CASCADE)
+    # near-duplicate of a recent review, see api.duplicates
+    flagged = models.BooleanField(default=False, editable=False)
+
+    class Meta:
+        indexes = [
+            # a reviewer's own reviews, in pagination order
+            models.Index(fields=['reviewer', 'submission_date', 'id'],
+                         name='review_reviewer_date_idx'),
+            models.Index(fields=['reviewer', 'rating', 'id'],
+                         name='review_reviewer_rating_idx'),
+            # a company's reviews by date, and grouped by rating
+            models.Index(fields=['company', 'submission_date'],
+                         name='review_company_date_idx'),
+            models.Index(fields=['company', 'rating'],
+                         name='review_company_rating_idx'),
+        ]
 
     def __str__(self):  # pragma: no cover
         return self.title
+
+
+class RatingTotals(models.Model):
+    """
+    Review count, rating sum and rating histogram of a set of reviews
+    """
+    RATINGS = range(1, 6)
+
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return self.rating_sum / self.review_count
+
+    @property
+    def histogram(self):
+        return {str(r): getattr(self, 'rating_%d' % r) for r in self.RATINGS}
+
+
+class CompanyRatingStats(RatingTotals):
+    """
+    Running rating totals for a company.
+    Kept up to date as reviews are written, see api.stats
+    """
+    company = models.OneToOneField(Company, on_delete=models.CASCADE,
+                                   primary_key=True, related_name='rating_stats')
+
+    def __str__(self):  # pragma: no cover
+        return str(self.company)
+
+
+class CompanyDailyRating(RatingTotals):
+    """
+    Rating totals of the reviews submitted to a company on one day (UTC).
+    Kept up to date by background jobs queued as reviews are written, see api.stats
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='daily_ratings')
+    day = models.DateField()
+
+    class Meta:
+        # also the index for a company's trend, see CompanyTrendView
+        unique_together = [('company', 'day')]
+
+    def __str__(self):  # pragma: no cover
+        return '%s %s' % (self.company, self.day)
+
+
+class CompanyRank(models.Model):
+    """
+    Position of a company on a leaderboard.
+    Recomputed for a whole board at once, see api.leaderboard
+    """
+    TOP_RATED = 'top-rated'
+    MOST_REVIEWED = 'most-reviewed'
+    BOARDS = (
+        (TOP_RATED, "Top rated"),
+        (MOST_REVIEWED, "Most reviewed recently"),
+    )
+
+    board = models.CharField(max_length=16, choices=BOARDS)
+    rank = models.PositiveIntegerField()
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='ranks')
+    score = models.FloatField()
+    review_count = models.PositiveIntegerField()
+    refreshed = models.DateTimeField()
+
+    class Meta:
+        # the top N of a board, and the rank of a company
+        unique_together = [('board', 'rank'), ('board', 'company')]
+
+    def __str__(self):  # pragma: no cover
+        return '%s #%d %s' % (self.board, self.rank, self.company)
+
+
+class Job(models.Model):
+    """
+    Work left for the background workers after a write, see api.jobs
+    """
+    kind = models.CharField(max_length=50)
+    # JSON
+    payload = models.TextField()
+    created = models.DateTimeField(default=timezone.now)
+    # not run before this time, pushed back after each failed attempt
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # set once the job ran out of attempts, it is then kept for inspection
+    failed = models.BooleanField(default=False)
+    # the worker running the job, until locked_until
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the due jobs, oldest first
+            models.Index(fields=['failed', 'run_at', 'id'], name='job_due_idx'),
+        ]
+
+    def __str__(self):  # pragma: no cover
+        return '%s #%s' % (self.kind, self.pk)
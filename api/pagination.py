@@ -0,0 +1,301 @@
+import json
+import operator
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict, namedtuple
+from functools import reduce
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound, ValidationError as InvalidParameter
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+Cursor = namedtuple('Cursor', ['position', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque-cursor keyset ("seek") pagination.
+
+    The cursor holds the ordering values of the last (or first) row
+    of the current page, and the next page is fetched with a
+    WHERE (a, b) > (x, y) style filter instead of an OFFSET, so
+    deep pages cost the same as the first page as long as an index
+    covers the ordering.
+
+    The ordering must end with a unique field (normally `id`) so that
+    every row has a distinct position.
+
+    Subclasses can let clients choose the ordering with ?ordering=<name>
+    from `orderings`. Each of them needs an index that covers it, together
+    with the filters the view applies, see api/tests/test_query_plans.py.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'The pagination cursor value.'
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    page_size_query_description = 'Number of results to return per page.'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+    invalid_cursor_message = 'Invalid cursor'
+    ordering_query_param = 'ordering'
+    ordering_query_description = 'Which field to use when ordering the results.'
+
+    # subclasses set the ordering, e.g. ('submission_date', 'id')
+    ordering = ('id',)
+    # and the orderings clients can choose from, as name -> ordering
+    orderings = {}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Return a single page of results, or `None` if pagination is disabled.
+        :param queryset: filtered queryset
+        :param request: request object
+        :param view: view instance
+        :return: list of model instances
+        """
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [self._get_field(queryset, name) for name in self.ordering]
+
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+
+        queryset = queryset.order_by(*self._order_by(reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(
+                self._seek_filter(self.cursor.position, reverse))
+
+        # fetch one extra row to find out if there is a following page
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the ordering as a tuple of field names,
+        with a leading '-' for descending fields.
+        :raise: ValidationError if ?ordering= is not one of the orderings
+        """
+        name = request.query_params.get(self.ordering_query_param)
+        if name is None or not self.orderings:
+            return tuple(self.ordering)
+        try:
+            return tuple(self.orderings[name])
+        except KeyError:
+            raise InvalidParameter({self.ordering_query_param: [
+                "Expected one of %s" % ', '.join(sorted(self.orderings))]})
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        position = self._get_position_from_instance(self.page[-1])
+        return self.encode_cursor(Cursor(position=position, reverse=False))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # stepped past the end -- go back to the start
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        position = self._get_position_from_instance(self.page[0])
+        return self.encode_cursor(Cursor(position=position, reverse=True))
+
+    def decode_cursor(self, request):
+        """
+        Given a request with a cursor, return a `Cursor` instance.
+        :raise: NotFound if the cursor can not be decoded
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            payload = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            values, reverse = payload['p'], bool(payload['r'])
+            if len(values) != len(self.fields):
+                raise ValueError()
+            position = [field.to_python(value)
+                        for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return Cursor(position=position, reverse=reverse)
+
+    def encode_cursor(self, cursor):
+        """
+        Given a Cursor instance, return an url with encoded cursor.
+        """
+        payload = json.dumps({'p': cursor.position, 'r': int(cursor.reverse)},
+                             separators=(',', ':'))
+        encoded = urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+        fields = [
+            coreapi.Field(
+                name=self.cursor_query_param,
+                required=False,
+                location='query',
+                schema=coreschema.String(
+                    title='Cursor',
+                    description=self.cursor_query_description
+                )
+            )
+        ]
+        if self.orderings:
+            fields.append(
+                coreapi.Field(
+                    name=self.ordering_query_param,
+                    required=False,
+                    location='query',
+                    schema=coreschema.Enum(
+                        list(self.orderings),
+                        title='Ordering',
+                        description=self.ordering_query_description
+                    )
+                )
+            )
+        if self.page_size_query_param is not None:
+            fields.append(
+                coreapi.Field(
+                    name=self.page_size_query_param,
+                    required=False,
+                    location='query',
+                    schema=coreschema.Integer(
+                        title='Page size',
+                        description=self.page_size_query_description
+                    )
+                )
+            )
+        return fields
+
+    def _order_by(self, reverse):
+        """
+        The order_by() arguments, flipped when paging backwards
+        """
+        order_by = []
+        for name in self.ordering:
+            descending = name.startswith('-')
+            if reverse:
+                descending = not descending
+            order_by.append(('-' if descending else '') + name.lstrip('-'))
+        return order_by
+
+    def _seek_filter(self, position, reverse):
+        """
+        Build the row-value comparison as an OR of ANDs, e.g. for (a, b):
+            a > x OR (a = x AND b > y)
+        which every database can answer from a composite index on (a, b).
+        """
+        clauses = []
+        for i, name in enumerate(self.ordering):
+            descending = name.startswith('-')
+            if reverse:
+                descending = not descending
+            lookup = 'lt' if descending else 'gt'
+
+            clause = Q(**{'%s__%s' % (name.lstrip('-'), lookup): position[i]})
+            for prior_name, prior_value in zip(self.ordering[:i], position[:i]):
+                clause &= Q(**{prior_name.lstrip('-'): prior_value})
+            clauses.append(clause)
+
+        return reduce(operator.or_, clauses)
+
+    def _get_position_from_instance(self, instance):
+        return [field.value_to_string(instance) for field in self.fields]
+
+    @staticmethod
+    def _get_field(queryset, name):
+        """
+        The model field, or for an annotation a field of its output type,
+        used to encode and decode cursor values
+        """
+        name = name.lstrip('-')
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            field = annotation.output_field.clone()
+            field.set_attributes_from_name(name)
+            return field
+
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:  # pragma: no cover
+            raise ValueError("Keyset ordering field %s is not a model field" % name)
+
+
+class CompanyPagination(KeysetPagination):
+    """
+    Companies are listed alphabetically
+    """
+    ordering = ('name', 'id')
+    orderings = {
+        'name': ('name', 'id'),
+        '-name': ('-name', '-id'),
+    }
+
+
+class ReviewPagination(KeysetPagination):
+    """
+    Reviews are listed in the order they were submitted,
+    search results (see ReviewSearchFilterBackend) best match first
+    """
+    ordering = ('submission_date', 'id')
+    orderings = {
+        'submission_date': ('submission_date', 'id'),
+        '-submission_date': ('-submission_date', '-id'),
+        'rating': ('rating', 'id'),
+        '-rating': ('-rating', '-id'),
+    }
+    search_ordering = ('-search_rank', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        if 'search_rank' in queryset.query.annotations:
+            return self.search_ordering
+        return super().get_ordering(request, queryset, view)
+
+
+class CompanyReviewPagination(KeysetPagination):
+    """
+    A company's review feed is listed newest first
+    """
+    ordering = ('-submission_date', '-id')
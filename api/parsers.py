@@ -0,0 +1,80 @@
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from api import jsonlib
+from api.renderers import FastJSONRenderer
+
+
+def csv_rows(text_stream):
+    """
+    Read CSV with a header row
+    :param text_stream: file-like object of text
+    :return: generator of dictionaries keyed by the header, without the
+        values missing from short rows or the extra values of long rows
+    """
+    for row in csv.DictReader(text_stream):
+        yield {key: value for key, value in row.items()
+               if key is not None and value is not None}
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes with api.jsonlib
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            body = stream.read()
+            if codecs.lookup(encoding).name != 'utf-8':
+                body = body.decode(encoding)
+            return jsonlib.loads(body)
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % exc)
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON (one JSON document per line)
+    into a list. Blank lines are skipped.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        items = []
+        for line_number, line in enumerate(codecs.getreader(encoding)(stream), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(jsonlib.loads(line))
+            except ValueError as exc:
+                raise ParseError('NDJSON parse error on line %d - %s' % (line_number, exc))
+        return items
+
+
+class CSVParser(BaseParser):
+    """
+    Parses CSV with a header row into a list of dictionaries
+    keyed by the header. Blank lines are skipped.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        try:
+            return list(csv_rows(codecs.getreader(encoding)(stream)))
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError('CSV parse error - %s' % exc)
@@ -0,0 +1,88 @@
+"""
+JSON renderers.
+
+FastJSONRenderer encodes with api.jsonlib, which uses orjson or ujson
+when installed. It is the default renderer, see REST_FRAMEWORK in
+reviews.settings.
+
+CompactJSONRenderer writes column-oriented JSON for the list endpoints.
+With ?format=compact (or Accept: application/vnd.reviews.compact+json)
+a list of objects is sent as one array per field instead:
+
+    {"next": ..., "previous": ..., "results": {"id": [1, 2], "rating": [5, 3]}}
+
+Field names are sent once per page rather than once per row, which
+makes long pages smaller and quicker to encode. Anything that is not a
+list of objects, such as an error, is rendered as plain JSON.
+"""
+from collections import OrderedDict
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from api import jsonlib
+
+
+# U+2028 and U+2029 in UTF-8, escaped by JSONRenderer
+LINE_SEPARATOR = b'\xe2\x80\xa8'
+PARAGRAPH_SEPARATOR = b'\xe2\x80\xa9'
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with api.jsonlib.
+    Indented output, as the browsable API and `Accept: application/json; indent=4`
+    ask for, and ASCII-only or spaced output, as the UNICODE_JSON and COMPACT_JSON
+    settings may ask for, are left to JSONRenderer.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        if (self.ensure_ascii or not self.compact or
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = jsonlib.dumps(data)
+        except (TypeError, OverflowError):
+            # e.g. integers beyond 64 bits, which only the json module encodes
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # keep the output a strict javascript subset, as JSONRenderer does
+        if LINE_SEPARATOR in ret or PARAGRAPH_SEPARATOR in ret:
+            ret = (ret.replace(LINE_SEPARATOR, b'\\u2028')
+                   .replace(PARAGRAPH_SEPARATOR, b'\\u2029'))
+        return ret
+
+
+def to_columns(rows):
+    """
+    :param rows: list of dictionaries with the same keys
+    :return: dictionary of key -> list of values, in row order
+    """
+    if not rows:
+        return OrderedDict()
+    names = list(rows[0])
+    return OrderedDict((name, [row[name] for row in rows]) for name in names)
+
+
+def _is_rows(data):
+    return isinstance(data, list) and all(isinstance(row, dict) for row in data)
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    media_type = 'application/vnd.reviews.compact+json'
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if _is_rows(data):
+            data = to_columns(data)
+        elif isinstance(data, dict) and _is_rows(data.get('results')):
+            data = OrderedDict(data)
+            data['results'] = to_columns(data['results'])
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+# renderers of the list endpoints: the defaults, and compact
+LIST_RENDERER_CLASSES = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (CompactJSONRenderer,)
@@ -0,0 +1,108 @@
+"""
+Read replicas.
+
+Databases listed in DATABASE_REPLICAS serve the reads of GET and HEAD
+requests; everything else, writes, the reads of write requests,
+management commands and anything inside a transaction, uses `default`.
+
+Replicas lag behind the primary, so a client that just wrote would not
+see their own write. After a write request every request with the same
+Authorization header reads from the primary for
+DATABASE_REPLICA_PIN_SECONDS.
+
+ReplicaReadMiddleware decides per request and replica_reads() picks one
+replica for the whole request, so that its queries all see the same
+state of the data. ReplicaRouter follows the decision, which lives in a
+context variable so that it is per thread or per task.
+"""
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# alias of the replica the reads go to, None for the primary
+_replica_reads = contextvars.ContextVar('replica_reads', default=None)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Send the reads made in this block to one random replica, if there are any
+    """
+    alias = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+    token = _replica_reads.set(alias)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Send the reads made in this block to the primary, e.g. for data that is
+    cached until the next write, which a lagging replica may not have yet
+    """
+    token = _replica_reads.set(None)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _pin_key(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if not authorization:
+        return None
+    return 'api:primary-pin:%s' % hashlib.md5(authorization.encode('utf-8')).hexdigest()
+
+
+def pin_to_primary(request):
+    """
+    Read from the primary for the next DATABASE_REPLICA_PIN_SECONDS
+    on behalf of the client that sent this request
+    :param request: a write request
+    """
+    key = _pin_key(request)
+    if key is not None:
+        cache.set(key, 1, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+def is_pinned_to_primary(request):
+    """
+    :param request: request object
+    :return: True if the client wrote recently, see pin_to_primary
+    """
+    key = _pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+class ReplicaRouter:
+    """
+    Routes reads to the replica chosen by replica_reads(),
+    and everything else to the primary
+    """
+    def db_for_read(self, model, **hints):
+        alias = _replica_reads.get()
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        # see the writes made earlier in this transaction
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema by replication
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,152 @@
+"""
+Full-text search over review titles and summaries.
+
+SQLite uses an FTS5 table (api_review_fts) that mirrors api_review
+through triggers. PostgreSQL uses a GIN index on the tsvector of the
+title and summary. Both are created by migration 0005_review_search,
+and checked again after every migrate since SQLite drops the triggers
+whenever a migration rebuilds the api_review table.
+
+search_reviews() filters a Review queryset down to the matches and
+annotates each with a `search_rank`, higher is better, so the results
+can be ordered and keyset paginated by ('-search_rank', 'id').
+
+The FTS5 table also indexes company_id and reviewer_id, so a search
+within one company or reviewer is answered by intersecting posting
+lists instead of reading every match of common words.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+
+FTS_TABLE = 'api_review_fts'
+
+# columns the search words are looked for in
+TEXT_COLUMNS = ('title', 'summary')
+
+# columns that can narrow a search, see search_reviews
+SCOPE_COLUMNS = ('company_id', 'reviewer_id')
+
+# title matches count double, the scope columns not at all
+SQLITE_RANK = '-bm25(api_review_fts, 2.0, 1.0, 0.0, 0.0)'
+
+# the GIN index is on this expression, queries must use it as is
+POSTGRES_DOCUMENT = "to_tsvector('english', api_review.title || ' ' || api_review.summary)"
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_COLUMNS = 'title, summary, company_id, reviewer_id'
+_NEW = 'new.id, new.title, new.summary, new.company_id, new.reviewer_id'
+_OLD = 'old.id, old.title, old.summary, old.company_id, old.reviewer_id'
+
+SQLITE_TRIGGERS = {
+    'api_review_fts_insert':
+        "CREATE TRIGGER IF NOT EXISTS api_review_fts_insert AFTER INSERT ON api_review BEGIN "
+        "INSERT INTO api_review_fts(rowid, {columns}) VALUES ({new}); "
+        "END".format(columns=_COLUMNS, new=_NEW),
+    'api_review_fts_delete':
+        "CREATE TRIGGER IF NOT EXISTS api_review_fts_delete AFTER DELETE ON api_review BEGIN "
+        "INSERT INTO api_review_fts(api_review_fts, rowid, {columns}) VALUES ('delete', {old}); "
+        "END".format(columns=_COLUMNS, old=_OLD),
+    'api_review_fts_update':
+        "CREATE TRIGGER IF NOT EXISTS api_review_fts_update "
+        "AFTER UPDATE OF {columns} ON api_review BEGIN "
+        "INSERT INTO api_review_fts(api_review_fts, rowid, {columns}) VALUES ('delete', {old}); "
+        "INSERT INTO api_review_fts(rowid, {columns}) VALUES ({new}); "
+        "END".format(columns=_COLUMNS, old=_OLD, new=_NEW),
+}
+
+
+def install_search_index(connection):
+    """
+    Create the search index if it is missing.
+    On SQLite the index is rebuilt from api_review when any of the
+    triggers had to be created, since writes made without them are
+    not in the index.
+    :param connection: database connection
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("CREATE INDEX IF NOT EXISTS review_search_idx ON api_review "
+                           "USING GIN (%s)" % POSTGRES_DOCUMENT.replace('api_review.', ''))
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+                           % ', '.join(['%s'] * len(SQLITE_TRIGGERS)), list(SQLITE_TRIGGERS))
+            if len(cursor.fetchall()) == len(SQLITE_TRIGGERS):
+                return
+            # external content table: only the index is stored, the text stays in api_review
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                           "{columns}, content='api_review', content_rowid='id', "
+                           "tokenize='porter unicode61')".format(fts=FTS_TABLE, columns=_COLUMNS))
+            for sql in SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            cursor.execute("INSERT INTO {fts}({fts}) VALUES ('rebuild')".format(fts=FTS_TABLE))
+
+
+def uninstall_search_index(connection):
+    """
+    :param connection: database connection
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("DROP INDEX IF EXISTS review_search_idx")
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute("DROP TRIGGER IF EXISTS %s" % name)
+            cursor.execute("DROP TABLE IF EXISTS %s" % FTS_TABLE)
+
+
+def fts_match_expression(query, scope=None):
+    """
+    Turn user input into an FTS5 MATCH expression that matches rows
+    whose title or summary contain every word. Each word is quoted so
+    that FTS5 operators and punctuation in the input are not interpreted,
+    and limited to the text columns so that a number does not match the
+    scope columns.
+    :param query: search text
+    :param scope: optional dictionary of SCOPE_COLUMNS name -> value to narrow the search to
+    :return: MATCH expression, or None if there are no words to search for
+    """
+    terms = TERM_RE.findall(query)
+    if not terms:
+        return None
+    expression = ['{%s}:"%s"' % (' '.join(TEXT_COLUMNS), term) for term in terms]
+    for column, value in sorted((scope or {}).items()):
+        if column not in SCOPE_COLUMNS:
+            raise ValueError("Can not narrow a search by %s" % column)
+        expression.append('%s:"%d"' % (column, value))
+    return ' '.join(expression)
+
+
+def search_reviews(queryset, query, scope=None):
+    """
+    :param queryset: Review queryset
+    :param query: search text
+    :param scope: optional dictionary of SCOPE_COLUMNS name -> value that the
+        queryset is already filtered on, e.g. {'company_id': 7}, to narrow the index lookup
+    :return: queryset of the matching reviews, annotated with `search_rank`.
+        On SQLite it can not be count()ed or aggregated: bm25() only works
+        in a query that reads the FTS table directly
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        if not TERM_RE.search(query):
+            return queryset.none()
+        tsquery = "plainto_tsquery('english', %s)"
+        return (queryset
+                .extra(where=['%s @@ %s' % (POSTGRES_DOCUMENT, tsquery)], params=[query])
+                .annotate(search_rank=RawSQL('ts_rank(%s, %s)' % (POSTGRES_DOCUMENT, tsquery),
+                                             [query], output_field=FloatField())))
+
+    match = fts_match_expression(query, scope)
+    if match is None:
+        return queryset.none()
+    # join the FTS table so that bm25() is computed by the cursor that found the row
+    return (queryset
+            .extra(tables=[FTS_TABLE],
+                   where=['{fts}.rowid = api_review.id'.format(fts=FTS_TABLE),
+                          '{fts} MATCH %s'.format(fts=FTS_TABLE)],
+                   params=[match])
+            .annotate(search_rank=RawSQL(SQLITE_RANK, [], output_field=FloatField())))
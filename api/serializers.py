@@ -1,7 +1,20 @@
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
+from rest_framework.validators import UniqueValidator
 
-from api.models import Company, Review, Reviewer
+from api import duplicates, stats
+from api.conditional import bump_reviewer_version
+from api.feed import invalidate_company_reviews
+from api.fieldsets import SparseFieldsetSerializerMixin
+from api.hashing import hashing_service
+from api.metrics import SerializeTimerMixin
+from api.fields import (FastHyperlinkedIdentityField, FastHyperlinkedRelatedField,
+                        PrefetchedHyperlinkedRelatedField)
+from api.models import (Company, CompanyDailyRating, CompanyRank, CompanyRatingStats, Review,
+                        Reviewer)
 
 
 IP_ADDRESS_REQUEST_FIELDS = {
@@ -9,39 +22,152 @@ IP_ADDRESS_REQUEST_FIELDS = {
     'direct_api_access': 'REMOTE_ADDR'}
 
 
-class CompanySerializer(serializers.HyperlinkedModelSerializer):
+def get_client_ip(request):
+    """
+    Get the IP address from either of the headers
+    :param request: request object
+    :return: the first X-Forwarded-For address, else the remote address
+    """
+    client_forwarded = IP_ADDRESS_REQUEST_FIELDS['client_forwarded']
+    ip_addresses = request.META.get(client_forwarded, '')
+    ip_address = ip_addresses.split(',')[0]
+
+    if not ip_address:
+        direct_access = IP_ADDRESS_REQUEST_FIELDS['direct_api_access']
+        ip_address = request.META.get(direct_access)
+
+    return ip_address
+
+
+class CompanyRatingStatsSerializer(serializers.ModelSerializer):
+    """
+    Read-only rating totals for a company
+    """
+    average_rating = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = CompanyRatingStats
+        fields = ('review_count', 'average_rating', 'histogram')
+
+
+class CompanyTrendSerializer(SerializeTimerMixin, serializers.ModelSerializer):
+    """
+    Read-only rating totals of a company for one bucket of a trend.
+    `start` is the first day of the bucket
+    """
+    start = serializers.DateField(source='day', read_only=True)
+    average_rating = serializers.FloatField(read_only=True)
+    histogram = serializers.DictField(child=serializers.IntegerField(), read_only=True)
+
+    class Meta:
+        model = CompanyDailyRating
+        fields = ('start', 'review_count', 'average_rating', 'histogram')
+
+
+class CompanyTrendQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of a company trend request
+    """
+    bucket = serializers.ChoiceField(choices=stats.TREND_BUCKETS, default='day')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': "Must not be before start"})
+        return attrs
+
+
+class CompanySerializer(SerializeTimerMixin, SparseFieldsetSerializerMixin,
+                        serializers.HyperlinkedModelSerializer):
+    serializer_related_field = FastHyperlinkedRelatedField
+    serializer_url_field = FastHyperlinkedIdentityField
+
+    # select_related('rating_stats') in the view to avoid a query per company
+    ratings = CompanyRatingStatsSerializer(read_only=True)
+
     class Meta:
         model = Company
         fields = '__all__'
+        # see api.fieldsets
+        fieldset_sources = {'ratings': ('rating_stats',)}
+
+
+class CompanyRankSerializer(SerializeTimerMixin, serializers.ModelSerializer):
+    """
+    Read-only position of a company on a leaderboard
+    """
+    class Meta:
+        model = CompanyRank
+        fields = ('rank', 'score', 'review_count', 'refreshed')
 
 
-class ReviewSerializer(serializers.HyperlinkedModelSerializer):
+class LeaderboardEntrySerializer(CompanyRankSerializer):
+    """
+    Read-only leaderboard entry, with the company
+    """
+    # select_related('company__rating_stats') in the view to avoid queries per rank
+    company = CompanySerializer(read_only=True)
+
+    class Meta(CompanyRankSerializer.Meta):
+        fields = ('rank', 'score', 'review_count', 'company')
+
+
+class LeaderboardQuerySerializer(serializers.Serializer):
+    """
+    Validates the query parameters of a leaderboard request
+    """
+    limit = serializers.IntegerField(min_value=1, default=10)
+
+    def validate_limit(self, value):
+        return min(value, settings.LEADERBOARD_MAX_LIMIT)
+
+
+class ReviewFilterSerializer(serializers.Serializer):
+    """
+    Validates the filter parameters of a review list request
+    """
+    rating_min = serializers.IntegerField(min_value=1, max_value=5, required=False)
+    rating_max = serializers.IntegerField(min_value=1, max_value=5, required=False)
+    company = serializers.IntegerField(min_value=1, required=False)
+    submitted_from = serializers.DateField(required=False)
+    submitted_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        for low, high in (('rating_min', 'rating_max'), ('submitted_from', 'submitted_to')):
+            if low in attrs and high in attrs and attrs[low] > attrs[high]:
+                raise serializers.ValidationError({high: "Must not be less than %s" % low})
+        return attrs
+
+
+class ReviewSerializer(SerializeTimerMixin, SparseFieldsetSerializerMixin,
+                       serializers.HyperlinkedModelSerializer):
     """
     Serializer for user reviews about companies
     """
+    serializer_related_field = FastHyperlinkedRelatedField
+    serializer_url_field = FastHyperlinkedIdentityField
+
     ip_address = serializers.CharField(
         read_only=True
     )
 
-    reviewer = serializers.HyperlinkedRelatedField(
+    reviewer = FastHyperlinkedRelatedField(
         read_only=True,
         view_name='reviewer-detail'
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the new reviews validated, for the duplicate check, see api.duplicates
+        self.submissions = duplicates.Submissions()
+
     def _get_ip_address_from_request(self):
         """
         Get the IP address from either of the headers
         """
-        request = self.context['request']
-        client_forwarded = IP_ADDRESS_REQUEST_FIELDS['client_forwarded']
-        ip_addresses = request.META.get(client_forwarded, '')
-        ip_address = ip_addresses.split(',')[0]
-
-        if not ip_address:
-            direct_access = IP_ADDRESS_REQUEST_FIELDS['direct_api_access']
-            ip_address = request.META.get(direct_access)
-
-        return ip_address
+        return get_client_ip(self.context['request'])
 
     def _get_request_user(self):
         """
@@ -63,10 +189,35 @@ class ReviewSerializer(serializers.HyperlinkedModelSerializer):
 
         return reviewer
 
+    def _check_duplicate(self, validated_data):
+        """
+        Reject or flag a new review that repeats a recent one to the same
+        company from the same IP address or reviewer, see api.duplicates
+        :param validated_data: dictionary, flagged is set in it for a duplicate
+        :raise: ValidationError for a duplicate when DUPLICATE_REVIEW_ACTION is reject
+        """
+        action = settings.DUPLICATE_REVIEW_ACTION
+        # only new reviews, updates are partial or have an instance
+        if action == duplicates.OFF or self.instance is not None or self.partial:
+            return
+
+        sender = (validated_data['company'].pk, validated_data['ip_address'],
+                  validated_data['reviewer'].pk)
+        fingerprint = duplicates.simhash(
+            '%s\n%s' % (validated_data['title'], validated_data['summary']))
+        if self.submissions.is_duplicate(*sender, fingerprint):
+            if action == duplicates.REJECT:
+                raise serializers.ValidationError(
+                    {'non_field_errors': ["This review repeats a recent review of the company"]})
+            validated_data['flagged'] = True
+        # recorded once saved, see create()
+        self.submissions.add(*sender, fingerprint)
+
     def to_internal_value(self, data):
         """
         Manually set the ip_address and reviewer fields.
         They are read-only for the client.
+        New reviews are checked against recent ones for duplicates.
 
         :param data: data dictionary
         :return: dictionary
@@ -75,16 +226,100 @@ class ReviewSerializer(serializers.HyperlinkedModelSerializer):
         ret = super().to_internal_value(data)
         ret['ip_address'] = self._get_ip_address_from_request()
         ret['reviewer'] = self._get_request_user()
+        self._check_duplicate(ret)
         return ret
 
+    def create(self, validated_data):
+        """
+        Create the review and add it to the company rating totals
+        :param validated_data:
+        :return: Review object
+        """
+        with transaction.atomic():
+            instance = super().create(validated_data)
+            stats.apply_rating_changes([(None, stats.rating_key(instance))])
+            bump_reviewer_version(instance.reviewer_id)
+            invalidate_company_reviews(instance.company_id)
+            transaction.on_commit(self.submissions.record)
+        return instance
+
+    def _lock(self, instance):
+        """
+        Read the review again, locking its row until the end of the transaction,
+        so that concurrent writes move its rating from where the other left it
+        :param instance: Review object
+        :return: Review object, None if it was deleted meanwhile
+        """
+        return Review.objects.select_for_update().filter(pk=instance.pk).first()
+
+    def update(self, instance, validated_data):
+        """
+        Update the review and move its rating in the company rating totals
+        :param instance: Review object
+        :param validated_data:
+        :return: Review object
+        :raise: NotFound if the review was deleted meanwhile
+        """
+        with transaction.atomic():
+            instance = self._lock(instance)
+            if instance is None:
+                raise NotFound()
+            old_key = stats.rating_key(instance)
+            instance = super().update(instance, validated_data)
+            stats.apply_rating_changes([(old_key, stats.rating_key(instance))])
+            bump_reviewer_version(instance.reviewer_id)
+            invalidate_company_reviews(old_key[0], instance.company_id)
+        return instance
+
+    def delete(self, instance):
+        """
+        Delete the review and remove it from the company rating totals
+        :param instance: Review object
+        """
+        with transaction.atomic():
+            instance = self._lock(instance)
+            if instance is None:
+                # deleted meanwhile, and taken out of the totals then
+                return
+            old_key = stats.rating_key(instance)
+            instance.delete()
+            stats.apply_rating_changes([(old_key, None)])
+            bump_reviewer_version(instance.reviewer_id)
+            invalidate_company_reviews(old_key[0])
+
     class Meta:
         model = Review
-        fields = '__all__'
+        # flagged is for moderators only
+        exclude = ('flagged',)
 
 
-class ReviewerSerializer(serializers.HyperlinkedModelSerializer):
+class CompanyReviewSerializer(SerializeTimerMixin, SparseFieldsetSerializerMixin,
+                              serializers.ModelSerializer):
+    """
+    Public, read-only view of a review in a company's review feed.
+    Leaves out the reviewer and their ip address
+    """
+    class Meta:
+        model = Review
+        fields = ('id', 'rating', 'title', 'summary', 'submission_date', 'last_modified')
+        read_only_fields = fields
+
+
+class BulkReviewSerializer(ReviewSerializer):
+    """
+    Validates one review of a bulk upload.
+    Companies are looked up in context['companies'], see api.bulk
+    """
+    company = PrefetchedHyperlinkedRelatedField(
+        context_key='companies',
+        view_name='company-detail',
+        queryset=Company.objects.all()
+    )
 
-    url = serializers.HyperlinkedIdentityField(
+
+class ReviewerSerializer(SerializeTimerMixin, serializers.HyperlinkedModelSerializer):
+
+    url = FastHyperlinkedIdentityField(
         view_name='reviewer-detail',
         read_only=True
     )
@@ -113,11 +348,11 @@ class ReviewerSerializer(serializers.HyperlinkedModelSerializer):
         """
         reviewer_data = validated_data.pop('reviewer', {})
         password = validated_data.pop('password', '')
+        if password:
+            # hashed in the hashing pool, see api.hashing
+            validated_data['password'] = hashing_service.make_password(password)
 
         instance = super().create(validated_data)
-        if password:
-            instance.set_password(password)
-            instance.save()
 
         # create reviewer data, even if just empty
         reviewer_data['user'] = instance
@@ -133,18 +368,22 @@ class ReviewerSerializer(serializers.HyperlinkedModelSerializer):
         """
         reviewer_data = validated_data.pop('reviewer', {})
         password = validated_data.pop('password', '')
+        if password:
+            validated_data['password'] = hashing_service.make_password(password)
 
         instance = super().update(instance, validated_data)
 
-        if password:
-            instance.set_password(password)
-            instance.save()
-
         if reviewer_data:
             reviewer = instance.reviewer
             for attr, value in reviewer_data.items():
                 setattr(reviewer, attr, value)
-            reviewer.save()
+            # leave data_version to bump_version
+            reviewer.save(update_fields=list(reviewer_data))
+
+        try:
+            bump_reviewer_version(instance.reviewer.pk)
+        except Reviewer.DoesNotExist:
+            pass
 
         return instance
 
@@ -153,3 +392,16 @@ class ReviewerSerializer(serializers.HyperlinkedModelSerializer):
         fields = ('url', 'username', 'first_name', 'last_name',
                   'email', 'date_joined', 'password',
                   'bio', 'website')
+
+
+class BulkReviewerSerializer(ReviewerSerializer):
+    """
+    Validates one reviewer of a bulk registration.
+    Usernames are checked for the whole batch at once, see api.bulk
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        username = fields['username']
+        username.validators = [validator for validator in username.validators
+                               if not isinstance(validator, UniqueValidator)]
+        return fields
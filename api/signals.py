@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import token_cache
+from api.conditional import bump_company_versions
+from api.models import Company, CompanyRatingStats, Reviewer
+from api.search import install_search_index
+
+
+SEARCH_MIGRATION = ('api', '0005_review_search')
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop the cached tokens of a user
+    :param user_id: user pk
+    """
+    keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+    if keys:
+        token_cache.invalidate(*keys)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Deactivation and password changes must take effect on the next request.
+    Login only touches last_login, which the API does not use.
+    """
+    if created or update_fields == frozenset(['last_login']):
+        return
+    invalidate_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Reviewer)
+def reviewer_saved(sender, instance, created, **kwargs):
+    # the cached token holds the user's reviewer as well
+    invalidate_user_tokens(instance.user_id)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def company_changed(sender, instance, **kwargs):
+    bump_company_versions(instance.pk)
+
+
+@receiver(post_save, sender=CompanyRatingStats)
+@receiver(post_delete, sender=CompanyRatingStats)
+def company_rating_stats_changed(sender, instance, **kwargs):
+    # edited in the admin; the API updates them in place, see api.stats
+    bump_company_versions(instance.company_id)
+
+
+@receiver(post_migrate)
+def ensure_search_index(sender, using, **kwargs):
+    """
+    SQLite drops the search triggers when a migration rebuilds api_review
+    """
+    if sender.name != 'api':
+        return
+    connection = connections[using]
+    if SEARCH_MIGRATION in MigrationRecorder(connection).applied_migrations():
+        install_search_index(connection)
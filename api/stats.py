@@ -0,0 +1,210 @@
+"""
+Incremental maintenance of the per-company rating totals,
+overall (CompanyRatingStats) and per day (CompanyDailyRating).
+
+Review writes are described as (old, new) pairs of (company_id, rating, day)
+tuples, where old is None for a new review and new is None for a deleted
+one. The pairs are folded into per-company and per-company-day deltas and
+applied with F() expressions, so concurrent writers never overwrite each other.
+
+The overall totals are served with every company, so they are updated in
+the write's transaction. The daily totals only feed the trends and the
+leaderboards: their deltas are queued as daily-ratings jobs (see api.jobs),
+and a worker adds up the deltas of a whole batch of writes before applying
+them, in one UPDATE per company and day. The run_workers command has to
+be running for the daily totals to change at all.
+
+Deltas that would take totals below zero, from reviews that were never
+counted, raise IntegrityError: the write, or the job, fails visibly
+rather than the totals drifting.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from api import jobs
+from api.conditional import bump_company_versions
+from api.models import Company, CompanyDailyRating, CompanyRatingStats, Review
+
+
+TOTAL_FIELDS = ['review_count', 'rating_sum'] + ['rating_%d' % r for r in CompanyDailyRating.RATINGS]
+
+# weeks start on Monday
+TREND_BUCKETS = ('day', 'week', 'month')
+
+DAILY_RATINGS_JOB = 'daily-ratings'
+
+
+def rating_key(review):
+    """
+    The part of a review that the rating totals depend on
+    :param review: saved Review object
+    :return: (company_id, rating, day) tuple
+    """
+    return review.company_id, review.rating, timezone.localdate(review.submission_date)
+
+
+def _collect_deltas(changes, group):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for old, new in changes:
+        if old == new:
+            continue
+        for key, sign in ((old, -1), (new, 1)):
+            if key is None:
+                continue
+            rating = key[1]
+            group_deltas = deltas[group(key)]
+            group_deltas['review_count'] += sign
+            group_deltas['rating_sum'] += sign * rating
+            group_deltas['rating_%d' % rating] += sign
+
+    return {name: {field: delta for field, delta in fields.items() if delta}
+            for name, fields in deltas.items()}
+
+
+def collect_rating_deltas(changes):
+    """
+    Fold review changes into per-company field deltas.
+    :param changes: iterable of (old, new) rating keys, either may be None
+    :return: dict of company_id -> {field name: delta}
+    """
+    return _collect_deltas(changes, lambda key: key[0])
+
+
+def collect_daily_deltas(changes):
+    """
+    Fold review changes into per-company-day field deltas.
+    :param changes: iterable of (old, new) rating keys, either may be None
+    :return: dict of (company_id, day) -> {field name: delta}
+    """
+    return _collect_deltas(changes, lambda key: (key[0], key[2]))
+
+
+def apply_rating_changes(changes):
+    """
+    Apply review changes to the CompanyRatingStats table,
+    and queue them for the CompanyDailyRating table.
+    Call inside the transaction that writes the reviews.
+    :param changes: iterable of (old, new) rating keys, either may be None
+    """
+    changes = list(changes)
+    deltas = {company_id: fields for company_id, fields in collect_rating_deltas(changes).items()
+              if fields}
+    for company_id, fields in deltas.items():
+        _apply_deltas(CompanyRatingStats, {'company_id': company_id}, fields)
+    if deltas:
+        bump_company_versions(*deltas)
+
+    daily = [[company_id, day.isoformat(), fields]
+             for (company_id, day), fields in collect_daily_deltas(changes).items() if fields]
+    if daily:
+        jobs.enqueue(DAILY_RATINGS_JOB, daily)
+
+
+def apply_daily_rating_jobs(payloads):
+    """
+    Handler of the daily-ratings jobs: add up their deltas and apply them
+    to the CompanyDailyRating table
+    :param payloads: list of lists of [company_id, ISO day, {field name: delta}]
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for payload in payloads:
+        for company_id, day, fields in payload:
+            for field, delta in fields.items():
+                deltas[company_id, day][field] += delta
+
+    # the company may have been deleted since
+    company_ids = set(Company.objects
+                      .filter(pk__in={company_id for company_id, _ in deltas})
+                      .values_list('pk', flat=True))
+    for (company_id, day), fields in sorted(deltas.items()):
+        fields = {field: delta for field, delta in fields.items() if delta}
+        if fields and company_id in company_ids:
+            _apply_deltas(CompanyDailyRating, {'company_id': company_id, 'day': day}, fields)
+
+
+def _apply_deltas(model, lookup, fields):
+    updates = {field: F(field) + delta for field, delta in fields.items()}
+    rows = model.objects.filter(**lookup)
+    if rows.update(**updates):
+        return
+
+    if any(delta < 0 for delta in fields.values()):
+        # removes reviews that were never counted, e.g. written before the
+        # totals existed: rebuild them, see the rebuild_rating_stats and
+        # backfill_daily_ratings commands
+        raise IntegrityError("No %s row for %s to take reviews out of"
+                             % (model._meta.object_name, lookup))
+
+    # first review for this company (or day) -- create the row,
+    # unless a concurrent writer beat us to it
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **fields)
+    except IntegrityError:
+        if not rows.update(**updates):
+            raise
+
+
+def aggregate_rating_stats(company_ids):
+    """
+    Compute the rating totals for the given companies from the Review table
+    :param company_ids: list of company ids
+    :return: list of unsaved CompanyRatingStats objects, one per company with reviews
+    """
+    histogram = {'rating_%d' % r: Count('id', filter=Q(rating=r))
+                 for r in CompanyRatingStats.RATINGS}
+    rows = (Review.objects
+            .filter(company_id__in=company_ids)
+            .order_by()
+            .values('company_id')
+            .annotate(review_count=Count('id'), rating_sum=Sum('rating'), **histogram))
+    return [CompanyRatingStats(**row) for row in rows]
+
+
+def aggregate_daily_ratings(company_ids):
+    """
+    Compute the daily rating totals for the given companies from the Review table
+    :param company_ids: list of company ids
+    :return: iterator of unsaved CompanyDailyRating objects, one per company and day with reviews
+    """
+    histogram = {'rating_%d' % r: Count('id', filter=Q(rating=r))
+                 for r in CompanyDailyRating.RATINGS}
+    rows = (Review.objects
+            .filter(company_id__in=company_ids)
+            .annotate(day=TruncDate('submission_date'))
+            .order_by()
+            .values('company_id', 'day')
+            .annotate(review_count=Count('id'), rating_sum=Sum('rating'), **histogram))
+    return (CompanyDailyRating(**row) for row in rows.iterator())
+
+
+def company_trend(company_id, bucket, start=None, end=None):
+    """
+    Rating totals of a company per bucket, from the daily totals only
+    :param company_id: company pk
+    :param bucket: one of TREND_BUCKETS
+    :param start: optional first day to include
+    :param end: optional last day to include
+    :return: list of unsaved CompanyDailyRating objects, oldest first,
+        with `day` set to the first day of each bucket that has reviews
+    """
+    rows = CompanyDailyRating.objects.filter(company_id=company_id)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+
+    if bucket == 'day':
+        return list(rows.order_by('day'))
+
+    rows = (rows
+            .annotate(bucket=Trunc('day', bucket, output_field=DateField()))
+            .values('bucket')
+            .annotate(**{field: Sum(field) for field in TOTAL_FIELDS})
+            .order_by('bucket'))
+    return [CompanyDailyRating(company_id=company_id, day=row.pop('bucket'), **row)
+            for row in rows]
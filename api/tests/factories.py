@@ -4,6 +4,7 @@ import pytz
 
 from django.contrib.auth.models import User
 
+from api import stats
 from api.models import Company, Review, Reviewer
 
 
@@ -49,3 +50,9 @@ class ReviewFactory(factory.django.DjangoModelFactory):
     ip_address = '127.0.0.1'
     company = factory.SubFactory(CompanyFactory)
     reviewer = factory.SubFactory(ReviewerFactory)
+
+    @factory.post_generation
+    def rating_totals(obj, create, extracted, **kwargs):
+        # counted as if written through the API
+        if create:
+            stats.apply_rating_changes([(None, stats.rating_key(obj))])
@@ -1,13 +1,19 @@
 """
 Tests on the API calls in api application
 """
+import csv
+import io
+import json
 from unittest import mock
 
+from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate, APIClient
 
-from api import views
+from api import bulk, views
+from api.authentication import token_cache
+from api.models import Review, Reviewer
 from api.tests import factories
 
 
@@ -156,7 +162,7 @@ class ReviewListTests(APITestCase):
         response = client.get('/api/reviews/')
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        titles = set([i.get('title') for i in response.data])
+        titles = set([i.get('title') for i in response.data['results']])
         self.assertEqual(titles, {review1.title, review1b.title})
 
         # reviewer 2 sees their stuff
@@ -164,7 +170,7 @@ class ReviewListTests(APITestCase):
         client.credentials(HTTP_AUTHORIZATION='Token ' + self.token2.key)
         response = client.get('/api/reviews/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        titles = set([i.get('title') for i in response.data])
+        titles = set([i.get('title') for i in response.data['results']])
         self.assertEqual(titles, {review2.title})
 
     def test_can_post(self):
@@ -347,3 +353,202 @@ class ReviewerDetailTests(APITestCase):
         client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
         response = client.delete('/api/reviewers/{}/'.format(self.user.pk))
         self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class ReviewBulkCreateTests(APITestCase):
+    """
+    Tests on the Review bulk endpoint.
+    Users can create many of their own reviews at once
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.company = factories.CompanyFactory(name='bulk_company')
+        self.company2 = factories.CompanyFactory(name='bulk_company2')
+
+    def _review(self, company, rating=5):
+        return {
+            'rating': rating,
+            'title': 'bulk title',
+            'summary': 'bulk summary',
+            'company': 'http://testserver/api/companies/{}/'.format(company.pk)
+        }
+
+    def test_can_post_list(self):
+        data = [self._review(self.company), self._review(self.company2, 3)]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.post('/api/reviews/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Review.objects.filter(reviewer=self.user.reviewer).count(), 2)
+        self.assertEqual(self.company2.rating_stats.rating_sum, 3)
+
+    def test_reports_invalid_items(self):
+        data = [
+            self._review(self.company),
+            self._review(self.company, rating=9),
+            dict(self._review(self.company), company='http://testserver/api/companies/0/'),
+            dict(self._review(self.company), company=['x']),
+            dict(self._review(self.company), company={'pk': self.company.pk}),
+        ]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.post('/api/reviews/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('rating', response.data['results'][1]['errors'])
+        for result in response.data['results'][2:]:
+            self.assertIn('company', result['errors'])
+        self.assertEqual(Review.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        client.post('/api/reviews/bulk/',
+                    [self._review(self.company), self._review(self.company2)], format='json')
+
+        data = [self._review(c) for c in [self.company, self.company2] * 50]
+        # companies, savepoint, insert, stats update x2, daily totals job, reviewer version, release
+        with self.assertNumQueries(8):
+            response = client.post('/api/reviews/bulk/', data, format='json')
+        self.assertEqual(response.data['created'], 100)
+
+    def test_can_post_ndjson(self):
+        lines = [json.dumps(self._review(self.company)) for _ in range(3)]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.post('/api/reviews/bulk/', '\n'.join(lines) + '\n',
+                               content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 3)
+
+    def test_cannot_post_object(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.post('/api/reviews/bulk/', self._review(self.company), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ReviewExportTests(APITestCase):
+    """
+    Tests on the Review export endpoint.
+    Users can only export their own reviews
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.user2 = factories.UserFactory(username='another_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.review1 = factories.ReviewFactory(reviewer=self.user.reviewer, title='mine, "quoted"')
+        self.review2 = factories.ReviewFactory(reviewer=self.user.reviewer)
+        factories.ReviewFactory(reviewer=self.user2.reviewer)
+
+    def test_can_export_ndjson(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.get('/api/reviews/export/ndjson/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([r['title'] for r in rows], [self.review1.title, self.review2.title])
+
+        # same representation as the detail endpoint
+        detail = client.get('/api/reviews/{}/'.format(self.review1.pk))
+        self.assertEqual(rows[0], json.loads(detail.content.decode()))
+
+    def test_can_export_csv(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.get('/api/reviews/export/csv/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['title'], 'mine, "quoted"')
+
+    def test_unknown_format(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        response = client.get('/api/reviews/export/xml/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ReviewerBulkCreateTests(APITestCase):
+    """
+    Tests on the Reviewer bulk endpoint.
+    Staff users can register many reviewers at once
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user', is_staff=True)
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_can_post_csv(self):
+        body = ('username,password,bio\n'
+                'bulk_1,F9aSEvbSfkeYByKG,first bio\n'
+                'bulk_2,F9aSEvbSfkeYByKG\n')
+        response = self.client.post('/api/reviewers/bulk/', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        user = User.objects.get(username='bulk_1')
+        self.assertTrue(user.check_password('F9aSEvbSfkeYByKG'))
+        self.assertEqual(user.reviewer.bio, 'first bio')
+        self.assertEqual(response.data['results'][0]['url'],
+                         'http://testserver/api/reviewers/{}/'.format(user.pk))
+
+    def test_reports_invalid_items(self):
+        data = [
+            {'username': 'bulk_1', 'password': 'pw'},
+            {'username': 'request_user', 'password': 'pw'},
+            {'username': 'bulk_1', 'password': 'pw'},
+            {'username': 'bulk_2'},
+            {'username': 'bulk_3', 'password': 'pw', 'website': 'not a url'},
+        ]
+        # token, taken usernames, savepoint, savepoint, users, release, user pks, reviewers, release
+        with self.assertNumQueries(9):
+            response = self.client.post('/api/reviewers/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('username', response.data['results'][1]['errors'])
+        self.assertIn('password', response.data['results'][3]['errors'])
+        self.assertIn('website', response.data['results'][4]['errors'])
+        self.assertTrue(User.objects.filter(username='bulk_1', reviewer__isnull=False).exists())
+
+    def test_username_registered_meanwhile(self):
+        data = [{'username': 'bulk_%d' % i, 'password': 'pw'} for i in range(3)]
+
+        def make_passwords(passwords):
+            # by another request, after the usernames were checked
+            factories.UserFactory(username='bulk_1')
+            return ['hashed'] * len(passwords)
+
+        with mock.patch('api.bulk.hashing_service.make_passwords', side_effect=make_passwords):
+            response = self.client.post('/api/reviewers/bulk/', data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'invalid', 'created'])
+        self.assertEqual(response.data['results'][1]['errors'], bulk.DUPLICATE_USERNAME_ERROR)
+        user = User.objects.get(username='bulk_2')
+        self.assertEqual(response.data['results'][2]['url'],
+                         'http://testserver/api/reviewers/{}/'.format(user.pk))
+        self.assertTrue(Reviewer.objects.filter(user=user).exists())
+
+    def test_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        response = self.client.post('/api/reviewers/bulk/', [], format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,259 @@
+"""
+Tests on the ASGI handler and long polling
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api.asgi import ASGIHandler
+from api.authentication import token_cache
+from api.metrics import endpoint_stats
+from api.models import Review
+from api.tests import factories
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def call(application, method, path, query_string='', body=b'', headers=(), disconnect=None):
+    """
+    Send one request to an ASGI application
+    :param body: request body, or a list of body chunks
+    :param disconnect: seconds after which the client goes away
+    :return: (status, headers dictionary, body) tuple, status is None if nothing was sent
+    """
+    chunks = body if isinstance(body, list) else [body]
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    gone = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await gone.wait()
+        return {'type': 'http.disconnect'}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string.encode(),
+        'headers': [(name.encode(), value.encode()) for name, value in headers],
+        'client': ('10.0.0.1', 50000),
+        'server': ('testserver', 80),
+    }
+    if disconnect is not None:
+        asyncio.get_event_loop().call_later(disconnect, gone.set)
+    await application(scope, receive, send)
+    gone.set()
+
+    if not sent:
+        return None, {}, b''
+    start = sent[0]
+    response_headers = {name.decode().lower(): value.decode() for name, value in start['headers']}
+    return start['status'], response_headers, b''.join(m.get('body', b'') for m in sent[1:])
+
+
+@override_settings(LONG_POLL_INTERVAL=0.05, LONG_POLL_MAX_WAIT=5)
+class ASGIHandlerTests(TransactionTestCase):
+    """
+    Tests on api.asgi.ASGIHandler, whose threads use their own database
+    connections, so the data has to be committed
+    """
+    def setUp(self):
+        cache.clear()
+        self.company = factories.CompanyFactory(name='acme')
+        self.review = factories.ReviewFactory(company=self.company,
+                                              reviewer__user__username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.review.reviewer.user)
+        self.auth = ('Authorization', 'Token ' + self.token.key)
+        self.application = ASGIHandler(threads=2)
+
+    def tearDown(self):
+        self.application.close()
+        token_cache.invalidate(self.token.key)
+
+    def test_get(self):
+        status_code, headers, body = run(call(self.application, 'GET', '/api/companies/',
+                                              headers=[self.auth]))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(headers['content-type'], 'application/json')
+        self.assertIn('etag', headers)
+        self.assertEqual([c['name'] for c in json.loads(body)['results']], ['acme'])
+
+    def test_post_body_in_chunks(self):
+        data = json.dumps({'rating': 4, 'title': 'Fine', 'summary': 'Nothing to add.',
+                           'company': 'http://testserver/api/companies/{}/'.format(self.company.pk)})
+        status_code, _, body = run(call(
+            self.application, 'POST', '/api/reviews/', body=[data[:10].encode(), data[10:].encode()],
+            headers=[self.auth, ('Content-Type', 'application/json')]))
+        self.assertEqual(status_code, status.HTTP_201_CREATED, body)
+        self.assertEqual(Review.objects.count(), 2)
+
+    def test_head(self):
+        status_code, headers, body = run(call(
+            self.application, 'HEAD', '/api/reviews/{}/'.format(self.review.pk), headers=[self.auth]))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertIn('etag', headers)
+        self.assertEqual(body, b'')
+
+    def test_streaming(self):
+        status_code, _, body = run(call(self.application, 'GET', '/api/reviews/export/ndjson/',
+                                        headers=[self.auth]))
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual([json.loads(line)['title'] for line in body.splitlines()], [self.review.title])
+
+    def _etag(self, path):
+        _, headers, _ = run(call(self.application, 'GET', path, headers=[self.auth]))
+        return headers['etag']
+
+    def test_long_poll_not_modified(self):
+        etag = self._etag('/api/reviews/')
+        start = time.monotonic()
+        status_code, _, _ = run(call(self.application, 'GET', '/api/reviews/', 'wait=0.3',
+                                     headers=[self.auth, ('If-None-Match', etag)]))
+        self.assertEqual(status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+
+    def test_long_poll_change(self):
+        etag = self._etag('/api/reviews/')
+        path = '/api/reviews/{}/'.format(self.review.pk)
+
+        async def poll_and_change():
+            poll = asyncio.ensure_future(call(self.application, 'GET', '/api/reviews/', 'wait=5',
+                                              headers=[self.auth, ('If-None-Match', etag)]))
+            await asyncio.sleep(0.2)
+            self.assertFalse(poll.done())
+            await call(self.application, 'PATCH', path, body=b'{"rating": 1}',
+                       headers=[self.auth, ('Content-Type', 'application/json')])
+            return await asyncio.wait_for(poll, 2)
+
+        status_code, _, body = run(poll_and_change())
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(body)['results'][0]['rating'], 1)
+
+    def test_long_poll_recorded_once(self):
+        etag = self._etag('/api/reviews/')
+        endpoint_stats.reset()
+        run(call(self.application, 'GET', '/api/reviews/', 'wait=0.2',
+                 headers=[self.auth, ('If-None-Match', etag)]))
+        report = endpoint_stats.report(include_published=False)
+        self.assertEqual(report['review-list']['total_ms']['count'], 1)
+        endpoint_stats.reset()
+
+    def test_long_poll_disconnect(self):
+        etag = self._etag('/api/reviews/')
+        start = time.monotonic()
+        status_code, _, _ = run(call(self.application, 'GET', '/api/reviews/', 'wait=5',
+                                     headers=[self.auth, ('If-None-Match', etag)], disconnect=0.1))
+        self.assertIsNone(status_code)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_import_without_settings_module(self):
+        # as done by an ASGI server, e.g. uvicorn reviews.asgi:application
+        environ = {key: value for key, value in os.environ.items()
+                   if key != 'DJANGO_SETTINGS_MODULE'}
+        result = subprocess.run([sys.executable, '-c', 'import reviews.asgi'], env=environ,
+                                cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        self.assertEqual(result.returncode, 0, result.stdout.decode())
+
+    def test_lifespan(self):
+        application = ASGIHandler(threads=1)
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        run(application({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+@override_settings(LONG_POLL_INTERVAL=0.05, LONG_POLL_MAX_WAIT=0.3, LONG_POLL_WSGI=True)
+class LongPollMiddlewareTests(APITestCase):
+    """
+    Tests on long polling under WSGI
+    """
+    def setUp(self):
+        cache.clear()
+        self.review = factories.ReviewFactory(reviewer__user__username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.review.reviewer.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _timed_get(self, path, **extra):
+        start = time.monotonic()
+        response = self.client.get(path, **extra)
+        return response, time.monotonic() - start
+
+    def test_wait_is_capped(self):
+        etag = self.client.get('/api/companies/')['ETag']
+        response, elapsed = self._timed_get('/api/companies/', data={'wait': 60},
+                                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertLess(elapsed, 2)
+
+    @override_settings(LONG_POLL_WSGI=False)
+    def test_off_by_default(self):
+        etag = self.client.get('/api/reviews/')['ETag']
+        response, elapsed = self._timed_get('/api/reviews/', data={'wait': 60},
+                                            HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertLess(elapsed, 0.2)
+
+    def test_recorded_once(self):
+        etag = self.client.get('/api/companies/')['ETag']
+        endpoint_stats.reset()
+        self.client.get('/api/companies/', {'wait': 0.2}, HTTP_IF_NONE_MATCH=etag)
+        report = endpoint_stats.report(include_published=False)
+        self.assertEqual(report['company-list']['total_ms']['count'], 1)
+        endpoint_stats.reset()
+
+    def test_no_wait(self):
+        detail = '/api/reviewers/{}/'.format(self.review.reviewer.user.pk)
+        for path in ('/api/reviews/', '/api/reviews/?wait=abc', '/api/reviews/?wait=-1',
+                     # no long polling on this view
+                     detail + '?wait=10'):
+            etag = self.client.get(path)['ETag']
+            response, elapsed = self._timed_get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertLess(elapsed, 0.2, path)
+
+    @override_settings(THROTTLE_RATES={'token.default': '2/min'})
+    def test_throttled_once(self):
+        etag = self.client.get('/api/reviews/')['ETag']
+        response = self.client.get('/api/reviews/', {'wait': 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
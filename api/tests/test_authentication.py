@@ -0,0 +1,73 @@
+"""
+Tests on the cached token authentication
+"""
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api.authentication import token_cache
+from api.serializers import ReviewerSerializer
+from api.tests import factories
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    """
+    Tests on CachedTokenAuthentication and its invalidation
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.key = self.token.key
+
+    def tearDown(self):
+        token_cache.invalidate(self.key)
+
+    def test_second_request_skips_auth_queries(self):
+        before = token_cache.stats()
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # only the review page query, no token or reviewer lookups
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        after = token_cache.stats()
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['local_hits'] - before['local_hits'], 1)
+
+    def test_shared_cache_hit(self):
+        self.client.get('/api/reviews/')
+        token_cache.clear_local()
+
+        before = token_cache.stats()
+        with self.assertNumQueries(1):
+            self.client.get('/api/reviews/')
+        self.assertEqual(token_cache.stats()['shared_hits'] - before['shared_hits'], 1)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/reviews/')
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/reviews/')
+
+        self.token.delete()
+
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates(self):
+        self.client.get('/api/reviews/')
+        self.assertIsNotNone(token_cache.get(self.key))
+
+        ReviewerSerializer().update(self.user, {'password': 'changed'})
+
+        self.assertIsNone(token_cache.get(self.key))
@@ -0,0 +1,46 @@
+"""
+Tests on the benchmark seeder and runner
+"""
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api.models import CompanyDailyRating, CompanyRatingStats, Review, Reviewer
+from benchmarks import runner, seed
+from reviews.wsgi import application
+
+
+class BenchmarkTests(TestCase):
+    """
+    Tests on benchmarks.seed and benchmarks.runner on a tiny database
+    """
+    def test_seed_and_run(self):
+        seed.seed(companies=3, reviewers=4, reviews=20, batch_size=7, days=30)
+        self.assertEqual(Reviewer.objects.count(), 4)
+        self.assertEqual(Review.objects.count(), 20)
+        self.assertEqual(sum(CompanyRatingStats.objects.values_list('review_count', flat=True)), 20)
+        dates = list(Review.objects.values_list('submission_date', flat=True))
+        self.assertEqual(len(set(dates)), 20)
+        self.assertGreaterEqual(min(dates), timezone.now() - datetime.timedelta(days=30))
+        self.assertGreater(CompanyDailyRating.objects.values('day').distinct().count(), 1)
+        # left as it was
+        self.assertTrue(Review._meta.get_field('submission_date').auto_now_add)
+
+        fixtures = runner.Fixtures(users=2)
+        report = runner.run(runner.WSGIClient(application), fixtures,
+                            list(runner.SCENARIOS), requests=3)
+
+        self.assertEqual(set(report), set(runner.SCENARIOS))
+        for summary in report.values():
+            self.assertEqual(summary['requests'], 3)
+            self.assertEqual(summary['errors'], 0)
+            self.assertGreater(summary['queries_per_request']['mean'], 0)
+
+    def test_find_regressions(self):
+        def report(p95, queries):
+            return {'scenarios': {'review-list': {
+                'latency_ms': {'p95': p95}, 'queries_per_request': {'mean': queries}}}}
+
+        self.assertEqual(runner.find_regressions(report(11, 2), report(10, 2), 0.2), [])
+        self.assertEqual(len(runner.find_regressions(report(13, 3), report(10, 2), 0.2)), 2)
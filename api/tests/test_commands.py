@@ -0,0 +1,78 @@
+"""
+Tests on the management commands
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+
+from api.models import Reviewer
+from api.tests import factories
+
+
+class ExplainApiQueriesTests(TestCase):
+    """
+    Tests on explain_api_queries
+    """
+    def test_explains_each_endpoint(self):
+        user = factories.UserFactory(username='explain_user')
+        for _ in range(3):
+            factories.ReviewFactory(reviewer=user.reviewer)
+
+        out = StringIO()
+        call_command('explain_api_queries', stdout=out)
+        output = out.getvalue()
+
+        for name in ['company-list', 'company-detail', 'review-list',
+                     'review-detail', 'reviewer-detail']:
+            self.assertIn('== %s' % name, output)
+        self.assertIn('review_reviewer_date_idx', output)
+
+    def test_needs_a_reviewer(self):
+        with self.assertRaises(CommandError):
+            call_command('explain_api_queries', stdout=StringIO())
+
+
+class ImportReviewersTests(TestCase):
+    """
+    Tests on import_reviewers
+    """
+    def _write(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as output:
+            output.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_ndjson(self):
+        factories.UserFactory(username='taken')
+        path = self._write('.ndjson', '\n'.join([
+            json.dumps({'username': 'import_%d' % i, 'password': 'pw', 'bio': 'bio %d' % i})
+            for i in range(5)
+        ] + [json.dumps({'username': 'taken', 'password': 'pw'}), '{not json']))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_reviewers', path, '--batch-size', '2', '--workers', '0',
+                     stdout=out, stderr=err)
+
+        self.assertIn('Registered 5 reviewers, 2 rows failed', out.getvalue())
+        self.assertIn('Row 6:', err.getvalue())
+        self.assertIn('Row 7:', err.getvalue())
+        reviewer = Reviewer.objects.get(user__username='import_3')
+        self.assertEqual(reviewer.bio, 'bio 3')
+        self.assertTrue(reviewer.user.check_password('pw'))
+
+    def test_import_csv_in_pool(self):
+        path = self._write('.csv', 'username,password,email\nimport_csv,pw,a@example.com\n')
+        out = StringIO()
+        call_command('import_reviewers', path, '--workers', '1', stdout=out)
+        self.assertIn('Registered 1 reviewers, 0 rows failed', out.getvalue())
+        self.assertEqual(Reviewer.objects.get(user__username='import_csv').user.email,
+                         'a@example.com')
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_reviewers', '/no/such/file.csv', stdout=StringIO())
@@ -0,0 +1,137 @@
+"""
+Tests on the ETag / Last-Modified support of the reviewer-scoped endpoints
+"""
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api.authentication import token_cache
+from api.tests import factories
+
+
+class ConditionalGetTests(APITestCase):
+    """
+    Tests on ReviewerConditionalGetMixin
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='etag_company')
+        self.review = factories.ReviewFactory(reviewer=self.user.reviewer, company=self.company)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_not_modified_without_queries(self):
+        response = self.client.get('/api/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_review_write_changes_etag(self):
+        list_etag = self.client.get('/api/reviews/')['ETag']
+        detail_url = '/api/reviews/{}/'.format(self.review.pk)
+        detail_etag = self.client.get(detail_url)['ETag']
+        self.assertNotEqual(list_etag, detail_etag)
+
+        data = {
+            'rating': 4,
+            'title': 'new review',
+            'summary': 'new summary',
+            'company': 'http://testserver/api/companies/{}/'.format(self.company.pk)
+        }
+        self.client.post('/api/reviews/', data, format='json')
+
+        response = self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reviewer_write_changes_etag(self):
+        url = '/api/reviewers/{}/'.format(self.user.pk)
+        etag = self.client.get(url)['ETag']
+
+        self.client.patch(url, {'bio': 'new bio'}, format='json')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bio'], 'new bio')
+
+    def test_if_modified_since(self):
+        response = self.client.get('/api/reviews/')
+        last_modified = response['Last-Modified']
+
+        response = self.client.get('/api/reviews/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get('/api/reviews/', HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CompanyConditionalGetTests(APITestCase):
+    """
+    Tests on CompanyConditionalGetMixin
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='etag_company')
+        self.other = factories.CompanyFactory(name='other_company')
+        self.list_url = '/api/companies/'
+        self.detail_url = '/api/companies/{}/'.format(self.company.pk)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _post_review(self, company):
+        data = {
+            'rating': 4,
+            'title': 'new review',
+            'summary': 'new summary',
+            'company': 'http://testserver/api/companies/{}/'.format(company.pk)
+        }
+        response = self.client.post('/api/reviews/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_not_modified_without_queries(self):
+        for url in (self.list_url, self.detail_url):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, {'wait': 0}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_review_write_changes_etag(self):
+        list_etag = self.client.get(self.list_url)['ETag']
+        detail_etag = self.client.get(self.detail_url)['ETag']
+
+        self._post_review(self.other)
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self._post_review(self.company)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['ratings']['review_count'], 1)
+
+    def test_company_write_changes_etag(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        self.company.name = 'renamed'
+        self.company.save()
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'renamed')
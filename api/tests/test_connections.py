@@ -0,0 +1,193 @@
+"""
+Tests on database connection management
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import SimpleTestCase
+
+from api import connections
+from api.connections import ConnectionPool, ConnectionStats, connection_stats
+from api.db_backends.sqlite3.base import DatabaseWrapper
+
+
+class Opener:
+    """
+    Opens in-memory SQLite connections and remembers them
+    """
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        self.opened.append(sqlite3.connect(':memory:', check_same_thread=False))
+        return self.opened[-1]
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    Tests on api.connections.ConnectionPool
+    """
+    def setUp(self):
+        self.connect = Opener()
+
+    def test_reuse_and_bound(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        first = pool.acquire(self.connect)
+        self.assertEqual(pool.stats(), {'size': 1, 'idle': 0, 'in_use': 1, 'timeouts': 0})
+        with self.assertRaises(OperationalError):
+            pool.acquire(self.connect)
+
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect), first)
+        self.assertEqual(len(self.connect.opened), 1)
+        self.assertEqual(pool.stats(), {'size': 1, 'idle': 0, 'in_use': 1, 'timeouts': 1})
+
+    def test_discard(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        first = pool.acquire(self.connect)
+        pool.discard(first)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            first.execute('SELECT 1')
+        self.assertIsNot(pool.acquire(self.connect), first)
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        with self.assertRaises(sqlite3.OperationalError):
+            pool.acquire(mock.Mock(side_effect=sqlite3.OperationalError))
+        pool.acquire(self.connect)
+
+    def test_max_age(self):
+        pool = ConnectionPool(size=1, timeout=0.05, max_age=0.01)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        time.sleep(0.02)
+        self.assertIsNot(pool.acquire(self.connect), first)
+        self.assertEqual(len(self.connect.opened), 2)
+
+    def test_health_check(self):
+        check = mock.Mock(return_value=False)
+        pool = ConnectionPool(size=2, timeout=0.05, check=check)
+        first = pool.acquire(self.connect)
+        pool.release(first)
+        self.assertIsNot(pool.acquire(self.connect), first)
+        check.assert_called_once_with(first)
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    def test_ping(self):
+        usable = self.connect()
+        self.assertTrue(connections._ping(usable))
+        usable.close()
+        self.assertFalse(connections._ping(usable))
+
+
+class ConnectionStatsTests(SimpleTestCase):
+    """
+    Tests on api.connections.ConnectionStats
+    """
+    def test_stats(self):
+        stats = ConnectionStats(window=60)
+        for _ in range(3):
+            stats.record_open('other')
+        stats.record_wait('other', 2)
+        stats.record_wait('other', 4)
+
+        other = stats.stats()['other']
+        self.assertEqual(other['opened'], 3)
+        self.assertGreater(other['opened_per_second'], 0)
+        self.assertEqual((other['wait_ms']['count'], other['wait_ms']['mean']), (2, 3))
+        self.assertIsNone(other['pool'])
+
+
+class DatabaseWrapperTests(SimpleTestCase):
+    """
+    Tests on the connection managed SQLite backend, on a database of its own
+    """
+    alias = 'connection-tests'
+
+    def setUp(self):
+        descriptor, self.name = tempfile.mkstemp(suffix='.db')
+        os.close(descriptor)
+        connection_stats.reset()
+
+    def tearDown(self):
+        connections._pools.pop(self.alias, None)
+        connection_stats.reset()
+        os.remove(self.name)
+
+    def _wrapper(self, **settings):
+        settings_dict = {
+            'ENGINE': 'api.db_backends.sqlite3', 'NAME': self.name, 'USER': '', 'PASSWORD': '',
+            'HOST': '', 'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None, 'ATOMIC_REQUESTS': False,
+            'AUTOCOMMIT': True, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True,
+        }
+        settings_dict.update(settings)
+        return DatabaseWrapper(settings_dict, alias=self.alias)
+
+    def _select(self, wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            return cursor.fetchone()
+
+    def test_pooled(self):
+        first = self._wrapper(POOL_SIZE=1, POOL_TIMEOUT=0)
+        second = self._wrapper(POOL_SIZE=1, POOL_TIMEOUT=0)
+        self._select(first)
+        raw = first.connection
+        pool = connections._pools[self.alias]
+        self.assertEqual(pool.stats()['in_use'], 1)
+        with self.assertRaises(OperationalError):
+            self._select(second)
+
+        first.close()
+        self.assertEqual(pool.stats(), {'size': 1, 'idle': 1, 'in_use': 0, 'timeouts': 1})
+        self.assertEqual(self._select(second), (1,))
+        self.assertIs(second.connection, raw)
+        second.close()
+
+        stats = connection_stats.stats()[self.alias]
+        self.assertEqual(stats['opened'], 1)
+        self.assertEqual(stats['wait_ms']['count'], 2)
+        self.assertEqual(stats['pool']['idle'], 1)
+
+    def test_pooled_broken_transaction_is_discarded(self):
+        wrapper = self._wrapper(POOL_SIZE=1)
+        self._select(wrapper)
+        raw = wrapper.connection
+        wrapper.errors_occurred = True
+        wrapper.close()
+        self.assertEqual(connections._pools[self.alias].stats()['idle'], 0)
+        self._select(wrapper)
+        self.assertIsNot(wrapper.connection, raw)
+        wrapper.close()
+
+    def test_health_check(self):
+        wrapper = self._wrapper(CONN_MAX_AGE=60)
+        self._select(wrapper)
+        raw = wrapper.connection
+        with mock.patch.object(DatabaseWrapper, 'is_usable', return_value=False) as is_usable:
+            # checked once per request
+            self._select(wrapper)
+            self.assertEqual(is_usable.call_count, 0)
+            wrapper.close_if_unusable_or_obsolete()
+            self._select(wrapper)
+            self._select(wrapper)
+            self.assertEqual(is_usable.call_count, 1)
+        self.assertIsNot(wrapper.connection, raw)
+        self.assertEqual(connection_stats.stats()[self.alias]['opened'], 2)
+        wrapper.close()
+
+    def test_no_health_check_in_transaction(self):
+        wrapper = self._wrapper(CONN_MAX_AGE=60)
+        self._select(wrapper)
+        # the request ended while a transaction was open, e.g. in a test
+        wrapper.in_atomic_block = True
+        wrapper.health_check_done = False
+        with mock.patch.object(DatabaseWrapper, 'is_usable') as is_usable:
+            self._select(wrapper)
+        is_usable.assert_not_called()
+        wrapper.in_atomic_block = False
+        wrapper.close()
@@ -0,0 +1,173 @@
+"""
+Tests on near-duplicate review detection
+"""
+import random
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.test import SimpleTestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITransactionTestCase, APIClient
+
+from api import duplicates
+from api.authentication import token_cache
+from api.models import Review
+from api.tests import factories
+
+
+TEXT = ("Great place to work, friendly staff and good benefits. "
+        "Management listens to the team and the hours are flexible.")
+
+
+class SimhashTests(SimpleTestCase):
+    """
+    Tests on the fingerprints
+    """
+    def _distance(self, a, b):
+        return duplicates.distance(duplicates.simhash(a), duplicates.simhash(b))
+
+    def test_majority_of_feature_bits(self):
+        rng = random.Random(0)
+        for words in (0, 1, 2, 3, 4, 7, 50, 300):
+            text = ' '.join('w%d' % rng.randint(0, 100) for _ in range(words))
+            features = duplicates._features(text)
+            expected = 0
+            for bit in range(64):
+                ones = sum(duplicates._hash(f) >> bit & 1 for f in features)
+                if ones * 2 > len(features):
+                    expected |= 1 << bit
+            self.assertEqual(duplicates.simhash(text), expected, text)
+
+    def test_near_duplicates(self):
+        self.assertEqual(self._distance(TEXT, TEXT.upper().replace(',', ' -')), 0)
+        self.assertLessEqual(self._distance(TEXT, TEXT.replace('good', 'great')), 10)
+        self.assertLessEqual(self._distance(TEXT, TEXT + ' 10/10'), 10)
+
+    def test_different_texts(self):
+        self.assertGreater(self._distance(TEXT, "Terrible commute and slow support, would not "
+                                                "recommend. The office is cold."), 10)
+        self.assertGreater(self._distance("Great company", "Awful company"), 10)
+
+
+@override_settings(DUPLICATE_REVIEW_WINDOW=3600, DUPLICATE_REVIEW_HISTORY=3,
+                   DUPLICATE_REVIEW_MAX_DISTANCE=10)
+class SubmissionsTests(SimpleTestCase):
+    """
+    Tests on the recent submission lists
+    """
+    def setUp(self):
+        cache.clear()
+
+    def _check(self, text=TEXT, company=1, ip='10.0.0.1', reviewer=1, now=1000):
+        """
+        Check a review, then save and record it
+        """
+        submissions = duplicates.Submissions()
+        fingerprint = duplicates.simhash(text)
+        duplicate = submissions.is_duplicate(company, ip, reviewer, fingerprint, now=now)
+        submissions.add(company, ip, reviewer, fingerprint, now=now)
+        submissions.record(now=now)
+        return duplicate
+
+    def test_same_ip_or_reviewer(self):
+        self.assertFalse(self._check())
+        self.assertTrue(self._check(reviewer=2))
+        self.assertTrue(self._check(ip='10.0.0.2'))
+        self.assertTrue(self._check(ip=None, reviewer=1))
+        # someone else, or another company
+        self.assertFalse(self._check(ip='10.0.0.3', reviewer=3))
+        self.assertFalse(self._check(company=2))
+
+    def test_window(self):
+        self.assertFalse(self._check(now=1000))
+        self.assertTrue(self._check(now=4599))
+        self.assertFalse(self._check(now=4599 + 3600))
+
+    def test_history_is_bounded(self):
+        self._check(now=1000)
+        for i in range(3):
+            self.assertFalse(self._check('unrelated review number %d' % i, now=1001 + i))
+        self.assertFalse(self._check(now=1010))
+
+    def test_recorded_when_saved(self):
+        fingerprint = duplicates.simhash(TEXT)
+        submissions = duplicates.Submissions()
+        self.assertFalse(submissions.is_duplicate(1, '10.0.0.1', 1, fingerprint))
+        submissions.add(1, '10.0.0.1', 1, fingerprint)
+        # seen by the same batch only, until recorded
+        self.assertTrue(submissions.is_duplicate(1, '10.0.0.1', 1, fingerprint))
+        self.assertFalse(duplicates.Submissions().is_duplicate(1, '10.0.0.1', 1, fingerprint))
+
+        submissions.record()
+        self.assertTrue(duplicates.Submissions().is_duplicate(1, '10.0.0.1', 1, fingerprint))
+
+
+class DuplicateReviewApiTests(APITransactionTestCase):
+    """
+    Tests on duplicate reviews sent to the API, committed since they
+    are recorded when their transaction commits
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='acme')
+        self.data = {'rating': 5, 'title': 'Great', 'summary': TEXT,
+                     'company': 'http://testserver/api/companies/{}/'.format(self.company.pk)}
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    @override_settings(DUPLICATE_REVIEW_ACTION=duplicates.REJECT)
+    def test_reject(self):
+        response = self.client.post('/api/reviews/', self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('flagged', response.data)
+
+        data = dict(self.data, summary=TEXT.replace('good', 'great'))
+        response = self.client.post('/api/reviews/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('non_field_errors', response.data)
+
+        # updates are not checked
+        review = Review.objects.get()
+        response = self.client.patch('/api/reviews/{}/'.format(review.pk), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(DUPLICATE_REVIEW_ACTION=duplicates.FLAG)
+    def test_flag(self):
+        for _ in range(2):
+            response = self.client.post('/api/reviews/', self.data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(list(Review.objects.order_by('id').values_list('flagged', flat=True)),
+                         [False, True])
+
+    @override_settings(DUPLICATE_REVIEW_ACTION=duplicates.OFF)
+    def test_off(self):
+        for _ in range(2):
+            self.client.post('/api/reviews/', self.data, format='json')
+        self.assertFalse(Review.objects.filter(flagged=True).exists())
+
+    @override_settings(DUPLICATE_REVIEW_ACTION=duplicates.REJECT)
+    def test_bulk(self):
+        other = dict(self.data, summary="Slow support and a long commute, would not recommend.")
+        response = self.client.post('/api/reviews/bulk/', [self.data, other, self.data],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'created', 'invalid'])
+
+    @override_settings(DUPLICATE_REVIEW_ACTION=duplicates.REJECT)
+    def test_not_recorded_when_not_saved(self):
+        with mock.patch('api.serializers.stats.apply_rating_changes',
+                        side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/api/reviews/', self.data, format='json')
+        self.assertFalse(Review.objects.exists())
+
+        response = self.client.post('/api/reviews/', self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
@@ -0,0 +1,155 @@
+"""
+Tests on the cached public company reviews feed
+"""
+import threading
+import time
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api import feed
+from api.authentication import token_cache
+from api.models import Review
+from api.replicas import ReplicaRouter, replica_reads
+from api.tests import factories
+
+
+class CompanyReviewListTests(APITestCase):
+    """
+    Tests on CompanyReviewListView
+    """
+    def setUp(self):
+        cache.clear()
+        self.company = factories.CompanyFactory(name='feed_company')
+        self.other_company = factories.CompanyFactory(name='other_company')
+        self.first = factories.ReviewFactory(company=self.company, title='first')
+        self.second = factories.ReviewFactory(company=self.company, title='second')
+        factories.ReviewFactory(company=self.other_company, title='other')
+        self.url = '/api/companies/{}/reviews/'.format(self.company.pk)
+        self.other_url = '/api/companies/{}/reviews/'.format(self.other_company.pk)
+
+        self.user = factories.UserFactory(username='feed_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _titles(self, response):
+        return [review['title'] for review in response.data['results']]
+
+    def test_public_newest_first(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._titles(response), ['second', 'first'])
+        self.assertNotIn('ip_address', response.data['results'][0])
+
+    def test_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(self._titles(response), ['second', 'first'])
+
+        # each cursor and page size is cached separately
+        response = self.client.get(self.url, {'page_size': 1})
+        self.assertEqual(self._titles(response), ['second'])
+        next_url = response.data['next']
+        self.assertEqual(self._titles(self.client.get(next_url)), ['first'])
+        with self.assertNumQueries(0):
+            self.client.get(next_url)
+
+    def test_key_ignores_other_params_and_host(self):
+        self.client.get(self.url, {'page_size': 1})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'page_size': 1, 'x': 'anything'},
+                                       HTTP_HOST='localhost')
+        # the links are for this request's host, without the other parameters
+        next_url = response.data['next']
+        self.assertTrue(next_url.startswith('http://localhost' + self.url), next_url)
+        self.assertNotIn('x=', next_url)
+        self.assertIn('page_size=1', next_url)
+
+        # the format and fieldsets are part of the key
+        response = self.client.get(self.url, {'page_size': 1, 'fields': 'title'})
+        self.assertEqual(list(response.data['results'][0]), ['title'])
+        response = self.client.get(self.url, {'page_size': 1, 'format': 'compact'})
+        self.assertIn('format=compact', response.data['next'])
+
+    def test_write_invalidates_only_that_company(self):
+        self.client.get(self.url)
+        self.client.get(self.other_url)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        data = {
+            'rating': 4,
+            'title': 'third',
+            'summary': 'new summary',
+            'company': 'http://testserver/api/companies/{}/'.format(self.company.pk)
+        }
+        response = self.client.post('/api/reviews/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(self._titles(self.client.get(self.url)), ['third', 'second', 'first'])
+        with self.assertNumQueries(0):
+            self.client.get(self.other_url)
+
+        self.client.delete(response.data['url'])
+        self.assertEqual(self._titles(self.client.get(self.url)), ['second', 'first'])
+
+    def test_missing_company(self):
+        response = self.client.get('/api/companies/0/reviews/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class GetPageTests(TestCase):
+    """
+    Tests on feed.get_page stampede protection
+    """
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/api/companies/1/reviews/')
+        self.builds = 0
+
+    def _build(self):
+        self.builds += 1
+        time.sleep(0.2)
+        return {'results': []}
+
+    def test_one_build_per_miss(self):
+        results = []
+
+        def get():
+            results.append(feed.get_page(1, self.request, self._build))
+
+        threads = [threading.Thread(target=get) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(results, [{'results': []}] * 5)
+
+    def test_failed_build_releases_lock(self):
+        def fail():
+            raise RuntimeError()
+
+        with self.assertRaises(RuntimeError):
+            feed.get_page(1, self.request, fail)
+        self.assertEqual(feed.get_page(1, self.request, self._build), {'results': []})
+        self.assertEqual(self.builds, 1)
+
+    @override_settings(DATABASE_REPLICAS=['replica_1'])
+    def test_built_from_primary(self):
+        reads = []
+
+        def build():
+            reads.append(ReplicaRouter().db_for_read(Review))
+            return {'results': []}
+
+        with replica_reads():
+            feed.get_page(1, self.request, build)
+        self.assertEqual(reads, ['default'])
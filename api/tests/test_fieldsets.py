@@ -0,0 +1,138 @@
+"""
+Tests on sparse fieldsets and the compact list format
+"""
+import json
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APIClient
+
+from api.authentication import token_cache
+from api.fieldsets import select_fields
+from api.renderers import CompactJSONRenderer
+from api.tests import factories
+
+
+class SelectFieldsTests(TestCase):
+    """
+    Tests on select_fields
+    """
+    available = ['url', 'rating', 'title', 'summary']
+
+    def test_fields_and_exclude(self):
+        self.assertEqual(select_fields(self.available, fields='title, rating'),
+                         ['rating', 'title'])
+        self.assertEqual(select_fields(self.available, exclude='summary,url'),
+                         ['rating', 'title'])
+        self.assertEqual(select_fields(self.available, fields='title,rating', exclude='rating'),
+                         ['title'])
+
+    def test_invalid(self):
+        with self.assertRaises(ValidationError) as context:
+            select_fields(self.available, fields='title,nope')
+        self.assertIn('fields', context.exception.detail)
+
+        with self.assertRaises(ValidationError):
+            select_fields(self.available, exclude=','.join(self.available))
+
+
+class ReviewFieldsetTests(APITestCase):
+    """
+    Tests on ?fields= and ?exclude= on the review endpoints
+    """
+    def setUp(self):
+        self.reviewer = factories.ReviewerFactory(user__username='fieldset_user')
+        self.reviews = [factories.ReviewFactory(reviewer=self.reviewer, rating=i + 1)
+                        for i in range(3)]
+        self.token, _ = Token.objects.get_or_create(user=self.reviewer.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_list_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/reviews/', {'fields': 'rating,title'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([list(review) for review in response.data['results']],
+                         [['rating', 'title']] * 3)
+
+        select = [query['sql'] for query in queries.captured_queries
+                  if 'FROM "api_review"' in query['sql']][-1]
+        self.assertNotIn('"summary"', select)
+        self.assertNotIn('"ip_address"', select)
+
+    def test_paginates_with_fields(self):
+        response = self.client.get('/api/reviews/', {'fields': 'title', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(list(response.data['results'][0]), ['title'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_detail_exclude(self):
+        url = '/api/reviews/{}/'.format(self.reviews[0].pk)
+        response = self.client.get(url, {'exclude': 'summary,ip_address'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('summary', response.data)
+        self.assertEqual(response.data['url'], 'http://testserver' + url)
+        self.assertIn('company', response.data)
+
+    def test_unknown_field(self):
+        response = self.client.get('/api/reviews/', {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+    def test_ignored_on_write(self):
+        url = '/api/reviews/{}/?fields=title'.format(self.reviews[0].pk)
+        response = self.client.patch(url, {'rating': 5}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rating'], 5)
+
+
+class CompanyFieldsetTests(APITestCase):
+    """
+    Tests on ?fields= and ?format=compact on the company endpoints
+    """
+    def setUp(self):
+        cache.clear()
+        self.company = factories.CompanyFactory(name='fieldset_company')
+        factories.ReviewFactory(company=self.company, rating=4, title='first')
+        factories.ReviewFactory(company=self.company, rating=2, title='second')
+
+        self.user = factories.UserFactory(username='fieldset_company_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_company_list_without_ratings(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/companies/', {'fields': 'url,name'})
+        self.assertEqual(response.data['results'][0]['name'], 'fieldset_company')
+        self.assertEqual(list(response.data['results'][0]), ['url', 'name'])
+        self.assertFalse(any('api_companyratingstats' in query['sql']
+                             for query in queries.captured_queries))
+
+        response = self.client.get('/api/companies/', {'fields': 'ratings'})
+        self.assertEqual(response.data['results'][0]['ratings']['review_count'], 2)
+
+    def test_compact_feed(self):
+        url = '/api/companies/{}/reviews/'.format(self.company.pk)
+        response = self.client.get(url, {'fields': 'rating,title', 'format': 'compact'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], CompactJSONRenderer.media_type)
+        self.assertEqual(json.loads(response.content.decode())['results'],
+                         {'rating': [2, 4], 'title': ['second', 'first']})
+
+    def test_compact_error(self):
+        response = self.client.get('/api/companies/0/reviews/', {'format': 'compact'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('detail', json.loads(response.content.decode()))
@@ -1,15 +1,25 @@
 """
 Tests on the custom filtering backends
 """
+import datetime
 from unittest import mock
 
 from django.test import TestCase
-
-from api.filters import IsUserFilterBackend, IsReviewerFilterBackend
-from api.models import Reviewer, Review
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import (CompanyNameFilterBackend, IsUserFilterBackend, IsReviewerFilterBackend,
+                         ReviewFilterBackend, prefix_range)
+from api.models import Company, Reviewer, Review
+from api.pagination import ReviewPagination
 from api.tests import factories
 
 
+def _request(params):
+    return Request(APIRequestFactory().get('/', params))
+
+
 class IsUserFilterBackendTests(TestCase):
     @mock.patch('rest_framework.request.Request')
     def test_filter_queryset(self, mock_req):
@@ -81,3 +91,65 @@ class IsReviewerFilterBackendTests(TestCase):
         mock_req.user = user4
         ret = f.filter_queryset(mock_req, queryset, mock_view)
         self.assertEqual(len(ret), 0)
+
+
+class ReviewFilterBackendTests(TestCase):
+    def setUp(self):
+        self.company = factories.CompanyFactory(name='company1')
+        self.company2 = factories.CompanyFactory(name='company2')
+        for day, rating, company in ((1, 1, self.company), (10, 3, self.company),
+                                     (20, 5, self.company2), (31, 4, self.company2)):
+            review = factories.ReviewFactory(company=company, rating=rating,
+                                             title='%d_%d' % (day, rating))
+            submitted = datetime.datetime(2019, 5, day, 23, 59, tzinfo=datetime.timezone.utc)
+            Review.objects.filter(pk=review.pk).update(submission_date=submitted)
+
+    def _titles(self, params):
+        queryset = ReviewFilterBackend().filter_queryset(_request(params), Review.objects.all(),
+                                                         None)
+        return sorted(queryset.values_list('title', flat=True))
+
+    def test_filters(self):
+        self.assertEqual(len(self._titles({})), 4)
+        self.assertEqual(self._titles({'rating_min': 3, 'rating_max': 4}), ['10_3', '31_4'])
+        self.assertEqual(self._titles({'company': self.company2.pk}), ['20_5', '31_4'])
+        # whole days, both ends included
+        self.assertEqual(self._titles({'submitted_from': '2019-05-10', 'submitted_to': '2019-05-20'}),
+                         ['10_3', '20_5'])
+        self.assertEqual(self._titles({'company': self.company.pk, 'rating_min': 2}), ['10_3'])
+
+    def test_ordering_column_stays_indexable(self):
+        view = mock.Mock(paginator=ReviewPagination())
+        params = {'ordering': '-rating', 'rating_min': 3, 'submitted_from': '2019-05-10'}
+        queryset = ReviewFilterBackend().filter_queryset(_request(params), Review.objects.all(), view)
+
+        self.assertEqual(list(queryset.query.annotations), ['submission_date_unindexed'])
+        self.assertEqual(sorted(queryset.values_list('title', flat=True)),
+                         ['10_3', '20_5', '31_4'])
+
+    def test_invalid(self):
+        for params in ({'rating_min': 0}, {'rating_max': 'five'}, {'company': 'x'},
+                       {'submitted_from': '05/01/2019'}, {'rating_min': 4, 'rating_max': 2},
+                       {'submitted_from': '2019-05-02', 'submitted_to': '2019-05-01'}):
+            with self.assertRaises(ValidationError, msg=params):
+                self._titles(params)
+
+
+class CompanyNameFilterBackendTests(TestCase):
+    def test_filter_queryset(self):
+        for name in ['Acme', 'Acme Corp', 'Acne', 'acme', 'Ac', 'Bcme']:
+            factories.CompanyFactory(name=name)
+
+        def names(prefix):
+            queryset = CompanyNameFilterBackend().filter_queryset(
+                _request({'name': prefix}), Company.objects.all(), mock.Mock())
+            return sorted(queryset.values_list('name', flat=True))
+
+        self.assertEqual(names('Acme'), ['Acme', 'Acme Corp'])
+        self.assertEqual(names('Ac'), ['Ac', 'Acme', 'Acme Corp', 'Acne'])
+        self.assertEqual(len(names('')), 6)
+
+    def test_prefix_range(self):
+        self.assertEqual(prefix_range('abc'), ('abc', 'abd'))
+        self.assertEqual(prefix_range('a\U0010ffff'), ('a\U0010ffff', 'b'))
+        self.assertEqual(prefix_range('\U0010ffff'), ('\U0010ffff', None))
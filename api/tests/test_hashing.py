@@ -0,0 +1,160 @@
+"""
+Tests on the password hashing pool
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.hashers import check_password
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from api.hashing import HashingService, HashingUnavailable, hashing_service
+from api.tests import factories
+
+
+class HashingServiceTests(TestCase):
+    """
+    Tests on HashingService
+    """
+    def test_inline(self):
+        service = HashingService(pool_size=0, queue_limit=0, timeout=10, retry_after=1)
+        encoded = service.make_password('secret')
+        self.assertTrue(check_password('secret', encoded))
+        self.assertEqual(service.check_password('secret', encoded), (True, False))
+        self.assertEqual(service.check_password('wrong', encoded), (False, False))
+
+        stats = service.stats()
+        self.assertEqual(stats['make_password']['count'], 1)
+        self.assertEqual(stats['check_password']['count'], 2)
+
+    def test_pool(self):
+        service = HashingService(pool_size=1, queue_limit=1, timeout=10, retry_after=1)
+        self.addCleanup(service.shutdown)
+        encoded = service.make_password('secret')
+        self.assertEqual(service.check_password('secret', encoded), (True, False))
+
+    def test_full(self):
+        service = HashingService(pool_size=1, queue_limit=0, timeout=10, retry_after=3)
+        self.addCleanup(service.shutdown)
+
+        busy = threading.Thread(target=service._run, args=('sleep', time.sleep, 1))
+        busy.start()
+        time.sleep(0.1)
+        with self.assertRaises(HashingUnavailable) as context:
+            service.make_password('secret')
+        busy.join()
+
+        self.assertEqual(context.exception.wait, 3)
+        self.assertEqual(service.stats()['rejected'], 1)
+        # the slot is free again
+        service.make_password('secret')
+
+    def _run_batch(self, service, passwords, during=None):
+        """
+        Hash passwords with the service, on threads rather than processes,
+        so that the hashing can be replaced
+        :param during: optional callable run while the batch is hashed
+        :return: (peak number of chunks hashed at once, encoded passwords, result of during)
+        """
+        service._executor = ThreadPoolExecutor(max_workers=service.pool_size)
+        self.addCleanup(service.shutdown)
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def slow_hash(passwords):
+            with lock:
+                running.append(passwords)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(passwords)
+            return ['hashed:' + password for password in passwords]
+
+        results = []
+        with mock.patch('api.hashing._make_passwords', slow_hash):
+            batch = threading.Thread(target=lambda: results.append(service.make_passwords(passwords)))
+            batch.start()
+            time.sleep(0.05)
+            during_result = during() if during is not None else None
+            batch.join()
+        return max(peak), results[0], during_result
+
+    def test_batch_leaves_a_worker_free(self):
+        service = HashingService(pool_size=2, queue_limit=0, timeout=10, retry_after=1)
+        passwords = ['p%d' % i for i in range(20)]
+        # not rejected: the batch holds one slot at a time
+        peak, results, encoded = self._run_batch(service, passwords,
+                                                 lambda: service.make_password('secret'))
+
+        self.assertTrue(check_password('secret', encoded))
+        self.assertEqual(peak, 1)
+        self.assertEqual(results, ['hashed:' + password for password in passwords])
+        self.assertEqual(service.stats()['rejected'], 0)
+
+    def test_batch_without_reserved_workers(self):
+        service = HashingService(pool_size=2, queue_limit=0, timeout=10, retry_after=1,
+                                 reserved_workers=0)
+        passwords = ['p%d' % i for i in range(20)]
+        peak, results, _ = self._run_batch(service, passwords)
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(results, ['hashed:' + password for password in passwords])
+
+    def test_timeout(self):
+        service = HashingService(pool_size=1, queue_limit=0, timeout=0.1, retry_after=1)
+        self.addCleanup(service.shutdown)
+        with self.assertRaises(HashingUnavailable):
+            service._run('sleep', time.sleep, 0.5)
+
+
+class PasswordEndpointTests(APITestCase):
+    """
+    Tests on registration and token-auth through the hashing pool
+    """
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_register_and_authenticate(self):
+        data = {'username': 'pooled_user', 'password': 'pooled_password'}
+        response = self.client.post('/api/reviewers/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(User.objects.get(username='pooled_user').check_password('pooled_password'))
+
+        response = self.client.post('/api/token-auth/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('token', response.data)
+
+        data['password'] = 'wrong'
+        response = self.client.post('/api/token-auth/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_user_is_hashed(self):
+        data = {'username': 'nobody', 'password': 'secret'}
+        with mock.patch.object(hashing_service, 'make_password') as make_password:
+            response = self.client.post('/api/token-auth/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        make_password.assert_called_once_with('secret')
+
+    def test_saturated(self):
+        factories.UserFactory(username='busy_user')
+        data = {'username': 'busy_user', 'password': 'pw'}
+        with mock.patch.object(hashing_service, 'check_password',
+                               side_effect=HashingUnavailable(wait=2)):
+            response = self.client.post('/api/token-auth/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '2')
+
+    def test_saturated_admin_login(self):
+        factories.UserFactory(username='staff_user', password='pw', is_staff=True)
+        data = {'username': 'staff_user', 'password': 'pw'}
+        with mock.patch.object(hashing_service, 'check_password',
+                               side_effect=HashingUnavailable(wait=2)):
+            # hashed in the request thread instead
+            response = self.client.post('/admin/login/?next=/admin/', data)
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response['Location'], '/admin/')
@@ -0,0 +1,181 @@
+"""
+Tests on the background job queue
+"""
+import datetime
+import signal
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from api import jobs, stats
+from api.management.commands.run_workers import _run_worker
+from api.models import CompanyDailyRating, Job
+from api.tests import factories
+
+
+calls = []
+
+
+def record(payloads):
+    calls.append(payloads)
+    if 'fail' in payloads:
+        raise RuntimeError("bad payload")
+
+
+HANDLERS = {'record': 'api.tests.test_jobs.record', 'other': 'api.tests.test_jobs.record'}
+
+
+@override_settings(JOB_LEASE=60, JOB_RETRY_DELAY=10, JOB_MAX_RETRY_DELAY=25, JOB_MAX_ATTEMPTS=3)
+@mock.patch.dict(jobs.HANDLERS, HANDLERS)
+class JobQueueTests(TestCase):
+    """
+    Tests on api.jobs
+    """
+    def setUp(self):
+        del calls[:]
+
+    def test_enqueue_in_transaction(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue('record', 1)
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.exists())
+
+        with self.assertRaises(ValueError):
+            jobs.enqueue('no-such-kind', 1)
+
+    def test_claim_batches_by_kind(self):
+        for kind, payload in (('record', 1), ('other', 2), ('record', 3), ('record', 4)):
+            jobs.enqueue(kind, payload)
+        jobs.enqueue('record', 5, delay=60)
+
+        claimed = jobs.claim(batch_size=2)
+        self.assertEqual([(j.kind, j.payload) for j in claimed], [('record', '1'), ('record', '3')])
+        self.assertEqual([j.payload for j in jobs.claim(batch_size=10)], ['2'])
+        self.assertEqual([j.payload for j in jobs.claim(batch_size=10)], ['4'])
+        self.assertEqual(jobs.claim(batch_size=10), [])
+
+        # leases expire, and delayed jobs come due
+        later = timezone.now() + datetime.timedelta(seconds=61)
+        self.assertEqual([j.payload for j in jobs.claim(batch_size=10, now=later)], ['1', '3', '4', '5'])
+        self.assertEqual([j.payload for j in jobs.claim(batch_size=10, now=later)], ['2'])
+
+    def test_run_pending(self):
+        for payload in range(5):
+            jobs.enqueue('record', payload)
+        self.assertEqual(jobs.run_pending(batch_size=3), (5, 0))
+        self.assertEqual(calls, [[0, 1, 2], [3, 4]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failing_job_is_retried_alone(self):
+        for payload in (1, 'fail', 2):
+            jobs.enqueue('record', payload)
+        start = timezone.now()
+        self.assertEqual(jobs.run_pending(), (2, 1))
+        # the batch, then each job
+        self.assertEqual(calls, [[1, 'fail', 2], [1], ['fail'], [2]])
+
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("RuntimeError: bad payload", job.last_error)
+        self.assertGreaterEqual(job.run_at, start + datetime.timedelta(seconds=10))
+        self.assertEqual((job.locked_by, job.locked_until), ('', None))
+
+    def test_backoff_and_give_up(self):
+        self.assertEqual([jobs.retry_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 25])
+
+        job = jobs.enqueue('record', 'fail')
+        now = timezone.now()
+        for attempt in range(3):
+            now += datetime.timedelta(seconds=30)
+            jobs.run_batch(jobs.claim(10, now=now))
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.failed), (3, True))
+        self.assertEqual(jobs.claim(10, now=now + datetime.timedelta(days=1)), [])
+
+        self.assertEqual(jobs.retry(Job.objects.all()), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.attempts, job.failed), (0, False))
+
+    def test_lease_taken_over(self):
+        jobs.enqueue('record', 1)
+        first = jobs.claim(10)
+        second = jobs.claim(10, now=timezone.now() + datetime.timedelta(seconds=61))
+        self.assertEqual(len(second), 1)
+
+        # the first worker was too slow: its work is rolled back
+        self.assertEqual(jobs.run_batch(first), (0, 0))
+        self.assertEqual(jobs.run_batch(second), (1, 0))
+        self.assertFalse(Job.objects.exists())
+
+    def test_queue_stats(self):
+        jobs.enqueue('record', 1)
+        Job.objects.update(created=timezone.now() - datetime.timedelta(seconds=30))
+        jobs.enqueue('record', 2)
+        Job.objects.create(kind='other', payload='3', failed=True)
+
+        queue = jobs.queue_stats()
+        self.assertEqual(queue['record']['pending'], 2)
+        self.assertGreaterEqual(queue['record']['oldest_pending_seconds'], 30)
+        self.assertEqual(queue['other'], {'pending': 0, 'failed': 1, 'oldest_pending_seconds': None})
+
+    def test_run_workers_once(self):
+        jobs.enqueue('record', 'fail')
+        jobs.enqueue('record', 1)
+        out = StringIO()
+        call_command('run_workers', once=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "1 jobs done, 1 failed")
+
+    def test_worker_progress(self):
+        def work(stop, batch_size, log):
+            log("jobs-0: 2 record jobs done, 0 failed")
+
+        self.addCleanup(signal.signal, signal.SIGINT, signal.getsignal(signal.SIGINT))
+        err = StringIO()
+        with mock.patch('api.jobs.work', work), mock.patch('sys.stderr', err):
+            _run_worker(None, 10, verbose=True)
+        self.assertEqual(err.getvalue(), "jobs-0: 2 record jobs done, 0 failed\n")
+
+
+class DailyRatingJobTests(TestCase):
+    """
+    Tests on the daily-ratings jobs
+    """
+    def test_batch_is_merged(self):
+        company = factories.CompanyFactory(name='rated')
+        gone = factories.CompanyFactory(name='gone')
+        day = datetime.date(2019, 5, 1)
+        for rating in (4, 2):
+            stats.apply_rating_changes([(None, (company.pk, rating, day))])
+        stats.apply_rating_changes([((company.pk, 2, day), (company.pk, 5, day)),
+                                    (None, (gone.pk, 3, day))])
+        gone.delete()
+        self.assertEqual(Job.objects.filter(kind=stats.DAILY_RATINGS_JOB).count(), 3)
+
+        claimed = jobs.claim(10)
+        self.assertEqual(len(claimed), 3)
+        # savepoint, companies, one update and insert (savepoint, insert, release),
+        # delete jobs, release
+        with self.assertNumQueries(8):
+            self.assertEqual(jobs.run_batch(claimed), (3, 0))
+
+        row = CompanyDailyRating.objects.get()
+        self.assertEqual((row.company_id, row.day), (company.pk, day))
+        self.assertEqual((row.review_count, row.rating_sum, row.rating_2, row.rating_5), (2, 9, 0, 1))
+
+    def test_uncounted_review_fails(self):
+        company = factories.CompanyFactory(name='rated')
+        # a review from before the daily totals, deleted before they were backfilled
+        jobs.enqueue(stats.DAILY_RATINGS_JOB,
+                     [[company.pk, '2019-05-01', {'review_count': -1, 'rating_sum': -3, 'rating_3': -1}]])
+
+        self.assertEqual(jobs.run_pending(), (0, 1))
+        self.assertIn("IntegrityError", Job.objects.get().last_error)
+        self.assertEqual(jobs.queue_stats()[stats.DAILY_RATINGS_JOB]['pending'], 1)
+        self.assertFalse(CompanyDailyRating.objects.exists())
@@ -0,0 +1,158 @@
+"""
+Tests on the company leaderboards
+"""
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api import leaderboard
+from api.authentication import token_cache
+from api.models import CompanyDailyRating, CompanyRank, CompanyRatingStats
+from api.tests import factories
+
+
+def _rated(name, review_count, rating_sum):
+    company = factories.CompanyFactory(name=name)
+    CompanyRatingStats.objects.create(company=company, review_count=review_count,
+                                      rating_sum=rating_sum)
+    return company
+
+
+@override_settings(LEADERBOARD_PRIOR_WEIGHT=10, LEADERBOARD_MIN_REVIEWS=5, LEADERBOARD_RECENT_DAYS=7)
+class LeaderboardTestCase(TestCase):
+    """
+    Companies with rating totals
+    """
+    def setUp(self):
+        self.many = _rated('many', 100, 450)
+        self.few = _rated('few', 5, 22)
+        self.too_few = _rated('too_few', 3, 15)
+        self.low = _rated('low', 10, 20)
+
+        today = timezone.localdate()
+        for company, days_ago, review_count in ((self.many, 0, 2), (self.few, 6, 3),
+                                                (self.low, 7, 10)):
+            CompanyDailyRating.objects.create(company=company, review_count=review_count,
+                                              day=today - datetime.timedelta(days=days_ago))
+
+    def _board(self, board):
+        return list(CompanyRank.objects
+                    .filter(board=board)
+                    .order_by('rank')
+                    .values_list('rank', 'company__name', 'review_count'))
+
+
+class RebuildTests(LeaderboardTestCase):
+    """
+    Tests on leaderboard.rebuild
+    """
+    def test_top_rated(self):
+        self.assertEqual(leaderboard.rebuild(CompanyRank.TOP_RATED, batch_size=2), 3)
+        self.assertEqual(self._board(CompanyRank.TOP_RATED),
+                         [(1, 'many', 100), (2, 'few', 5), (3, 'low', 10)])
+
+        prior = 10 * 507 / 118
+        rank = CompanyRank.objects.get(board=CompanyRank.TOP_RATED, company=self.few)
+        self.assertAlmostEqual(rank.score, (prior + 22) / 15)
+
+    def test_most_reviewed(self):
+        leaderboard.rebuild(CompanyRank.MOST_REVIEWED)
+        self.assertEqual(self._board(CompanyRank.MOST_REVIEWED), [(1, 'few', 3), (2, 'many', 2)])
+
+    def test_replaces_previous_ranks(self):
+        CompanyRank.objects.create(board=CompanyRank.TOP_RATED, rank=1, company=self.too_few,
+                                   score=5, review_count=3, refreshed=timezone.now())
+        leaderboard.rebuild(CompanyRank.TOP_RATED)
+        self.assertFalse(CompanyRank.objects.filter(company=self.too_few).exists())
+
+    def test_no_reviews(self):
+        CompanyRatingStats.objects.all().delete()
+        CompanyDailyRating.objects.all().delete()
+        for board in leaderboard.BOARDS:
+            self.assertEqual(leaderboard.rebuild(board), 0)
+
+
+class RebuildLeaderboardsCommandTests(LeaderboardTestCase):
+    """
+    Tests on the rebuild_leaderboards command
+    """
+    def test_rebuild_all(self):
+        out = StringIO()
+        call_command('rebuild_leaderboards', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(),
+                         ["Ranked 3 companies on top-rated", "Ranked 2 companies on most-reviewed"])
+
+    def test_rebuild_one(self):
+        call_command('rebuild_leaderboards', 'most-reviewed', stdout=StringIO())
+        self.assertEqual(set(CompanyRank.objects.values_list('board', flat=True)),
+                         {CompanyRank.MOST_REVIEWED})
+
+    def test_unknown_board(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_leaderboards', 'worst-rated', stdout=StringIO())
+
+
+class LeaderboardApiTests(APITestCase, LeaderboardTestCase):
+    """
+    Tests on the leaderboard endpoints
+    """
+    def setUp(self):
+        super().setUp()
+        for board in leaderboard.BOARDS:
+            leaderboard.rebuild(board)
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_top_rated(self):
+        with self.assertNumQueries(2):  # token lookup + ranks with their companies
+            response = self.client.get('/api/companies/top-rated/', {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['board'], 'top-rated')
+        self.assertIsNotNone(response.data['refreshed'])
+        results = response.data['results']
+        self.assertEqual([(r['rank'], r['company']['name']) for r in results],
+                         [(1, 'many'), (2, 'few')])
+        self.assertEqual(results[0]['company']['ratings']['review_count'], 100)
+
+    def test_most_reviewed(self):
+        response = self.client.get('/api/companies/most-reviewed/')
+        self.assertEqual([(r['rank'], r['company']['name'], r['review_count'])
+                          for r in response.data['results']],
+                         [(1, 'few', 3), (2, 'many', 2)])
+
+    @override_settings(LEADERBOARD_MAX_LIMIT=1)
+    def test_limit(self):
+        response = self.client.get('/api/companies/top-rated/', {'limit': 50})
+        self.assertEqual(len(response.data['results']), 1)
+        response = self.client.get('/api/companies/top-rated/', {'limit': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_empty_board(self):
+        CompanyRank.objects.all().delete()
+        response = self.client.get('/api/companies/top-rated/')
+        self.assertEqual(response.data, {'board': 'top-rated', 'refreshed': None, 'results': []})
+
+    def test_company_ranks(self):
+        with self.assertNumQueries(3):  # token lookup + company + ranks
+            response = self.client.get('/api/companies/{}/ranks/'.format(self.low.pk))
+        self.assertEqual(response.data['top-rated']['rank'], 3)
+        self.assertIsNone(response.data['most-reviewed'])
+
+        response = self.client.get('/api/companies/{}/ranks/'.format(self.too_few.pk))
+        self.assertEqual(response.data, {'top-rated': None, 'most-reviewed': None})
+
+    def test_unknown_company(self):
+        response = self.client.get('/api/companies/0/ranks/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,121 @@
+"""
+Tests on the per-endpoint request metrics
+"""
+import json
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase, APIClient
+
+from api.authentication import token_cache
+from api.metrics import METRICS, EndpointStats, Histogram, endpoint_stats
+from api.models import CompanyRank
+from api.serializers import LeaderboardEntrySerializer
+from api.tests import factories
+
+
+class HistogramTests(TestCase):
+    """
+    Tests on Histogram
+    """
+    def test_summary(self):
+        histogram = Histogram(METRICS['total_ms'])
+        for value in [1] * 90 + [100] * 10:
+            histogram.observe(value)
+
+        summary = histogram.to_dict()
+        self.assertEqual(summary['count'], 100)
+        self.assertEqual(summary['min'], 1)
+        self.assertEqual(summary['max'], 100)
+        self.assertEqual(summary['p50'], 1)
+        self.assertEqual(summary['p99'], 100)
+
+    def test_merge(self):
+        first = Histogram(METRICS['queries'])
+        first.observe(0)
+        second = Histogram(METRICS['queries'])
+        second.observe(3)
+        second.observe(5000)
+
+        first.merge(Histogram.from_state(METRICS['queries'], second.to_state()))
+        summary = first.to_dict()
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['max'], 5000)
+        # above the largest bucket the maximum is reported
+        self.assertEqual(summary['p99'], 5000)
+
+
+class EndpointStatsTests(APITestCase):
+    """
+    Tests on EndpointStatsMiddleware and the report endpoint and command
+    """
+    def setUp(self):
+        endpoint_stats.reset()
+        self.user = factories.UserFactory(username='stats_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+        cache.delete_many([EndpointStats.registry_key, 'api:endpoint-stats:other'])
+        endpoint_stats.reset()
+
+    def test_records_route(self):
+        factories.ReviewFactory(reviewer=self.user.reviewer)
+        self.client.get('/api/reviews/')
+        self.client.get('/api/no-such-page/')
+
+        report = endpoint_stats.report(include_published=False)
+        self.assertIn('unmatched', report)
+        review_list = report['review-list']
+        self.assertEqual(review_list['queries']['count'], 1)
+        self.assertGreater(review_list['queries']['max'], 0)
+        self.assertGreater(review_list['response_bytes']['max'], 0)
+        self.assertGreater(review_list['render_ms']['max'], 0)
+        self.assertGreater(review_list['serialize_ms']['max'], 0)
+
+    def test_serialize_time_of_nested_serializers(self):
+        now = timezone.now()
+        ranks = [CompanyRank.objects.create(board=CompanyRank.TOP_RATED, rank=rank, score=1,
+                                            review_count=1, refreshed=now,
+                                            company=factories.CompanyFactory(name='c%d' % rank))
+                 for rank in (1, 2)]
+        request = Request(APIRequestFactory().get('/api/companies/leaderboard/'))
+        serializer = LeaderboardEntrySerializer(ranks, many=True, context={'request': request})
+        with mock.patch('api.metrics.add_serialize_time') as add_serialize_time:
+            self.assertEqual(len(serializer.data), 2)
+        # once per entry, the nested companies are part of their entry
+        self.assertEqual(add_serialize_time.call_count, 2)
+
+    def test_staff_only(self):
+        response = self.client.get('/api/stats/endpoints/')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get('/api/stats/endpoints/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('endpoint-stats', response.data['endpoints'])
+
+    def test_command_merges_published(self):
+        other = Histogram(METRICS['queries'])
+        other.observe(7)
+        cache.set('api:endpoint-stats:other', {'company-list': {'queries': other.to_state()}})
+        cache.set(EndpointStats.registry_key, {'api:endpoint-stats:other'})
+
+        self.client.get('/api/companies/')
+        out = StringIO()
+        call_command('dump_endpoint_stats', '--route', 'company-list', stdout=out)
+
+        report = json.loads(out.getvalue())
+        self.assertEqual(list(report), ['company-list'])
+        self.assertEqual(report['company-list']['queries']['count'], 2)
+        self.assertEqual(report['company-list']['queries']['max'], 7)
@@ -0,0 +1,118 @@
+"""
+Tests on the keyset pagination of the list endpoints
+"""
+import datetime
+from unittest import mock
+
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api.models import Review
+from api.pagination import ReviewPagination
+from api.tests import factories
+
+
+class ReviewPaginationTests(APITestCase):
+    """
+    Tests on paging through the review list
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        # several reviews share a submission date so the id tie-break matters
+        submitted = timezone.now()
+        for i in range(7):
+            review = factories.ReviewFactory(
+                reviewer=self.user.reviewer, title='review_%d' % i)
+            Review.objects.filter(pk=review.pk).update(
+                submission_date=submitted + datetime.timedelta(seconds=i // 2))
+
+        self.expected = list(Review.objects.order_by(
+            'submission_date', 'id').values_list('title', flat=True))
+
+    def _titles(self, response):
+        return [r['title'] for r in response.data['results']]
+
+    def test_pages_forward_and_back(self):
+        response = self.client.get('/api/reviews/', {'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._titles(response), self.expected[:3])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self._titles(response), self.expected[3:6])
+
+        last = self.client.get(response.data['next'])
+        self.assertEqual(self._titles(last), self.expected[6:])
+        self.assertIsNone(last.data['next'])
+
+        # and back again
+        response = self.client.get(last.data['previous'])
+        self.assertEqual(self._titles(response), self.expected[3:6])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self._titles(response), self.expected[:3])
+        self.assertIsNone(response.data['previous'])
+
+    @mock.patch.object(ReviewPagination, 'max_page_size', 2)
+    def test_page_size_is_capped(self):
+        response = self.client.get('/api/reviews/', {'page_size': 50})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/reviews/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_ordering(self):
+        for i, review in enumerate(Review.objects.order_by('id')):
+            Review.objects.filter(pk=review.pk).update(rating=1 + i % 3)
+        expected = list(Review.objects.order_by('-rating', '-id').values_list('title', flat=True))
+
+        response = self.client.get('/api/reviews/', {'page_size': 4, 'ordering': '-rating'})
+        self.assertEqual(self._titles(response), expected[:4])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self._titles(response), expected[4:])
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self._titles(response), expected[:4])
+
+    def test_unknown_ordering(self):
+        response = self.client.get('/api/reviews/', {'ordering': 'summary'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('ordering', response.data)
+
+
+class CompanyPaginationTests(APITestCase):
+    """
+    Tests on paging through the company list
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+        for name in ['delta', 'alpha', 'charlie', 'bravo', 'alpha']:
+            factories.CompanyFactory(name=name)
+
+    def test_pages_in_name_order(self):
+        names = []
+        url = '/api/companies/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            names.extend(c['name'] for c in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(names, ['alpha', 'alpha', 'bravo', 'charlie', 'delta'])
+
+    def test_descending_name_order(self):
+        response = self.client.get('/api/companies/', {'page_size': 3, 'ordering': '-name'})
+        names = [c['name'] for c in response.data['results']]
+        response = self.client.get(response.data['next'])
+        names.extend(c['name'] for c in response.data['results'])
+
+        self.assertEqual(names, ['delta', 'charlie', 'bravo', 'alpha', 'alpha'])
@@ -0,0 +1,92 @@
+"""
+Tests that every filter and ordering combination of the list endpoints
+is answered from an index, on SQLite
+"""
+import itertools
+import unittest
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Review
+from api.pagination import CompanyPagination, ReviewPagination
+from api.tests import factories
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite's")
+class QueryPlanTests(TestCase):
+    """
+    The query plans of the list endpoints may neither scan a whole table
+    nor sort the rows in a temporary b-tree, for the first and next pages
+    of every combination of the supported filters and orderings
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='plan_user')
+        self.company = factories.CompanyFactory(name='acme')
+        factories.CompanyFactory(name='acme corp')
+        # enough matching rows for a next page of every combination
+        for _ in range(3):
+            review = factories.ReviewFactory(reviewer=self.user.reviewer, company=self.company,
+                                             rating=3)
+            Review.objects.filter(pk=review.pk).update(submission_date='2019-05-10 12:00:00Z')
+        factories.ReviewFactory(company=self.company)
+
+    def _plan_problems(self, url, table):
+        """
+        GET the url as plan_user, page_size=1, then its next page
+        :return: list of (url, sql, plan line) tuples for each bad plan line
+        """
+        problems = []
+        while url:
+            request = APIRequestFactory().get(url, SERVER_NAME='localhost')
+            force_authenticate(request, user=self.user)
+            match = resolve(request.path)
+            with CaptureQueriesContext(connection) as ctx:
+                response = match.func(request, *match.args, **match.kwargs)
+            self.assertEqual(response.status_code, 200, url)
+
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or 'FROM "%s"' % table not in sql:
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                    for row in cursor.fetchall():
+                        detail = row[-1]
+                        if ((detail.startswith('SCAN') and 'INDEX' not in detail)
+                                or 'TEMP B-TREE' in detail):
+                            problems.append((url, sql, detail))
+
+            url = response.data['next'] if '&cursor=' not in url else None
+        return problems
+
+    @staticmethod
+    def _combinations(params):
+        for count in range(len(params) + 1):
+            for names in itertools.combinations(sorted(params), count):
+                yield {name: params[name] for name in names}
+
+    def _url(self, path, params, ordering):
+        query = '&'.join('%s=%s' % item for item in sorted(params.items()))
+        return '%s?page_size=1&ordering=%s%s' % (path, ordering, '&' + query if query else '')
+
+    def test_review_list(self):
+        filters = {'rating_min': 2, 'rating_max': 4, 'company': self.company.pk,
+                   'submitted_from': '2019-05-01', 'submitted_to': '2019-05-31'}
+        problems = []
+        for params in self._combinations(filters):
+            for ordering in ReviewPagination.orderings:
+                problems.extend(self._plan_problems(self._url('/api/reviews/', params, ordering),
+                                                    'api_review'))
+        self.assertEqual(problems, [])
+
+    def test_company_list(self):
+        problems = []
+        for params in self._combinations({'name': 'acme'}):
+            for ordering in CompanyPagination.orderings:
+                problems.extend(self._plan_problems(self._url('/api/companies/', params, ordering),
+                                                    'api_company'))
+        self.assertEqual(problems, [])
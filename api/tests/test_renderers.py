@@ -0,0 +1,75 @@
+"""
+Tests on the fast JSON renderer and parser
+"""
+import datetime
+import decimal
+import io
+from collections import OrderedDict
+
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+from benchmarks import renderers as renderer_benchmark
+
+
+class FastJSONRendererTests(TestCase):
+    """
+    Tests on FastJSONRenderer
+    """
+    def assertRendersAsDRF(self, data, accepted_media_type='application/json'):
+        self.assertEqual(FastJSONRenderer().render(data, accepted_media_type),
+                         JSONRenderer().render(data, accepted_media_type))
+
+    def test_same_output(self):
+        self.assertRendersAsDRF(OrderedDict([
+            ('text', 'café </script> \u2028 \u2029'),
+            ('numbers', [1, 2.5, None, True]),
+            ('histogram', {'1': 0, '5': 3}),
+            ('utc', datetime.datetime(2019, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)),
+            ('naive', datetime.datetime(2019, 5, 1, 12, 30)),
+            ('date', datetime.date(2019, 5, 1)),
+            ('decimal', decimal.Decimal('4.50')),
+            ('lazy', ugettext_lazy('Invalid cursor')),
+        ]))
+
+    def test_indent(self):
+        self.assertRendersAsDRF({'a': [1, 2]}, 'application/json; indent=4')
+
+    def test_large_integer(self):
+        self.assertRendersAsDRF({'big': 2 ** 70})
+
+    def test_none(self):
+        self.assertEqual(FastJSONRenderer().render(None), b'')
+
+
+class FastJSONParserTests(TestCase):
+    """
+    Tests on FastJSONParser
+    """
+    def test_parse(self):
+        body = '{"title": "café", "rating": 5}'
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body.encode('utf-8'))),
+                         {'title': 'café', 'rating': 5})
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body.encode('latin-1')),
+                                                parser_context={'encoding': 'latin-1'}),
+                         {'title': 'café', 'rating': 5})
+
+    def test_invalid(self):
+        for body in (b'{"title": ', b'[NaN]', b'\xff'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+
+class RendererBenchmarkTests(TestCase):
+    """
+    Tests on benchmarks.renderers
+    """
+    def test_run(self):
+        report = renderer_benchmark.run(reviews=20, repeat=2)
+        self.assertEqual(report['drf']['bytes'], report['fast']['bytes'])
+        self.assertGreater(report['fast']['render_ms'], 0)
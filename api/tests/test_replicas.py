@@ -0,0 +1,118 @@
+"""
+Tests on read replica routing
+"""
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from api.middleware import ReplicaReadMiddleware
+from api.models import Review
+from api.replicas import ReplicaRouter, replica_reads
+
+
+REPLICAS = ['replica_1', 'replica_2']
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTests(SimpleTestCase):
+    """
+    Tests on ReplicaRouter
+    """
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_reads(self):
+        self.assertEqual(self.router.db_for_read(Review), 'default')
+        with replica_reads():
+            self.assertIn(self.router.db_for_read(Review), REPLICAS)
+        self.assertEqual(self.router.db_for_read(Review), 'default')
+
+    def test_one_replica_per_block(self):
+        chosen = set()
+        for _ in range(20):
+            with replica_reads():
+                reads = {self.router.db_for_read(Review) for _ in range(10)}
+            self.assertEqual(len(reads), 1)
+            chosen |= reads
+        # still spread over the replicas
+        self.assertEqual(chosen, set(REPLICAS))
+
+    def test_writes_and_migrations(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(Review), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+        self.assertFalse(self.router.allow_migrate('replica_1', 'api'))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Review), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=REPLICAS, DATABASE_REPLICA_PIN_SECONDS=5)
+class ReplicaReadMiddlewareTests(SimpleTestCase):
+    """
+    Tests on ReplicaReadMiddleware
+    """
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+        self.reads = []
+
+        def get_response(request):
+            self.reads.append(self.router.db_for_read(Review))
+            return HttpResponse()
+
+        self.middleware = ReplicaReadMiddleware(get_response)
+
+    def _get(self, token='first'):
+        self.middleware(self.factory.get('/api/reviews/', HTTP_AUTHORIZATION='Token ' + token))
+        return self.reads[-1]
+
+    def test_reads_follow_writes(self):
+        self.assertIn(self._get(), REPLICAS)
+
+        self.middleware(self.factory.post('/api/reviews/', HTTP_AUTHORIZATION='Token first'))
+        self.assertEqual(self.reads[-1], 'default')
+
+        # the writer reads their writes, other clients still use the replicas
+        self.assertEqual(self._get(), 'default')
+        self.assertIn(self._get('second'), REPLICAS)
+
+        cache.clear()
+        self.assertIn(self._get(), REPLICAS)
+
+    def test_streaming(self):
+        def stream():
+            yield self.router.db_for_read(Review)
+
+        middleware = ReplicaReadMiddleware(lambda request: StreamingHttpResponse(stream()))
+        response = middleware(self.factory.get('/api/reviews/export/ndjson/'))
+        self.assertIn(b''.join(response.streaming_content).decode(), REPLICAS)
+        self.assertEqual(self.router.db_for_read(Review), 'default')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_not_used_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaReadMiddleware(lambda request: HttpResponse())
+
+
+class SyncSQLiteReplicasTests(SimpleTestCase):
+    """
+    Tests on sync_sqlite_replicas
+    """
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_sqlite_replicas', stdout=StringIO())
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_refuses_primary(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_sqlite_replicas', stdout=StringIO())
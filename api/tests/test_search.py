@@ -0,0 +1,137 @@
+"""
+Tests on the full-text review search
+"""
+from django.db import connection
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api.authentication import token_cache
+from api.models import Review
+from api.search import fts_match_expression, install_search_index, search_reviews
+from api.tests import factories
+
+
+class ReviewSearchTests(APITestCase):
+    """
+    Tests on ?q= search of the review list and the company review search
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='search_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='search_company')
+        reviewer = self.user.reviewer
+
+        self.best = factories.ReviewFactory(reviewer=reviewer, company=self.company,
+                                            title='great coffee',
+                                            summary='the coffee is great, coffee all day')
+        self.other = factories.ReviewFactory(reviewer=reviewer, company=self.company,
+                                             title='slow service',
+                                             summary='good coffee but slow')
+        factories.ReviewFactory(reviewer=reviewer, company=self.company,
+                                title='parking', summary='no parking at all')
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _titles(self, response):
+        return [review['title'] for review in response.data['results']]
+
+    def test_ranked(self):
+        response = self.client.get('/api/reviews/', {'q': 'coffee'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._titles(response), ['great coffee', 'slow service'])
+
+    def test_every_word(self):
+        response = self.client.get('/api/reviews/', {'q': 'Coffee, slow!'})
+        self.assertEqual(self._titles(response), ['slow service'])
+
+        # stemmed
+        response = self.client.get('/api/reviews/', {'q': 'parked'})
+        self.assertEqual(self._titles(response), ['parking'])
+
+    def test_only_own_reviews(self):
+        factories.ReviewFactory(company=self.company, title='coffee again', summary='coffee')
+        response = self.client.get('/api/reviews/', {'q': 'coffee'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_paginated(self):
+        response = self.client.get('/api/reviews/', {'q': 'coffee', 'page_size': 1})
+        self.assertEqual(self._titles(response), ['great coffee'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self._titles(response), ['slow service'])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self._titles(response), ['great coffee'])
+
+    def test_kept_in_sync(self):
+        self.other.summary = 'tea'
+        self.other.title = 'tea'
+        self.other.save()
+        self.best.delete()
+        factories.ReviewFactory(reviewer=self.user.reviewer, company=self.company,
+                                title='coffee', summary='new')
+
+        response = self.client.get('/api/reviews/', {'q': 'coffee'})
+        self.assertEqual(self._titles(response), ['coffee'])
+
+    def test_company_search(self):
+        other_company = factories.CompanyFactory(name='other_company')
+        factories.ReviewFactory(company=other_company, title='coffee', summary='coffee')
+        factories.ReviewFactory(company=self.company, title='more coffee', summary='x')
+
+        url = '/api/companies/{}/reviews/search/'.format(self.company.pk)
+        response = self.client.get(url, {'q': 'coffee'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+
+        # the public view of a review, as in the company's review feed
+        for review in response.data['results']:
+            self.assertNotIn('ip_address', review)
+            self.assertNotIn('reviewer', review)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get('/api/companies/0/reviews/search/', {'q': 'coffee'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_numbers_only_match_text(self):
+        # the index also has the company and reviewer ids
+        url = '/api/companies/{}/reviews/search/'.format(self.company.pk)
+        for number in (self.company.pk, self.user.reviewer.pk):
+            response = self.client.get(url, {'q': str(number)})
+            self.assertEqual(response.data['results'], [], number)
+            response = self.client.get('/api/reviews/', {'q': str(number)})
+            self.assertEqual(response.data['results'], [], number)
+
+        factories.ReviewFactory(reviewer=self.user.reviewer, company=self.company,
+                                title='open 24 hours', summary='x')
+        response = self.client.get(url, {'q': '24'})
+        self.assertEqual(self._titles(response), ['open 24 hours'])
+
+    def test_no_words(self):
+        self.assertIsNone(fts_match_expression('  "* - '))
+        self.assertEqual(fts_match_expression('a AND "b"'),
+                         '{title summary}:"a" {title summary}:"AND" {title summary}:"b"')
+        self.assertEqual(fts_match_expression('a', {'company_id': 3}),
+                         '{title summary}:"a" company_id:"3"')
+        with self.assertRaises(ValueError):
+            fts_match_expression('a', {'title': 3})
+
+        response = self.client.get('/api/reviews/', {'q': '"*'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_reinstall_after_rebuild(self):
+        if connection.vendor != 'sqlite':  # pragma: no cover
+            self.skipTest("SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER api_review_fts_insert")
+        factories.ReviewFactory(company=self.company, title='missed', summary='missed')
+
+        install_search_index(connection)
+        self.assertEqual(len(search_reviews(Review.objects.all(), 'missed')), 1)
@@ -4,8 +4,11 @@ Tests on custom serializer methods
 from unittest import mock
 
 from django.test import TestCase
+from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
 
+from api.models import Review
 from api.serializers import ReviewSerializer, ReviewerSerializer
 from api.tests import factories
 
@@ -192,3 +195,40 @@ class ReviewerSerializerTests(TestCase):
         self.assertEqual(ret.first_name, 'only_fn')
         self.assertEqual(ret.last_name, 'only_ln')
         self.assertEqual(ret.reviewer.bio, "test bio")
+
+
+class FastHyperlinkTests(TestCase):
+    """
+    Tests that the fast hyperlinked fields render the same urls as DRF's
+    """
+    def test_same_output_as_reverse(self):
+        user = factories.UserFactory(username='link_user')
+        reviews = [factories.ReviewFactory(reviewer=user.reviewer) for _ in range(3)]
+        request = APIRequestFactory().get('/api/reviews/', SERVER_NAME='localhost')
+
+        class SlowReviewSerializer(ReviewSerializer):
+            serializer_related_field = serializers.HyperlinkedRelatedField
+            serializer_url_field = serializers.HyperlinkedIdentityField
+            reviewer = serializers.HyperlinkedRelatedField(
+                read_only=True, view_name='reviewer-detail')
+
+        context = {'request': request}
+        fast = ReviewSerializer(reviews, many=True, context=context).data
+        slow = SlowReviewSerializer(reviews, many=True, context={'request': request}).data
+        self.assertEqual(fast, slow)
+        self.assertEqual(fast[0]['url'],
+                         'http://localhost/api/reviews/{}/'.format(reviews[0].pk))
+
+        # one template per view name for the whole list
+        self.assertEqual(set(context['url_templates']),
+                         {'review-detail', 'company-detail', 'reviewer-detail'})
+
+    def test_list_does_not_query_per_row(self):
+        user = factories.UserFactory(username='list_user')
+        for _ in range(5):
+            factories.ReviewFactory(reviewer=user.reviewer)
+        request = APIRequestFactory().get('/api/reviews/', SERVER_NAME='localhost')
+
+        with self.assertNumQueries(1):
+            ReviewSerializer(Review.objects.all(), many=True,
+                             context={'request': request}).data
@@ -0,0 +1,159 @@
+"""
+Tests on the per-company rating totals
+"""
+import datetime
+import importlib
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api import stats
+from api.models import CompanyRatingStats, Review
+from api.tests import factories
+from api.views import ReviewDetailView
+
+
+class CollectRatingDeltasTests(TestCase):
+    """
+    Tests on folding review changes into deltas
+    """
+    def test_collect_rating_deltas(self):
+        changes = [
+            (None, (1, 5)),     # new review
+            ((1, 5), (1, 3)),   # rating change
+            ((2, 4), None),     # deleted review
+            ((1, 2), (2, 2)),   # moved company
+            ((3, 1), (3, 1)),   # no change
+        ]
+        ret = stats.collect_rating_deltas(changes)
+        self.assertEqual(ret, {
+            1: {'rating_sum': 1, 'rating_3': 1, 'rating_2': -1},
+            2: {'rating_sum': -2, 'rating_4': -1, 'rating_2': 1},
+        })
+
+
+class RatingStatsApiTests(APITestCase):
+    """
+    Tests that the totals follow review writes through the API
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='rated')
+        self.company_url = 'http://testserver/api/companies/{}/'.format(self.company.pk)
+
+    def _stats(self):
+        return CompanyRatingStats.objects.get(company=self.company)
+
+    def test_create_update_delete(self):
+        data = {'rating': 4, 'title': 't', 'summary': 's', 'company': self.company_url}
+        response = self.client.post('/api/reviews/', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/reviews/', dict(data, rating=2), format='json')
+        review_url = response.data['url']
+
+        stats_row = self._stats()
+        self.assertEqual((stats_row.review_count, stats_row.rating_sum), (2, 6))
+        self.assertEqual(stats_row.histogram, {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0})
+
+        self.client.patch(review_url, {'rating': 5}, format='json')
+        stats_row = self._stats()
+        self.assertEqual((stats_row.review_count, stats_row.rating_sum), (2, 9))
+        self.assertEqual((stats_row.rating_2, stats_row.rating_5), (0, 1))
+
+        response = self.client.delete(review_url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        stats_row = self._stats()
+        self.assertEqual((stats_row.review_count, stats_row.rating_sum), (1, 4))
+        self.assertEqual(stats_row.average_rating, 4)
+
+    def test_concurrent_writes(self):
+        data = {'rating': 4, 'title': 't', 'summary': 's', 'company': self.company_url}
+        review_url = self.client.post('/api/reviews/', data, format='json').data['url']
+        # as read by a request that another one overtakes
+        stale = Review.objects.get()
+        self.client.patch(review_url, {'rating': 1}, format='json')
+
+        with mock.patch.object(ReviewDetailView, 'get_object', return_value=stale):
+            response = self.client.patch(review_url, {'rating': 5}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            stats_row = self._stats()
+            self.assertEqual((stats_row.review_count, stats_row.rating_sum), (1, 5))
+            self.assertEqual((stats_row.rating_1, stats_row.rating_4, stats_row.rating_5), (0, 0, 1))
+
+            self.client.delete(review_url)
+            response = self.client.delete(review_url)
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+            self.assertEqual((self._stats().review_count, self._stats().rating_sum), (0, 0))
+
+            response = self.client.patch(review_url, {'rating': 2}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Review.objects.exists())
+
+    def test_uncounted_review(self):
+        review = factories.ReviewFactory(company=self.company, rating=3)
+        CompanyRatingStats.objects.all().delete()
+        with self.assertRaises(IntegrityError):
+            stats.apply_rating_changes([(stats.rating_key(review), None)])
+        self.assertFalse(CompanyRatingStats.objects.exists())
+
+    def test_company_list_has_ratings(self):
+        factories.CompanyFactory(name='unrated')
+        stats.apply_rating_changes([(None, (self.company.pk, 3, datetime.date(2019, 5, 1)))])
+
+        with self.assertNumQueries(2):  # token lookup + company page
+            response = self.client.get('/api/companies/')
+
+        ratings = {c['name']: c['ratings'] for c in response.data['results']}
+        self.assertEqual(ratings['rated']['review_count'], 1)
+        self.assertEqual(ratings['rated']['average_rating'], 3.0)
+        self.assertEqual(ratings['unrated']['review_count'], 0)
+        self.assertIsNone(ratings['unrated']['average_rating'])
+
+
+class RebuildRatingStatsTests(TestCase):
+    """
+    Tests on the rebuild_rating_stats command
+    """
+    def test_rebuild(self):
+        company = factories.CompanyFactory(name='c1')
+        company2 = factories.CompanyFactory(name='c2')
+        factories.CompanyFactory(name='no_reviews')
+        for rating in [1, 5, 5]:
+            factories.ReviewFactory(company=company, rating=rating)
+        factories.ReviewFactory(company=company2, rating=3)
+
+        # stale row that should be corrected, missing row that should be created
+        CompanyRatingStats.objects.filter(company=company).update(review_count=10)
+        CompanyRatingStats.objects.filter(company=company2).delete()
+
+        call_command('rebuild_rating_stats', chunk_size=1, stdout=StringIO())
+
+        row = CompanyRatingStats.objects.get(company=company)
+        self.assertEqual((row.review_count, row.rating_sum), (3, 11))
+        self.assertEqual(row.histogram, {'1': 1, '2': 0, '3': 0, '4': 0, '5': 2})
+        row = CompanyRatingStats.objects.get(company=company2)
+        self.assertEqual((row.review_count, row.rating_3), (1, 1))
+        self.assertEqual(CompanyRatingStats.objects.count(), 2)
+
+    def test_migration_backfill(self):
+        company = factories.CompanyFactory(name='c1')
+        for rating in [2, 4]:
+            factories.ReviewFactory(company=company, rating=rating)
+        # written before the totals were kept
+        CompanyRatingStats.objects.all().delete()
+
+        migration = importlib.import_module('api.migrations.0011_backfill_company_rating_stats')
+        migration.backfill_rating_stats(apps, None)
+
+        row = CompanyRatingStats.objects.get(company=company)
+        self.assertEqual((row.review_count, row.rating_sum, row.rating_2, row.rating_4), (2, 6, 1, 1))
@@ -0,0 +1,111 @@
+"""
+Tests on request throttling
+"""
+import time
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIClient
+
+from api import throttling
+from api.authentication import token_cache
+from api.tests import factories
+
+
+class SlidingWindowTests(TestCase):
+    """
+    Tests on throttling.hit and parse_rate
+    """
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('10/min'), (10, 60))
+        self.assertEqual(throttling.parse_rate('3/hour'), (3, 3600))
+        self.assertIsNone(throttling.parse_rate('none'))
+        with self.assertRaises(ValueError):
+            throttling.parse_rate('often')
+
+    def test_window_slides(self):
+        # window 10 covers 600 to 660
+        for _ in range(3):
+            self.assertIsNone(throttling.hit('test', 3, 60, now=610))
+        # 40s until window 11, then 15s until 3 of the 4 hits have slid out
+        self.assertAlmostEqual(throttling.hit('test', 3, 60, now=620), 55)
+
+        # at 705 a quarter of window 10 still overlaps: its 4 hits count as 1
+        self.assertIsNone(throttling.hit('test', 3, 60, now=705))
+        self.assertIsNone(throttling.hit('test', 3, 60, now=705))
+        self.assertAlmostEqual(throttling.hit('test', 3, 60, now=705), 15)
+
+
+@override_settings(THROTTLE_RATES={
+    'ip.default': '5/min',
+    'ip.review-list.post': '2/min',
+    'reviewer.review-list': '3/min',
+    'ip.company-list': 'none',
+})
+class ThrottleTests(APITestCase):
+    """
+    Tests on SlidingWindowThrottle
+    """
+    def setUp(self):
+        cache.clear()
+        self.company = factories.CompanyFactory()
+        self.reviewer = factories.ReviewerFactory(user__username='throttle_user')
+        self.token, _ = Token.objects.get_or_create(user=self.reviewer.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _post_review(self, ip_address):
+        data = {'rating': 4, 'title': 'title', 'summary': 'summary',
+                'company': 'http://testserver/api/companies/{}/'.format(self.company.pk)}
+        return self.client.post('/api/reviews/', data, format='json',
+                                HTTP_X_FORWARDED_FOR=ip_address)
+
+    def test_post_limited_per_ip(self):
+        self.assertEqual(self._post_review('10.0.0.1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._post_review('10.0.0.1, 10.0.0.9').status_code,
+                         status.HTTP_201_CREATED)
+        response = self._post_review('10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # the reviewer has one request left on review-list
+        self.assertEqual(self._post_review('10.0.0.2').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_reviewer_limit_and_route_override(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/api/reviews/').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/reviews/').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # not counted against the default
+        for _ in range(6):
+            self.assertEqual(self.client.get('/api/companies/').status_code, status.HTTP_200_OK)
+
+    def test_default_limit_is_shared(self):
+        anonymous = APIClient()
+        url = '/api/companies/{}/reviews/'.format(self.company.pk)
+        for _ in range(5):
+            self.assertEqual(anonymous.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(anonymous.get(url + '?page_size=1').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_overhead(self):
+        throttle = throttling.SlidingWindowThrottle()
+        request = Request(RequestFactory().get('/api/companies/1/reviews/'))
+        request.resolver_match = type('Match', (), {'url_name': 'company-review-list'})()
+        request.user = self.reviewer.user
+        request.auth = self.token
+
+        start = time.perf_counter()
+        for _ in range(1000):
+            throttle.allow_request(request, None)
+        self.assertLess((time.perf_counter() - start) / 1000, 0.001)
@@ -0,0 +1,185 @@
+"""
+Tests on the daily rating totals and the company trends endpoint
+"""
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase, APIClient
+
+from api import jobs, stats
+from api.authentication import token_cache
+from api.models import CompanyDailyRating, Job, Review
+from api.tests import factories
+
+
+def _review_on(company, day, rating):
+    """
+    Create a review submitted on the given day
+    (submission_date is auto_now_add, so it is set after the insert)
+    """
+    review = factories.ReviewFactory(company=company, rating=rating)
+    submitted = datetime.datetime.combine(day, datetime.time(12), tzinfo=datetime.timezone.utc)
+    Review.objects.filter(pk=review.pk).update(submission_date=submitted)
+    return review
+
+
+class CollectDailyDeltasTests(TestCase):
+    """
+    Tests on folding review changes into per-day deltas
+    """
+    def test_collect_daily_deltas(self):
+        day1, day2 = datetime.date(2019, 5, 1), datetime.date(2019, 5, 2)
+        ret = stats.collect_daily_deltas([
+            (None, (1, 5, day1)),
+            (None, (1, 4, day2)),
+            ((1, 5, day1), (1, 3, day1)),
+            ((2, 4, day1), None),
+        ])
+        self.assertEqual(ret, {
+            (1, day1): {'review_count': 1, 'rating_sum': 3, 'rating_3': 1},
+            (1, day2): {'review_count': 1, 'rating_sum': 4, 'rating_4': 1},
+            (2, day1): {'review_count': -1, 'rating_sum': -4, 'rating_4': -1},
+        })
+
+
+class DailyRatingApiTests(APITestCase):
+    """
+    Tests that the daily totals follow review writes through the API
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='rated')
+        self.company_url = 'http://testserver/api/companies/{}/'.format(self.company.pk)
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def test_create_update_delete(self):
+        data = {'rating': 4, 'title': 't', 'summary': 's', 'company': self.company_url}
+        self.client.post('/api/reviews/', data, format='json')
+        response = self.client.post('/api/reviews/', dict(data, rating=2), format='json')
+        review_url = response.data['url']
+
+        # applied by the background jobs
+        self.assertFalse(CompanyDailyRating.objects.exists())
+        self.assertEqual(jobs.run_pending(), (2, 0))
+        row = CompanyDailyRating.objects.get(company=self.company)
+        self.assertEqual((row.review_count, row.rating_sum), (2, 6))
+
+        self.client.patch(review_url, {'rating': 5}, format='json')
+        jobs.run_pending()
+        row = CompanyDailyRating.objects.get(company=self.company)
+        self.assertEqual((row.review_count, row.rating_sum, row.rating_2, row.rating_5),
+                         (2, 9, 0, 1))
+
+        self.client.delete(review_url)
+        jobs.run_pending()
+        row = CompanyDailyRating.objects.get(company=self.company)
+        self.assertEqual((row.review_count, row.rating_sum), (1, 4))
+
+
+class CompanyTrendViewTests(APITestCase):
+    """
+    Tests on the company trends endpoint
+    """
+    def setUp(self):
+        self.user = factories.UserFactory(username='request_user')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.company = factories.CompanyFactory(name='rated')
+        self.url = '/api/companies/{}/trends/'.format(self.company.pk)
+        # Wednesday, Thursday, the next Monday and the next month
+        for day, rating in (((2019, 5, 1), 5), ((2019, 5, 2), 3), ((2019, 5, 2), 4),
+                            ((2019, 5, 6), 1), ((2019, 6, 3), 2)):
+            _review_on(self.company, datetime.date(*day), rating)
+        _review_on(factories.CompanyFactory(name='other'), datetime.date(2019, 5, 1), 1)
+        call_command('backfill_daily_ratings', stdout=StringIO())
+
+    def tearDown(self):
+        token_cache.invalidate(self.token.key)
+
+    def _buckets(self, response):
+        return [(r['start'], r['review_count'], r['average_rating'])
+                for r in response.data['results']]
+
+    def test_days(self):
+        with self.assertNumQueries(3):  # token lookup + company + daily totals
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['bucket'], 'day')
+        self.assertEqual(self._buckets(response), [
+            ('2019-05-01', 1, 5.0), ('2019-05-02', 2, 3.5),
+            ('2019-05-06', 1, 1.0), ('2019-06-03', 1, 2.0),
+        ])
+        self.assertEqual(response.data['results'][1]['histogram'],
+                         {'1': 0, '2': 0, '3': 1, '4': 1, '5': 0})
+
+    def test_weeks(self):
+        response = self.client.get(self.url, {'bucket': 'week'})
+        self.assertEqual(self._buckets(response), [
+            ('2019-04-29', 3, 4.0), ('2019-05-06', 1, 1.0), ('2019-06-03', 1, 2.0),
+        ])
+
+    def test_months(self):
+        response = self.client.get(self.url, {'bucket': 'month'})
+        self.assertEqual(self._buckets(response), [('2019-05-01', 4, 3.25), ('2019-06-01', 1, 2.0)])
+        self.assertEqual(response.data['results'][0]['histogram'],
+                         {'1': 1, '2': 0, '3': 1, '4': 1, '5': 1})
+
+    def test_range(self):
+        response = self.client.get(self.url, {'bucket': 'month', 'start': '2019-05-02',
+                                              'end': '2019-05-31'})
+        self.assertEqual(self._buckets(response), [('2019-05-01', 3, 8 / 3)])
+
+    def test_invalid_parameters(self):
+        for params in ({'bucket': 'year'}, {'start': 'yesterday'},
+                       {'start': '2019-06-01', 'end': '2019-05-01'}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_unknown_company(self):
+        response = self.client.get('/api/companies/0/trends/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_requires_authentication(self):
+        response = APIClient().get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class BackfillDailyRatingsTests(TestCase):
+    """
+    Tests on the backfill_daily_ratings command
+    """
+    def test_backfill(self):
+        company = factories.CompanyFactory(name='c1')
+        company2 = factories.CompanyFactory(name='c2')
+        factories.CompanyFactory(name='no_reviews')
+        day = datetime.date(2019, 5, 1)
+        for rating in [1, 5]:
+            _review_on(company, day, rating)
+        _review_on(company, day + datetime.timedelta(days=1), 5)
+        _review_on(company2, day, 3)
+
+        # stale row that should be corrected
+        CompanyDailyRating.objects.create(company=company, day=day, review_count=10)
+        # queued for one of the reviews, which the backfill counts already
+        jobs.enqueue(stats.DAILY_RATINGS_JOB,
+                     [[company.pk, day.isoformat(), {'review_count': 1, 'rating_sum': 5, 'rating_5': 1}]])
+
+        out = StringIO()
+        call_command('backfill_daily_ratings', chunk_size=1, batch_size=1, stdout=out)
+
+        self.assertIn("Backfilled 3 companies, 3 company days", out.getvalue())
+        row = CompanyDailyRating.objects.get(company=company, day=day)
+        self.assertEqual((row.review_count, row.rating_sum), (2, 6))
+        self.assertEqual(row.histogram, {'1': 1, '2': 0, '3': 0, '4': 0, '5': 1})
+        self.assertEqual(CompanyDailyRating.objects.count(), 3)
+        self.assertFalse(Job.objects.exists())
@@ -0,0 +1,154 @@
+"""
+Request rate limits per token, reviewer and client IP.
+
+Rates come from the [throttle] config section, as THROTTLE_RATES:
+
+    <token|reviewer|ip>.<route name>[.<method>] = <requests>/<second|minute|hour|day>
+    <token|reviewer|ip>.default = ...
+
+The most specific rate applies: the route and method, then the route,
+then the default. `none` lifts the default for a route. Requests counted
+under a default rate share one budget across the routes without a rate
+of their own.
+
+The client IP is read as ReviewSerializer records it, the first
+X-Forwarded-For address, so it is only as trustworthy as the proxy in
+front of the API.
+
+Each limit is a sliding window counter: two cache counters, for this
+and the previous fixed window, with the previous one weighted by how
+much of it still overlaps the sliding window. That takes one atomic
+incr() and one get() per limit, instead of DRF's list of hit
+timestamps read and written back on every request.
+"""
+import hashlib
+import math
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authtoken.models import Token
+from rest_framework.throttling import BaseThrottle
+
+from api.serializers import get_client_ip
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+KEY_PREFIX = 'api:throttle:'
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    :param rate: e.g. '100/min', or 'none'
+    :return: (requests, period in seconds) tuple, or None for no limit
+    :raise: ValueError on an invalid rate
+    """
+    if rate.strip().lower() == 'none':
+        return None
+    requests, _, period = rate.partition('/')
+    try:
+        return int(requests), PERIODS[period.strip()[:1].lower()]
+    except (KeyError, ValueError):
+        raise ValueError("Invalid throttle rate %r" % rate)
+
+
+def get_rate(kind, route, method):
+    """
+    :param kind: 'token', 'reviewer' or 'ip'
+    :param route: url name
+    :param method: lower case HTTP method
+    :return: (rule name, (requests, period)) tuple, or None if there is no limit
+    """
+    rates = settings.THROTTLE_RATES
+    for rule in ('%s.%s.%s' % (kind, route, method), '%s.%s' % (kind, route), kind + '.default'):
+        rate = rates.get(rule)
+        if rate is not None:
+            rate = parse_rate(rate)
+            return (rule, rate) if rate is not None else None
+    return None
+
+
+def hit(name, requests, period, now=None):
+    """
+    Count a request against a sliding window limit
+    :param name: counter name
+    :param requests: requests allowed per period
+    :param period: window length in seconds
+    :param now: current time, for tests
+    :return: seconds until a request would be allowed again, or None if this one is allowed
+    """
+    now = time.time() if now is None else now
+    window = int(now // period)
+    key = '%s%s:%d' % (KEY_PREFIX, name, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # first request of the window, unless another one just got here
+        count = 1 if cache.add(key, 1, period * 2) else cache.incr(key)
+
+    previous = cache.get('%s%s:%d' % (KEY_PREFIX, name, window - 1), 0)
+    elapsed = now - window * period
+    overlap = 1 - elapsed / period
+    if previous * overlap + count <= requests:
+        return None
+
+    if count <= requests:
+        # once enough of the previous window has slid out
+        return period * (1 - (requests - count) / previous) - elapsed
+    # once this window is the previous one and enough of it has slid out
+    return period - elapsed + period * (1 - requests / count)
+
+
+def _digest(value):
+    return hashlib.md5(value.encode('utf-8')).hexdigest()
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Applies the THROTTLE_RATES of the request's route to its token,
+    its reviewer and its client IP
+    """
+    def get_idents(self, request):
+        """
+        :param request: request object
+        :return: list of (kind, identity) tuples to count the request against
+        """
+        idents = []
+        ip_address = get_client_ip(request)
+        if ip_address:
+            # hashed, the header can hold anything
+            idents.append(('ip', _digest(ip_address)))
+        if isinstance(request.auth, Token):
+            idents.append(('token', _digest(request.auth.key)))
+        reviewer = getattr(request.user, 'reviewer', None)
+        if reviewer is not None:
+            idents.append(('reviewer', reviewer.pk))
+        return idents
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        if not settings.THROTTLE_RATES or request.resolver_match is None:
+            return True
+        if getattr(request, 'long_poll_retry', False):
+            # a long poll counts once, see api.longpoll
+            return True
+
+        route = request.resolver_match.url_name
+        method = request.method.lower()
+        for kind, ident in self.get_idents(request):
+            rule = get_rate(kind, route, method)
+            if rule is None:
+                continue
+            name, (requests, period) = rule
+            wait = hit('%s:%s' % (name, ident), requests, period)
+            if wait is not None:
+                self.wait_seconds = max(wait, self.wait_seconds or 0)
+
+        return self.wait_seconds is None
+
+    def wait(self):
+        # Retry-After is sent in whole seconds
+        return math.ceil(self.wait_seconds) if self.wait_seconds is not None else None
@@ -1,5 +1,6 @@
 from django.urls import path
 
+from api.models import CompanyRank
 from . import views
 
 urlpatterns = [
@@ -9,10 +10,28 @@ urlpatterns = [
 
     path('companies/', views.CompanyListView.as_view(), name='company-list'),
     path('companies/<int:pk>/', views.CompanyDetailView.as_view(), name='company-detail'),
+    path('companies/top-rated/', views.CompanyLeaderboardView.as_view(board=CompanyRank.TOP_RATED),
+         name='company-top-rated'),
+    path('companies/most-reviewed/',
+         views.CompanyLeaderboardView.as_view(board=CompanyRank.MOST_REVIEWED),
+         name='company-most-reviewed'),
+    path('companies/<int:pk>/ranks/', views.CompanyRankView.as_view(), name='company-ranks'),
+    path('companies/<int:pk>/reviews/', views.CompanyReviewListView.as_view(),
+         name='company-review-list'),
+    path('companies/<int:pk>/reviews/search/', views.CompanyReviewSearchView.as_view(),
+         name='company-review-search'),
+    path('companies/<int:pk>/trends/', views.CompanyTrendView.as_view(), name='company-trends'),
 
     path('reviews/', views.ReviewListView.as_view(), name='review-list'),
+    path('reviews/bulk/', views.ReviewBulkCreateView.as_view(), name='review-bulk'),
+    path('reviews/export/<str:export_format>/', views.ReviewExportView.as_view(),
+         name='review-export'),
     path('reviews/<int:pk>/', views.ReviewDetailView.as_view(), name='review-detail'),
 
     path('reviewers/', views.ReviewerListView.as_view(), name='reviewer-list'),
+    path('reviewers/bulk/', views.ReviewerBulkCreateView.as_view(), name='reviewer-bulk'),
     path('reviewers/<int:pk>/', views.ReviewerDetailView.as_view(), name='reviewer-detail'),
+
+    # staff only -- per-endpoint request metrics
+    path('stats/endpoints/', views.EndpointStatsView.as_view(), name='endpoint-stats'),
 ]
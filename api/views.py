@@ -1,11 +1,69 @@
+from django.conf import settings
 from django.contrib.auth.models import User
-from rest_framework import generics
-from rest_framework.permissions import AllowAny
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 
-from api.filters import IsReviewerFilterBackend, IsUserFilterBackend
+from api import bulk, export, feed, jobs, leaderboard, stats
+from api.authentication import token_cache
+from api.conditional import CompanyConditionalGetMixin, ReviewerConditionalGetMixin
+from api.connections import connection_stats
+from api.fieldsets import SparseFieldsetMixin
+from api.filters import (CompanyNameFilterBackend, IsReviewerFilterBackend,
+                         IsUserFilterBackend, ReviewFilterBackend, ReviewSearchFilterBackend)
+from api.hashing import hashing_service
+from api.metrics import endpoint_stats
 from api.models import Company, Review
-from api.serializers import CompanySerializer, ReviewerSerializer, ReviewSerializer
+from api.pagination import CompanyPagination, CompanyReviewPagination, ReviewPagination
+from api.parsers import CSVParser, FastJSONParser, NDJSONParser
+from api.renderers import LIST_RENDERER_CLASSES
+from api.serializers import (CompanyRankSerializer, CompanyReviewSerializer, CompanySerializer,
+                             CompanyTrendQuerySerializer, CompanyTrendSerializer,
+                             LeaderboardEntrySerializer, LeaderboardQuerySerializer,
+                             ReviewerSerializer,
+                             ReviewSerializer)
+
+
+def get_bulk_items(request, name, max_items):
+    """
+    :param request: request object
+    :param name: plural name of the items, for error messages
+    :param max_items: maximum number of items in one request
+    :return: list of items from the request body
+    :raise: ValidationError if the body is not a list, or is too long
+    """
+    items = request.data
+    if not isinstance(items, list):
+        raise ValidationError({'non_field_errors': ["Expected a list of %s" % name]})
+    if len(items) > max_items:
+        raise ValidationError({'non_field_errors': [
+            "At most %d %s can be sent at once" % (max_items, name)]})
+    return items
+
+
+def bulk_response(results):
+    """
+    201 if every item was created, 207 if some were, 400 if none were
+    :param results: list of per-item result dictionaries, see api.bulk
+    :return: Response object
+    """
+    created = sum(1 for r in results if r['status'] == 'created')
+
+    if created == len(results):
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+
+    return Response({'created': created,
+                     'invalid': len(results) - created,
+                     'results': results},
+                    status=response_status)
 
 
 class AuthenticateUserView(ObtainAuthToken):
@@ -48,12 +106,34 @@ class ReviewerListView(generics.CreateAPIView):
     filter_backends = (IsUserFilterBackend,)
 
 
-class ReviewerDetailView(generics.RetrieveUpdateAPIView):
+class ReviewerBulkCreateView(generics.GenericAPIView):
+    """
+    Bulk endpoint to register many reviewers at once. Access is limited to staff users.
+
+    post:
+    register reviewers from a JSON array, from NDJSON (Content-Type: application/x-ndjson)
+    with one reviewer per line, or from CSV (Content-Type: text/csv) with a header row.
+    Valid reviewers are registered even if others in the batch are invalid;
+    the response lists the result of each item in input order.
+    """
+    queryset = User.objects.all()
+    serializer_class = ReviewerSerializer
+    permission_classes = (IsAdminUser,)
+    parser_classes = (FastJSONParser, NDJSONParser, CSVParser)
+
+    def post(self, request, *args, **kwargs):
+        items = get_bulk_items(request, 'reviewers', settings.BULK_REVIEWER_MAX_ITEMS)
+        results = bulk.create_reviewers(items, request, settings.BULK_REVIEWER_CHUNK_SIZE)
+        return bulk_response(results)
+
+
+class ReviewerDetailView(ReviewerConditionalGetMixin, generics.RetrieveUpdateAPIView):
     """
     Detail endpoint to allow a reviewer to manage their own information.
 
     get:
-    return details about the given user if the user is the request user
+    return details about the given user if the user is the request user.
+    Supports conditional requests with If-None-Match / If-Modified-Since.
 
     put:
     update the given user if the user is the request user
@@ -66,50 +146,86 @@ class ReviewerDetailView(generics.RetrieveUpdateAPIView):
     filter_backends = (IsUserFilterBackend,)
 
 
-class CompanyListView(generics.ListAPIView):
+class CompanyListView(CompanyConditionalGetMixin, SparseFieldsetMixin, generics.ListAPIView):
     """
     Read-only endpoint for companies.
 
     get:
-    return a list of all companies
+    return a page of companies, ordered by name, or by ?ordering=-name.
+    Filter by name prefix with ?name= (case sensitive).
+    Follow the `next` and `previous` cursor links to page through the list.
+    Select fields with ?fields= or ?exclude=, and get columns with ?format=compact.
+    Supports conditional requests with If-None-Match; with ?wait=<seconds>
+    a request that would get a 304 waits for a change instead.
 
     """
-    queryset = Company.objects.all()
+    queryset = Company.objects.select_related('rating_stats')
     serializer_class = CompanySerializer
+    filter_backends = (CompanyNameFilterBackend,)
+    pagination_class = CompanyPagination
+    renderer_classes = LIST_RENDERER_CLASSES
+    long_poll = True
 
 
-class CompanyDetailView(generics.RetrieveAPIView):
+class CompanyDetailView(CompanyConditionalGetMixin, SparseFieldsetMixin,
+                        generics.RetrieveAPIView):
     """
     Read-only detail endpoint of companies.
 
     get:
-    return a details about the given company
+    return a details about the given company.
+    Select fields with ?fields= or ?exclude=.
+    Supports conditional requests with If-None-Match; with ?wait=<seconds>
+    a request that would get a 304 waits for a change instead.
     """
-    queryset = Company.objects.all()
+    queryset = Company.objects.select_related('rating_stats')
     serializer_class = CompanySerializer
+    long_poll = True
 
 
-class ReviewListView(generics.ListCreateAPIView):
+class ReviewListView(ReviewerConditionalGetMixin, SparseFieldsetMixin,
+                     generics.ListCreateAPIView):
     """
     List endpoint to allow a reviewer to view and create their reviews.
 
     get:
-    return a list of all reviews by this request user
+    return a page of reviews by this request user, ordered by submission date,
+    or by ?ordering= submission_date, -submission_date, rating or -rating.
+    Filter with ?rating_min=, ?rating_max=, ?company=<pk>,
+    and ?submitted_from= / ?submitted_to= (YYYY-MM-DD, inclusive).
+    With ?q= return the reviews whose title or summary contain every word, best match first.
+    Follow the `next` and `previous` cursor links to page through the list.
+    Select fields with ?fields= or ?exclude=, and get columns with ?format=compact.
+    Supports conditional requests with If-None-Match / If-Modified-Since; with
+    ?wait=<seconds> a request that would get a 304 waits for a change instead.
 
     post:
     create a new review by this request user
     """
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
-    filter_backends = (IsReviewerFilterBackend,)
+    filter_backends = (IsReviewerFilterBackend, ReviewFilterBackend, ReviewSearchFilterBackend)
+    pagination_class = ReviewPagination
+    renderer_classes = LIST_RENDERER_CLASSES
+    long_poll = True
+
+    def get_search_scope(self):
+        try:
+            return {'reviewer_id': self.request.user.reviewer.pk}
+        except AttributeError:
+            return None
 
 
-class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
+class ReviewDetailView(ReviewerConditionalGetMixin, SparseFieldsetMixin,
+                       generics.RetrieveUpdateDestroyAPIView):
     """
     Detail endpoint to allow a reviewer to view and edit their reviews.
 
     get:
-    return the given review by this request user
+    return the given review by this request user.
+    Select fields with ?fields= or ?exclude=.
+    Supports conditional requests with If-None-Match / If-Modified-Since; with
+    ?wait=<seconds> a request that would get a 304 waits for a change instead.
 
     put:
     update the given review by this request user
@@ -123,3 +239,198 @@ class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     filter_backends = (IsReviewerFilterBackend,)
+    long_poll = True
+
+    def perform_destroy(self, instance):
+        self.get_serializer().delete(instance)
+
+
+class CompanyLeaderboardView(generics.GenericAPIView):
+    """
+    Company leaderboard.
+
+    get:
+    return the first ?limit= (default 10) companies of the leaderboard, best first,
+    with their rank, score and review count. `refreshed` is when the ranks were computed.
+    """
+    serializer_class = LeaderboardEntrySerializer
+    # set in urls.py, one of leaderboard.BOARDS
+    board = None
+
+    def get(self, request, *args, **kwargs):
+        query = LeaderboardQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        ranks = list(leaderboard.top(self.board, query.validated_data['limit']))
+        return Response({'board': self.board,
+                         'refreshed': ranks[0].refreshed if ranks else None,
+                         'results': self.get_serializer(ranks, many=True).data})
+
+
+class CompanyRankView(generics.GenericAPIView):
+    """
+    Leaderboard ranks of a company.
+
+    get:
+    return the company's rank, score and review count on each leaderboard,
+    or null where it is not ranked.
+    """
+    serializer_class = CompanyRankSerializer
+
+    def get(self, request, *args, **kwargs):
+        company = get_object_or_404(Company.objects.only('pk'), pk=kwargs['pk'])
+        ranks = leaderboard.company_ranks(company.pk)
+        return Response({board: self.get_serializer(rank).data if rank is not None else None
+                         for board, rank in ranks.items()})
+
+
+class CompanyTrendView(generics.GenericAPIView):
+    """
+    Rating trend of a company.
+
+    get:
+    return the company's review count, average rating and rating histogram
+    per ?bucket=day (the default), week (starting on Monday) or month, oldest first.
+    Buckets without reviews are left out.
+    Narrow the range with ?start= and ?end= (YYYY-MM-DD, inclusive).
+    """
+    serializer_class = CompanyTrendSerializer
+
+    def get(self, request, *args, **kwargs):
+        company = get_object_or_404(Company.objects.only('pk'), pk=kwargs['pk'])
+        query = CompanyTrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+
+        buckets = stats.company_trend(company.pk, **query.validated_data)
+        return Response({'bucket': query.validated_data['bucket'],
+                         'results': self.get_serializer(buckets, many=True).data})
+
+
+class CompanyReviewListView(SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Public read-only feed of a company's reviews.
+    Access is open to all users.
+
+    get:
+    return a page of the company's reviews, newest first.
+    Follow the `next` and `previous` cursor links to page through the list.
+    Select fields with ?fields= or ?exclude=, and get columns with ?format=compact.
+    Pages are cached until a review of the company is written.
+    """
+    serializer_class = CompanyReviewSerializer
+    pagination_class = CompanyReviewPagination
+    renderer_classes = LIST_RENDERER_CLASSES
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def get_queryset(self):
+        company = get_object_or_404(Company.objects.only('pk'), pk=self.kwargs['pk'])
+        return Review.objects.filter(company=company)
+
+    def list(self, request, *args, **kwargs):
+        def build():
+            return super(CompanyReviewListView, self).list(request, *args, **kwargs).data
+
+        return Response(feed.get_page(self.kwargs['pk'], request, build))
+
+
+class CompanyReviewSearchView(SparseFieldsetMixin, generics.ListAPIView):
+    """
+    Search endpoint for the reviews of a company.
+
+    get:
+    return a page of the company's reviews whose title or summary contain
+    every word of ?q=, best match first.
+    Follow the `next` and `previous` cursor links to page through the list.
+    Select fields with ?fields= or ?exclude=, and get columns with ?format=compact.
+    Like the company's review feed, it leaves out the reviewers and their ip addresses.
+    """
+    serializer_class = CompanyReviewSerializer
+    filter_backends = (ReviewSearchFilterBackend,)
+    pagination_class = ReviewPagination
+    renderer_classes = LIST_RENDERER_CLASSES
+
+    def get_queryset(self):
+        company = get_object_or_404(Company.objects.only('pk'), pk=self.kwargs['pk'])
+        return Review.objects.filter(company=company)
+
+    def get_search_scope(self):
+        return {'company_id': self.kwargs['pk']}
+
+    def list(self, request, *args, **kwargs):
+        if ReviewSearchFilterBackend.search_param not in request.query_params:
+            raise ValidationError({ReviewSearchFilterBackend.search_param: [
+                "This query parameter is required."]})
+        return super().list(request, *args, **kwargs)
+
+
+class ReviewBulkCreateView(generics.GenericAPIView):
+    """
+    Bulk endpoint to allow a reviewer to create many reviews at once.
+
+    post:
+    create reviews by this request user from a JSON array,
+    or from NDJSON (Content-Type: application/x-ndjson) with one review per line.
+    Valid reviews are created even if others in the batch are invalid;
+    the response lists the result of each item in input order.
+    """
+    queryset = Review.objects.all()
+    serializer_class = ReviewSerializer
+    parser_classes = (FastJSONParser, NDJSONParser)
+
+    def post(self, request, *args, **kwargs):
+        items = get_bulk_items(request, 'reviews', settings.BULK_REVIEW_MAX_ITEMS)
+
+        results = bulk.create_reviews(items, request, settings.BULK_REVIEW_CHUNK_SIZE)
+        return bulk_response(results)
+
+
+class ReviewExportView(generics.GenericAPIView):
+    """
+    Export endpoint to allow a reviewer to download all of their reviews.
+
+    get:
+    stream every review by this request user, oldest first,
+    as NDJSON (export/ndjson/) or CSV (export/csv/)
+    """
+    queryset = Review.objects.all()
+    serializer_class = ReviewSerializer
+    filter_backends = (IsReviewerFilterBackend,)
+
+    def get(self, request, export_format, *args, **kwargs):
+        try:
+            content_type, stream = export.EXPORT_FORMATS[export_format]
+        except KeyError:
+            raise NotFound("Unknown export format %s" % export_format)
+
+        row_serializer = export.ReviewRowSerializer(request)
+        rows = (self.filter_queryset(self.get_queryset())
+                .order_by('submission_date', 'id')
+                .values_list(*row_serializer.columns)
+                .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE))
+
+        response = StreamingHttpResponse(stream(rows, row_serializer),
+                                         content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="reviews.%s"' % export_format
+        return response
+
+
+class EndpointStatsView(generics.GenericAPIView):
+    """
+    Request metrics per endpoint. Access is limited to staff users.
+
+    get:
+    return query count, SQL time, serialize time, render time, total time and response size
+    histogram summaries for each route, merged over every process that
+    published its metrics to the cache, this process's token cache,
+    password hashing and database connection numbers, and the
+    background job queue depth
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response({'endpoints': endpoint_stats.report(),
+                         'token_cache': token_cache.stats(),
+                         'password_hashing': hashing_service.stats(),
+                         'database_connections': connection_stats.stats(),
+                         'jobs': jobs.queue_stats()})
@@ -0,0 +1,5 @@
+"""
+Load-test and benchmark suite for the API.
+
+Run with `python -m benchmarks --help`, see README.md.
+"""
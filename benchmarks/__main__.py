@@ -0,0 +1,116 @@
+"""
+python -m benchmarks [options]
+
+Seeds a separate benchmark database (reused by later runs), drives
+each scenario through the WSGI application and prints a JSON report.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description="Benchmark the API endpoints")
+    parser.add_argument('--companies', type=int, default=50000)
+    parser.add_argument('--reviewers', type=int, default=100000)
+    parser.add_argument('--reviews', type=int, default=1000000)
+    parser.add_argument('--database', default='benchmark.db',
+                        help="SQLite file for the benchmark data (other databases use their test database)")
+    parser.add_argument('--reseed', action='store_true',
+                        help="Drop the benchmark database and seed it again")
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help="Rows per INSERT when seeding")
+    parser.add_argument('--days', type=int, default=365,
+                        help="Days the seeded review submission dates are spread over")
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        help="Scenario to run (repeatable), default all")
+    parser.add_argument('--requests', type=int, default=200,
+                        help="Measured requests per scenario")
+    parser.add_argument('--warmup', type=int, default=20,
+                        help="Unmeasured requests per scenario")
+    parser.add_argument('--users', type=int, default=50,
+                        help="Number of reviewers to send requests as")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    parser.add_argument('--baseline', help="JSON report to compare to")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed relative regression against the baseline")
+    return parser.parse_args(argv)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+
+    # measure what production runs, and keep the query log out of the timings
+    settings.DEBUG = False
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = options.database
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=not options.reseed)
+
+    from api.models import Company, Review, Reviewer
+    from benchmarks import runner, seed
+    from reviews.wsgi import application
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    if not Review.objects.exists():
+        seed.seed(options.companies, options.reviewers, options.reviews,
+                  batch_size=options.batch_size, random_seed=options.seed, days=options.days,
+                  log=log)
+
+    scenarios = options.scenarios or list(runner.SCENARIOS)
+    unknown = set(scenarios) - set(runner.SCENARIOS)
+    if unknown:
+        sys.exit("Unknown scenario(s): %s" % ', '.join(sorted(unknown)))
+
+    fixtures = runner.Fixtures(options.users, random_seed=options.seed)
+    report = {
+        'commit': git_commit(),
+        'database': connection.vendor,
+        'dataset': {
+            'companies': Company.objects.count(),
+            'reviewers': Reviewer.objects.count(),
+            'reviews': Review.objects.count(),
+        },
+        'scenarios': runner.run(runner.WSGIClient(application), fixtures, scenarios,
+                                options.requests, options.warmup, options.seed),
+    }
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            regressions = runner.find_regressions(report, json.load(baseline_file),
+                                                  options.tolerance)
+        for message in regressions:
+            log("REGRESSION " + message)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
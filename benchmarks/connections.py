@@ -0,0 +1,303 @@
+"""
+python -m benchmarks.connections [--connections 1000] [--wait 5]
+
+Holds many long polling connections open at once (conditional GETs of
+an unchanged review list with ?wait=, see api.longpoll) and compares
+the WSGI deployment, where each waiting connection takes a thread, with
+the ASGI one (api.asgi), where it takes a coroutine and the Django work
+runs on a pool of --threads threads.
+
+Each deployment runs in a process of its own, so that their memory use
+can be compared; the report has the peak thread count, the memory added
+per open connection and the latency of requests sent while the
+connections are held.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+MODES = ('wsgi', 'asgi')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.connections',
+                                     description="Compare WSGI and ASGI with many open connections")
+    parser.add_argument('--connections', type=int, default=1000,
+                        help="Long polling connections held open at once")
+    parser.add_argument('--wait', type=float, default=5, help="Seconds each connection waits")
+    parser.add_argument('--threads', type=int, default=16, help="ASGI thread pool size")
+    parser.add_argument('--probes', type=int, default=20,
+                        help="Requests sent while the connections are held, for latency")
+    parser.add_argument('--users', type=int, default=50, help="Number of reviewers polling")
+    parser.add_argument('--database', default='benchmark-connections.db',
+                        help="SQLite file for the benchmark data (other databases use their test database)")
+    parser.add_argument('--mode', choices=MODES, help="Run one deployment in this process")
+    parser.add_argument('--output', help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def rss_kb():
+    """
+    :return: resident set size of this process in KiB
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # peak rather than current size, and bytes on macOS
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+class PeakSampler(threading.Thread):
+    """
+    Samples the memory and thread count of the process until stopped
+    """
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.rss_kb = rss_kb()
+        self.threads = threading.active_count()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.rss_kb = max(self.rss_kb, rss_kb())
+            self.threads = max(self.threads, threading.active_count())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def _wsgi_request(client, path, headers):
+    """
+    :return: (status code, response headers dictionary, latency in ms) tuple
+    """
+    response_headers = {}
+    status = []
+
+    def start_response(status_line, header_list, exc_info=None):
+        status.append(int(status_line.split(' ', 1)[0]))
+        response_headers.update(header_list)
+
+    start = time.perf_counter()
+    result = client.application(client.environ('GET', path, headers=headers), start_response)
+    try:
+        b''.join(result)
+    finally:
+        result.close()
+    return status[0], response_headers, (time.perf_counter() - start) * 1000
+
+
+async def _asgi_request(application, path, headers):
+    """
+    :return: (status code, response headers dictionary, latency in ms) tuple
+    """
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http',
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'root_path': '',
+        'query_string': query_string.encode('latin-1'),
+        'headers': [(key[5:].replace('_', '-').lower().encode('latin-1'), value.encode('latin-1'))
+                    for key, value in headers.items()],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+    messages = [{'type': 'http.request', 'body': b''}]
+    done = asyncio.Event()
+    start_message = {}
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            start_message.update(message)
+
+    start = time.perf_counter()
+    try:
+        await application(scope, receive, send)
+    finally:
+        done.set()
+    response_headers = {key.decode('latin-1').title(): value.decode('latin-1')
+                        for key, value in start_message['headers']}
+    return start_message['status'], response_headers, (time.perf_counter() - start) * 1000
+
+
+def _summarize(statuses, probe_latencies, elapsed, sampler, baseline_rss, baseline_threads,
+               connections):
+    probe_latencies.sort()
+    return {
+        'connections': connections,
+        'not_modified': statuses.count(304),
+        'errors': len(statuses) - statuses.count(304),
+        'elapsed_seconds': round(elapsed, 2),
+        'peak_threads': sampler.threads,
+        'added_threads': sampler.threads - baseline_threads,
+        'rss_kb': {'baseline': baseline_rss, 'peak': sampler.rss_kb},
+        'rss_kb_per_connection': round((sampler.rss_kb - baseline_rss) / connections, 2),
+        'probe_latency_ms': {
+            'p50': round(probe_latencies[len(probe_latencies) // 2], 2),
+            'max': round(probe_latencies[-1], 2),
+        } if probe_latencies else None,
+    }
+
+
+def run_wsgi(polls, probes, wait):
+    """
+    One thread per connection, each waiting in LongPollMiddleware
+    :param polls: list of (path, headers) of the long polls
+    :param probes: list of (path, headers) sent while they wait
+    :param wait: seconds the long polls wait
+    """
+    from benchmarks.runner import WSGIClient
+    from reviews.wsgi import application
+
+    client = WSGIClient(application)
+    statuses = []
+
+    def poll(path, headers):
+        statuses.append(_wsgi_request(client, path, headers)[0])
+
+    baseline_rss, baseline_threads = rss_kb(), threading.active_count()
+    sampler = PeakSampler()
+    sampler.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=poll, args=poll_args) for poll_args in polls]
+    for thread in threads:
+        thread.start()
+
+    latencies = []
+    probe_interval = wait / (len(probes) + 1)
+    for path, headers in probes:
+        time.sleep(probe_interval)
+        latencies.append(_wsgi_request(client, path, headers)[2])
+
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    return _summarize(statuses, latencies, elapsed, sampler, baseline_rss, baseline_threads,
+                      len(polls))
+
+
+def run_asgi(polls, probes, wait, threads):
+    """
+    One coroutine per connection, Django work on a pool of `threads` threads
+    """
+    from api.asgi import ASGIHandler
+
+    application = ASGIHandler(threads=threads)
+    loop = asyncio.new_event_loop()
+
+    async def probe():
+        latencies = []
+        probe_interval = wait / (len(probes) + 1)
+        for path, headers in probes:
+            await asyncio.sleep(probe_interval)
+            latencies.append((await _asgi_request(application, path, headers))[2])
+        return latencies
+
+    async def main():
+        tasks = [asyncio.ensure_future(_asgi_request(application, path, headers))
+                 for path, headers in polls]
+        latencies = await probe()
+        return [status for status, _, _ in await asyncio.gather(*tasks)], latencies
+
+    baseline_rss, baseline_threads = rss_kb(), threading.active_count()
+    sampler = PeakSampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        statuses, latencies = loop.run_until_complete(main())
+    finally:
+        loop.close()
+    elapsed = time.perf_counter() - start
+    sampler.stop()
+    application.close()
+    return _summarize(statuses, latencies, elapsed, sampler, baseline_rss, baseline_threads,
+                      len(polls))
+
+
+def run_mode(options):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.db import connection
+
+    settings.DEBUG = False
+    settings.LONG_POLL_MAX_WAIT = max(settings.LONG_POLL_MAX_WAIT, options.wait)
+    # the WSGI deployment is measured waiting in its request threads
+    settings.LONG_POLL_WSGI = True
+    if connection.vendor == 'sqlite':
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = options.database
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=True)
+
+    from api.models import Review
+    from benchmarks import runner, seed
+    from reviews.wsgi import application
+
+    if not Review.objects.exists():
+        seed.seed(companies=100, reviewers=options.users * 10, reviews=options.users * 100,
+                  log=lambda message: print(message, file=sys.stderr))
+    fixtures = runner.Fixtures(options.users)
+
+    # each user's ETag of their first page, fetched before measuring
+    client = runner.WSGIClient(application)
+    etags = []
+    for _, token_key, _ in fixtures.users:
+        headers = runner._auth(token_key)
+        etags.append((headers, _wsgi_request(client, '/api/reviews/', headers)[1]['ETag']))
+
+    path = '/api/reviews/?wait=%s' % options.wait
+    polls = [(path, dict(headers, HTTP_IF_NONE_MATCH=etag))
+             for headers, etag in (etags[i % len(etags)] for i in range(options.connections))]
+    probes = [('/api/reviews/', etags[i % len(etags)][0]) for i in range(options.probes)]
+
+    if options.mode == 'wsgi':
+        return run_wsgi(polls, probes, options.wait)
+    return run_asgi(polls, probes, options.wait, options.threads)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    options = parse_args(argv)
+    if options.mode:
+        print(json.dumps(run_mode(options)))
+        return
+
+    report = {'connections': options.connections, 'wait': options.wait, 'asgi_threads': options.threads}
+    for mode in MODES:
+        output = subprocess.check_output([sys.executable, '-m', 'benchmarks.connections',
+                                          '--mode', mode] + argv)
+        report[mode] = json.loads(output.decode())
+
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
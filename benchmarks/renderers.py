@@ -0,0 +1,109 @@
+"""
+python -m benchmarks.renderers [options]
+
+Micro-benchmark of DRF's JSONRenderer and JSONParser against
+api.renderers.FastJSONRenderer and api.parsers.FastJSONParser on a
+page of serialized reviews. Needs no database: the reviews are built
+in memory. Prints a JSON report with the best time of each.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import time
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.renderers',
+                                     description="Benchmark the JSON renderer and parser")
+    parser.add_argument('--reviews', type=int, default=1000, help="Reviews on the page")
+    parser.add_argument('--repeat', type=int, default=50,
+                        help="Timed runs of each, the best is reported")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    return parser.parse_args(argv)
+
+
+def review_page(reviews, random_seed=0):
+    """
+    Serialize a page of reviews the way ReviewListView does
+    :param reviews: number of reviews
+    :param random_seed: seed for the review contents
+    :return: paginated response data
+    """
+    from django.test import RequestFactory
+    from django.utils import timezone
+    from rest_framework.request import Request
+
+    from api.models import Review
+    from api.pagination import ReviewPagination
+    from api.serializers import ReviewSerializer
+    from benchmarks.seed import VOCABULARY
+
+    rng = random.Random(random_seed)
+    now = timezone.now()
+    page = [Review(id=i, rating=rng.randint(1, 5),
+                   title=' '.join(rng.sample(VOCABULARY, 3)),
+                   summary=' '.join(rng.choices(VOCABULARY, k=rng.randint(20, 200))),
+                   ip_address='10.0.%d.%d' % (i // 256 % 256, i % 256),
+                   submission_date=now, last_modified=now,
+                   company_id=rng.randint(1, 50000), reviewer_id=rng.randint(1, 100000))
+            for i in range(1, reviews + 1)]
+
+    request = Request(RequestFactory().get('/api/reviews/', HTTP_HOST='localhost'))
+    data = ReviewSerializer(page, many=True, context={'request': request}).data
+    pagination = ReviewPagination()
+    pagination.has_next = pagination.has_previous = False
+    return pagination.get_paginated_response(data).data
+
+
+def best_time(function, repeat):
+    """
+    :return: the fastest of `repeat` runs of function, in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def run(reviews, repeat, random_seed=0):
+    """
+    :return: report dictionary
+    """
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from api import jsonlib
+    from api.parsers import FastJSONParser
+    from api.renderers import FastJSONRenderer
+
+    data = review_page(reviews, random_seed)
+    report = {'backend': jsonlib.BACKEND, 'reviews': reviews}
+    for name, renderer, parser in (('drf', JSONRenderer(), JSONParser()),
+                                   ('fast', FastJSONRenderer(), FastJSONParser())):
+        body = renderer.render(data, 'application/json')
+        report[name] = {
+            'bytes': len(body),
+            'render_ms': best_time(lambda: renderer.render(data, 'application/json'), repeat),
+            'parse_ms': best_time(lambda: parser.parse(io.BytesIO(body)), repeat),
+        }
+    for operation in ('render_ms', 'parse_ms'):
+        report['speedup_' + operation[:-3]] = report['drf'][operation] / report['fast'][operation]
+    return report
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+    import django
+    django.setup()
+
+    print(json.dumps(run(options.reviews, options.repeat, options.seed), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Drive the API through the WSGI application and measure each endpoint.
+
+Requests go through reviews.wsgi.application, so the whole middleware,
+authentication and rendering stack is measured, without a network or
+a server in the way. Each scenario is run for a number of requests and
+summarized as latency percentiles, requests per second and queries per
+request.
+"""
+import hashlib
+import io
+import json
+import random
+import sys
+import time
+
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryTimer
+from api.models import Company, Review
+from benchmarks.seed import PASSWORD, VOCABULARY
+
+
+class WSGIClient:
+    """
+    Minimal client that calls a WSGI application in-process
+    """
+    def __init__(self, application):
+        self.application = application
+
+    def environ(self, method, path, body=b'', content_type='', headers=None):
+        """
+        :param method: HTTP method
+        :param path: path, optionally with a query string
+        :param body: request body bytes
+        :param content_type: request content type
+        :param headers: dictionary of WSGI environ header keys, e.g. HTTP_AUTHORIZATION
+        :return: WSGI environ of the request
+        """
+        path_info, _, query_string = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path_info,
+            'QUERY_STRING': query_string,
+            'SCRIPT_NAME': '',
+            'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        environ.update(headers or {})
+        return environ
+
+    def request(self, method, path, body=b'', content_type='', headers=None):
+        """
+        :param method: HTTP method
+        :param path: path, optionally with a query string
+        :param body: request body bytes
+        :param content_type: request content type
+        :param headers: dictionary of WSGI environ header keys, e.g. HTTP_AUTHORIZATION
+        :return: (status code, response body bytes) tuple
+        """
+        environ = self.environ(method, path, body, content_type, headers)
+        status = []
+
+        def start_response(status_line, response_headers, exc_info=None):
+            status.append(int(status_line.split(' ', 1)[0]))
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return status[0], content
+
+
+class Fixtures:
+    """
+    Users, tokens and rows the scenarios send requests for
+    """
+    def __init__(self, users, random_seed=0):
+        """
+        :param users: number of reviewers with reviews to sample
+        :param random_seed: seed for the sample
+        """
+        rng = random.Random(random_seed)
+        last_review = Review.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        review_ids = [rng.randint(1, last_review) for _ in range(users * 2)]
+        rows = (Review.objects
+                .filter(pk__in=review_ids)
+                .values_list('pk', 'reviewer__user_id', 'reviewer__user__username')[:users])
+
+        # (username, token key, pk of one of their reviews)
+        self.users = []
+        for review_id, user_id, username in rows:
+            token, _ = Token.objects.get_or_create(user_id=user_id)
+            self.users.append((username, token.key, review_id))
+        self.company_ids = list(Company.objects.values_list('pk', flat=True)[:1000])
+
+        if not self.users or not self.company_ids:
+            raise ValueError("The benchmark database has no reviews to request")
+
+
+def _client(value):
+    """
+    A client address of its own for each user, so that the
+    per-IP rate limits see many clients, as in production
+    """
+    digest = hashlib.md5(value.encode('utf-8')).digest()
+    return {'HTTP_X_FORWARDED_FOR': '10.%d.%d.%d' % tuple(digest[:3])}
+
+
+def _auth(token_key):
+    return dict(_client(token_key), HTTP_AUTHORIZATION='Token ' + token_key)
+
+
+def token_auth(fixtures, rng):
+    username, _, _ = rng.choice(fixtures.users)
+    body = json.dumps({'username': username, 'password': PASSWORD}).encode()
+    return 'POST', '/api/token-auth/', body, 'application/json', _client(username)
+
+
+def review_list(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    return 'GET', '/api/reviews/', b'', '', _auth(key)
+
+
+def review_list_compact(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    return ('GET', '/api/reviews/?fields=url,rating,title&format=compact&page_size=100',
+            b'', '', _auth(key))
+
+
+def review_detail(fixtures, rng):
+    _, key, review_id = rng.choice(fixtures.users)
+    return 'GET', '/api/reviews/%d/' % review_id, b'', '', _auth(key)
+
+
+def company_list(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    return 'GET', '/api/companies/', b'', '', _auth(key)
+
+
+def company_reviews(fixtures, rng):
+    company_id = rng.choice(fixtures.company_ids)
+    return 'GET', '/api/companies/%d/reviews/' % company_id, b'', '', _client(str(company_id))
+
+
+def company_trends(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    company_id = rng.choice(fixtures.company_ids)
+    bucket = rng.choice(('day', 'week', 'month'))
+    return ('GET', '/api/companies/%d/trends/?bucket=%s' % (company_id, bucket),
+            b'', '', _auth(key))
+
+
+def company_top_rated(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    return 'GET', '/api/companies/top-rated/?limit=%d' % rng.choice((10, 100)), b'', '', _auth(key)
+
+
+def review_search(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    company_id = rng.choice(fixtures.company_ids)
+    query = ' '.join(rng.sample(VOCABULARY, 2))
+    return ('GET', '/api/companies/%d/reviews/search/?q=%s' % (company_id, query.replace(' ', '+')),
+            b'', '', _auth(key))
+
+
+def review_create(fixtures, rng):
+    _, key, _ = rng.choice(fixtures.users)
+    body = json.dumps({
+        'rating': rng.randint(1, 5),
+        # different every time, or they would be rejected as duplicates
+        'title': ' '.join(rng.sample(VOCABULARY, 3)),
+        'summary': ' '.join(rng.choices(VOCABULARY, k=30)),
+        'company': 'http://localhost/api/companies/%d/' % rng.choice(fixtures.company_ids),
+    }).encode()
+    return 'POST', '/api/reviews/', body, 'application/json', _auth(key)
+
+
+# scenario name -> function returning the arguments of WSGIClient.request
+SCENARIOS = {
+    'token-auth': token_auth,
+    'review-list': review_list,
+    'review-list-compact': review_list_compact,
+    'review-detail': review_detail,
+    'company-list': company_list,
+    'company-reviews': company_reviews,
+    'company-trends': company_trends,
+    'company-top-rated': company_top_rated,
+    'review-search': review_search,
+    'review-create': review_create,
+}
+
+
+def percentile(ordered, fraction):
+    """
+    Nearest-rank percentile
+    :param ordered: sorted list of values
+    :param fraction: 0 to 1
+    """
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, queries, errors, elapsed):
+    """
+    :param latencies: list of request latencies in seconds
+    :param queries: list of query counts per request
+    :param errors: number of responses with an error status
+    :param elapsed: wall time of all the requests in seconds
+    :return: summary dictionary
+    """
+    ordered = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': len(latencies) / elapsed if elapsed else None,
+        'latency_ms': {
+            'mean': sum(ordered) / len(ordered),
+            'p50': percentile(ordered, 0.5),
+            'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1],
+        },
+        'queries_per_request': {
+            'mean': sum(queries) / len(queries),
+            'max': max(queries),
+        },
+    }
+
+
+def run_scenario(client, scenario, fixtures, requests, warmup=0, random_seed=0):
+    """
+    :param client: WSGIClient
+    :param scenario: function from SCENARIOS
+    :param fixtures: Fixtures
+    :param requests: number of measured requests
+    :param warmup: number of requests to send before measuring
+    :param random_seed: seed for the request choices
+    :return: summary dictionary, see summarize
+    """
+    rng = random.Random(random_seed)
+    for _ in range(warmup):
+        method, path, body, content_type, headers = scenario(fixtures, rng)
+        client.request(method, path, body, content_type, headers)
+
+    latencies = []
+    queries = []
+    errors = 0
+    elapsed = 0.0
+    for _ in range(requests):
+        method, path, body, content_type, headers = scenario(fixtures, rng)
+        timer = QueryTimer()
+        with connection.execute_wrapper(timer):
+            start = time.perf_counter()
+            status, _ = client.request(method, path, body, content_type, headers)
+            latency = time.perf_counter() - start
+        elapsed += latency
+        latencies.append(latency)
+        queries.append(timer.queries)
+        if status >= 400:
+            errors += 1
+
+    return summarize(latencies, queries, errors, elapsed)
+
+
+def run(client, fixtures, scenarios, requests, warmup=0, random_seed=0):
+    """
+    :param scenarios: list of scenario names
+    :return: dictionary of scenario name -> summary
+    """
+    return {name: run_scenario(client, SCENARIOS[name], fixtures, requests,
+                               warmup, random_seed)
+            for name in scenarios}
+
+
+def find_regressions(report, baseline, tolerance):
+    """
+    Compare a report to an earlier one
+    :param report: report dictionary from this run
+    :param baseline: report dictionary to compare to
+    :param tolerance: allowed relative increase, e.g. 0.2 for 20%
+    :return: list of messages, one per regression
+    """
+    regressions = []
+    for name, summary in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        checks = [
+            ('p95 latency', before['latency_ms']['p95'], summary['latency_ms']['p95']),
+            ('queries per request', before['queries_per_request']['mean'],
+             summary['queries_per_request']['mean']),
+        ]
+        for label, old, new in checks:
+            if new > old * (1 + tolerance):
+                regressions.append("%s: %s went from %.2f to %.2f" % (name, label, old, new))
+    return regressions
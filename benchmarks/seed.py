@@ -0,0 +1,170 @@
+"""
+Fast bulk seeder for benchmark databases.
+
+Building and saving one factory instance per row takes hours at a
+million reviews, so each factory builds a single template instance
+and the rows are copies of it with the varying fields filled in,
+written with bulk_create. The password hash is computed once and
+shared by every user. Review text is drawn from a small vocabulary
+with a skewed word frequency, so searches hit realistic result sizes.
+Submission dates are spread over the last `days` days, so that the
+trends, date filters, date ordering and leaderboards see a history
+rather than one second of reviews.
+"""
+import datetime
+import random
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from api import leaderboard
+from api.models import Company, CompanyDailyRating, CompanyRatingStats, Review, Reviewer
+from api.stats import aggregate_daily_ratings, aggregate_rating_stats
+from api.tests import factories
+
+
+# the password set by factories.UserFactory
+PASSWORD = 'pw'
+USERNAME_FORMAT = 'bench_%07d'
+
+VOCABULARY = (
+    'good', 'great', 'service', 'staff', 'price', 'quality', 'friendly', 'slow',
+    'fast', 'recommend', 'manager', 'support', 'delivery', 'product', 'helpful',
+    'rude', 'clean', 'expensive', 'cheap', 'value', 'experience', 'wait', 'order',
+    'refund', 'excellent', 'terrible', 'location', 'parking', 'website', 'phone',
+    'office', 'team', 'salary', 'benefits', 'culture', 'management', 'hours',
+    'coffee', 'lunch', 'training', 'career', 'growth', 'remote', 'commute',
+    'interview', 'contract', 'warranty', 'shipping', 'packaging', 'billing',
+)
+# zipf-like: the n-th word is n times less frequent than the first
+WORD_WEIGHTS = [1 / (n + 1) for n in range(len(VOCABULARY))]
+
+
+def _text(rng, words):
+    return ' '.join(rng.choices(VOCABULARY, WORD_WEIGHTS, k=words))
+
+
+def _template(factory_class, **overrides):
+    """
+    Field values of one instance built (not saved) by the factory
+    :param factory_class: DjangoModelFactory subclass
+    :param overrides: factory arguments
+    :return: dictionary of attname -> value, without the primary key
+    """
+    instance = factory_class.build(**overrides)
+    return {field.attname: getattr(instance, field.attname)
+            for field in instance._meta.concrete_fields
+            if not field.primary_key}
+
+
+@contextmanager
+def _given_dates(model, *names):
+    """
+    Let bulk_create write the values given for auto_now and auto_now_add
+    fields, rather than the current time
+    :param model: model class
+    :param names: names of the date fields
+    """
+    fields = [model._meta.get_field(name) for name in names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _insert(model, rows, batch_size):
+    """
+    :param model: model class
+    :param rows: iterable of attribute dictionaries
+    :param batch_size: rows per INSERT and per transaction
+    :return: number of rows inserted
+    """
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(model(**row))
+        if len(batch) == batch_size:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def seed(companies, reviewers, reviews, batch_size=5000, random_seed=0, days=365, log=None):
+    """
+    Add companies, reviewers and reviews to the database.
+    Reviews are spread over random companies and reviewers, and
+    submitted at random times in the last `days` days.
+    :param companies: number of companies
+    :param reviewers: number of reviewers (and users)
+    :param reviews: number of reviews
+    :param batch_size: rows per INSERT
+    :param days: number of days the submission dates are spread over
+    :param random_seed: seed for the ratings and review assignment
+    :param log: optional callable taking a progress message
+    """
+    log = log or (lambda message: None)
+    rng = random.Random(random_seed)
+
+    company = _template(factories.CompanyFactory)
+    user = _template(factories.UserFactory, reviewer=None, password=PASSWORD)
+    reviewer = _template(factories.ReviewerFactory, user=User())
+    review = _template(factories.ReviewFactory, company=Company(), reviewer=Reviewer())
+
+    first_user = User.objects.count()
+    _insert(Company, (dict(company, name='company_%06d' % i) for i in range(companies)),
+            batch_size)
+    _insert(User, (dict(user, username=USERNAME_FORMAT % (first_user + i))
+                   for i in range(reviewers)), batch_size)
+    log("Seeded %d companies and %d users" % (companies, reviewers))
+
+    # bulk_create does not return primary keys on every database
+    user_ids = (User.objects
+                .filter(reviewer__isnull=True, username__startswith='bench_')
+                .values_list('pk', flat=True)
+                .iterator())
+    _insert(Reviewer, (dict(reviewer, user_id=pk) for pk in user_ids), batch_size)
+
+    company_ids = list(Company.objects.values_list('pk', flat=True))
+    reviewer_ids = list(Reviewer.objects.values_list('pk', flat=True))
+    now = timezone.now()
+
+    def review_row():
+        submitted = now - datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+        return dict(review,
+                    title=_text(rng, 3),
+                    summary=_text(rng, 30),
+                    rating=rng.randint(1, 5),
+                    company_id=rng.choice(company_ids),
+                    reviewer_id=rng.choice(reviewer_ids),
+                    submission_date=submitted,
+                    last_modified=submitted)
+
+    with _given_dates(Review, 'submission_date', 'last_modified'):
+        _insert(Review, (review_row() for i in range(reviews)), batch_size)
+    log("Seeded %d reviews" % reviews)
+
+    for start in range(0, len(company_ids), batch_size):
+        chunk = company_ids[start:start + batch_size]
+        with transaction.atomic():
+            CompanyRatingStats.objects.filter(company_id__in=chunk).delete()
+            CompanyRatingStats.objects.bulk_create(aggregate_rating_stats(chunk))
+            CompanyDailyRating.objects.filter(company_id__in=chunk).delete()
+            CompanyDailyRating.objects.bulk_create(aggregate_daily_ratings(chunk),
+                                                   batch_size=batch_size)
+    log("Rebuilt rating totals")
+
+    for board in leaderboard.BOARDS:
+        leaderboard.rebuild(board, batch_size)
+    log("Rebuilt leaderboards")
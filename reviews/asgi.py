@@ -0,0 +1,15 @@
+"""
+ASGI config for reviews project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+see api/asgi.py.
+"""
+
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reviews.settings')
+
+# api.asgi reads the settings on import
+from api.asgi import get_asgi_application  # noqa: E402
+
+application = get_asgi_application()
@@ -24,6 +24,9 @@ except Exception:
 
 DEFAULT_CONFIG_SECTION = 'settings'
 DATABASE_CONFIG_SECTION = 'database'
+API_CONFIG_SECTION = 'api'
+CACHE_CONFIG_SECTION = 'cache'
+THROTTLE_CONFIG_SECTION = 'throttle'
 
 DJANGO_ENV = parser.get(DEFAULT_CONFIG_SECTION, 'DJANGO_ENV')
 
@@ -62,6 +65,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.longpoll.LongPollMiddleware',
+    'api.middleware.EndpointStatsMiddleware',
+    'api.middleware.ReplicaReadMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -101,17 +108,92 @@ DB_PASSWORD = parser.get(DATABASE_CONFIG_SECTION, 'DATABASE_PASSWORD')
 DB_HOST = parser.get(DATABASE_CONFIG_SECTION, 'DATABASE_HOST')
 DB_PORT = parser.get(DATABASE_CONFIG_SECTION, 'DATABASE_PORT')
 
+# connection lifetime and pooling, see api/connections.py
+# seconds a connection is kept open for later requests, 0 to close it after each request
+DB_CONN_MAX_AGE = parser.getint(DATABASE_CONFIG_SECTION, 'DATABASE_CONN_MAX_AGE', fallback=0)
+# check a kept connection before the first query of a request
+DB_CONN_HEALTH_CHECKS = parser.getboolean(DATABASE_CONFIG_SECTION, 'DATABASE_CONN_HEALTH_CHECKS',
+                                          fallback=True)
+# connections shared by the threads of a process, 0 for one connection per thread
+DB_POOL_SIZE = parser.getint(DATABASE_CONFIG_SECTION, 'DATABASE_POOL_SIZE', fallback=0)
+# seconds a request waits for a free pooled connection
+DB_POOL_TIMEOUT = parser.getint(DATABASE_CONFIG_SECTION, 'DATABASE_POOL_TIMEOUT', fallback=10)
+
+# Django's backends, with the above added
+CONNECTION_MANAGED_ENGINES = {
+    'django.db.backends.sqlite3': 'api.db_backends.sqlite3',
+    'django.db.backends.postgresql': 'api.db_backends.postgresql',
+}
+
+
+def connection_settings(engine):
+    """
+    :param engine: DATABASE_ENGINE
+    :return: the ENGINE and connection lifetime keys of a DATABASES entry
+    """
+    pooled = DB_POOL_SIZE > 0
+    return {
+        'ENGINE': CONNECTION_MANAGED_ENGINES.get(engine, engine),
+        # pooled connections go back to the pool at the end of each request,
+        # and the pool closes them when they are POOL_MAX_AGE seconds old
+        'CONN_MAX_AGE': 0 if pooled else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': DB_POOL_TIMEOUT,
+        'POOL_MAX_AGE': DB_CONN_MAX_AGE,
+    }
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': DB_ENGINE,
+    'default': dict(connection_settings(DB_ENGINE), **{
         'NAME': DB_NAME,
         'USER': DB_USER,
         'PASSWORD': DB_PASSWORD,
         'HOST': DB_HOST,
         'PORT': DB_PORT,
+    })
+}
+
+# read replicas, see api/replicas.py
+# each has a [database:<alias>] section; missing values are taken from [database]
+DATABASE_REPLICAS = [alias.strip() for alias in
+                     parser.get(DATABASE_CONFIG_SECTION, 'DATABASE_REPLICAS', fallback='').split(',')
+                     if alias.strip()]
+DATABASE_REPLICA_PIN_SECONDS = parser.getint(DATABASE_CONFIG_SECTION,
+                                             'DATABASE_REPLICA_PIN_SECONDS', fallback=5)
+
+for alias in DATABASE_REPLICAS:
+    replica_section = '%s:%s' % (DATABASE_CONFIG_SECTION, alias)
+    DATABASES[alias] = dict(connection_settings(
+        parser.get(replica_section, 'DATABASE_ENGINE', fallback=DB_ENGINE)), **{
+        'NAME': parser.get(replica_section, 'DATABASE_NAME', fallback=DB_NAME),
+        'USER': parser.get(replica_section, 'DATABASE_USER', fallback=DB_USER),
+        'PASSWORD': parser.get(replica_section, 'DATABASE_PASSWORD', fallback=DB_PASSWORD),
+        'HOST': parser.get(replica_section, 'DATABASE_HOST', fallback=DB_HOST),
+        'PORT': parser.get(replica_section, 'DATABASE_PORT', fallback=DB_PORT),
+        # tests read and write the test database through every alias
+        'TEST': {'MIRROR': 'default'},
+    })
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# defaults to a per-process in-memory cache
+CACHES = {
+    'default': {
+        'BACKEND': parser.get(CACHE_CONFIG_SECTION, 'CACHE_BACKEND',
+                              fallback='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': parser.get(CACHE_CONFIG_SECTION, 'CACHE_LOCATION', fallback=''),
     }
 }
 
+AUTHENTICATION_BACKENDS = [
+    # checks passwords in a process pool, see api/hashing.py; logins outside the API
+    # check them in the request thread when the pool is full
+    'api.backends.PooledPasswordBackend',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -151,10 +233,109 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 
+# API settings -- list endpoints are keyset paginated,
+# clients can ask for up to API_MAX_PAGE_SIZE rows with ?page_size=
+API_PAGE_SIZE = parser.getint(API_CONFIG_SECTION, 'PAGE_SIZE', fallback=100)
+API_MAX_PAGE_SIZE = parser.getint(API_CONFIG_SECTION, 'MAX_PAGE_SIZE', fallback=1000)
+
+# /api/reviews/bulk/ accepts at most BULK_REVIEW_MAX_ITEMS reviews per request
+# and inserts them BULK_REVIEW_CHUNK_SIZE rows at a time
+BULK_REVIEW_MAX_ITEMS = parser.getint(API_CONFIG_SECTION, 'BULK_REVIEW_MAX_ITEMS', fallback=10000)
+BULK_REVIEW_CHUNK_SIZE = parser.getint(API_CONFIG_SECTION, 'BULK_REVIEW_CHUNK_SIZE', fallback=500)
+
+# /api/reviewers/bulk/ accepts at most BULK_REVIEWER_MAX_ITEMS reviewers per request
+BULK_REVIEWER_MAX_ITEMS = parser.getint(API_CONFIG_SECTION, 'BULK_REVIEWER_MAX_ITEMS', fallback=1000)
+BULK_REVIEWER_CHUNK_SIZE = parser.getint(API_CONFIG_SECTION, 'BULK_REVIEWER_CHUNK_SIZE', fallback=500)
+
+# /api/reviews/export/ reads EXPORT_CHUNK_SIZE rows from the database at a time
+EXPORT_CHUNK_SIZE = parser.getint(API_CONFIG_SECTION, 'EXPORT_CHUNK_SIZE', fallback=2000)
+
+# token -> user lookups are cached per process for TOKEN_CACHE_LOCAL_TTL seconds
+# and in the shared cache for TOKEN_CACHE_TTL seconds
+TOKEN_CACHE_SIZE = parser.getint(API_CONFIG_SECTION, 'TOKEN_CACHE_SIZE', fallback=10000)
+TOKEN_CACHE_LOCAL_TTL = parser.getint(API_CONFIG_SECTION, 'TOKEN_CACHE_LOCAL_TTL', fallback=10)
+TOKEN_CACHE_TTL = parser.getint(API_CONFIG_SECTION, 'TOKEN_CACHE_TTL', fallback=300)
+
+# /api/companies/<pk>/reviews/ pages are cached for COMPANY_REVIEWS_CACHE_TIMEOUT seconds;
+# on a miss other requests wait up to COMPANY_REVIEWS_LOCK_WAIT seconds for the one building the page
+COMPANY_REVIEWS_CACHE_TIMEOUT = parser.getint(API_CONFIG_SECTION, 'COMPANY_REVIEWS_CACHE_TIMEOUT',
+                                              fallback=300)
+COMPANY_REVIEWS_LOCK_TIMEOUT = parser.getint(API_CONFIG_SECTION, 'COMPANY_REVIEWS_LOCK_TIMEOUT',
+                                             fallback=10)
+COMPANY_REVIEWS_LOCK_WAIT = parser.getint(API_CONFIG_SECTION, 'COMPANY_REVIEWS_LOCK_WAIT', fallback=5)
+
+# password hashing runs in a pool of PASSWORD_HASHING_POOL_SIZE processes (0 to hash in the request thread);
+# beyond PASSWORD_HASHING_QUEUE_LIMIT waiting hashes requests get a 503 with Retry-After
+PASSWORD_HASHING_POOL_SIZE = parser.getint(API_CONFIG_SECTION, 'PASSWORD_HASHING_POOL_SIZE', fallback=2)
+PASSWORD_HASHING_QUEUE_LIMIT = parser.getint(API_CONFIG_SECTION, 'PASSWORD_HASHING_QUEUE_LIMIT', fallback=16)
+PASSWORD_HASHING_TIMEOUT = parser.getint(API_CONFIG_SECTION, 'PASSWORD_HASHING_TIMEOUT', fallback=10)
+PASSWORD_HASHING_RETRY_AFTER = parser.getint(API_CONFIG_SECTION, 'PASSWORD_HASHING_RETRY_AFTER', fallback=1)
+
+# near-duplicate reviews, see api/duplicates.py -- a new review within DUPLICATE_REVIEW_MAX_DISTANCE
+# bits of one of the last DUPLICATE_REVIEW_HISTORY reviews of the company from the same IP or reviewer
+# in DUPLICATE_REVIEW_WINDOW seconds is rejected, flagged, or let through (reject, flag or off)
+DUPLICATE_REVIEW_ACTION = parser.get(API_CONFIG_SECTION, 'DUPLICATE_REVIEW_ACTION', fallback='reject')
+DUPLICATE_REVIEW_WINDOW = parser.getint(API_CONFIG_SECTION, 'DUPLICATE_REVIEW_WINDOW', fallback=86400)
+DUPLICATE_REVIEW_HISTORY = parser.getint(API_CONFIG_SECTION, 'DUPLICATE_REVIEW_HISTORY', fallback=20)
+DUPLICATE_REVIEW_MAX_DISTANCE = parser.getint(API_CONFIG_SECTION, 'DUPLICATE_REVIEW_MAX_DISTANCE',
+                                              fallback=10)
+
+# company leaderboards, see api/leaderboard.py -- rebuilt by the rebuild_leaderboards command;
+# top-rated adds LEADERBOARD_PRIOR_WEIGHT average ratings to each company's ratings
+# and needs LEADERBOARD_MIN_REVIEWS reviews, most-reviewed counts the last LEADERBOARD_RECENT_DAYS days
+LEADERBOARD_PRIOR_WEIGHT = parser.getint(API_CONFIG_SECTION, 'LEADERBOARD_PRIOR_WEIGHT', fallback=10)
+LEADERBOARD_MIN_REVIEWS = parser.getint(API_CONFIG_SECTION, 'LEADERBOARD_MIN_REVIEWS', fallback=5)
+LEADERBOARD_RECENT_DAYS = parser.getint(API_CONFIG_SECTION, 'LEADERBOARD_RECENT_DAYS', fallback=7)
+LEADERBOARD_MAX_LIMIT = parser.getint(API_CONFIG_SECTION, 'LEADERBOARD_MAX_LIMIT', fallback=100)
+
+# background jobs, see api/jobs.py -- run by JOB_WORKERS run_workers processes, JOB_BATCH_SIZE
+# jobs of one kind at a time; a worker's claim on its jobs lasts JOB_LEASE seconds; failed jobs are
+# retried after JOB_RETRY_DELAY seconds, doubled each time up to JOB_MAX_RETRY_DELAY, JOB_MAX_ATTEMPTS times
+JOB_WORKERS = parser.getint(API_CONFIG_SECTION, 'JOB_WORKERS', fallback=2)
+JOB_BATCH_SIZE = parser.getint(API_CONFIG_SECTION, 'JOB_BATCH_SIZE', fallback=100)
+JOB_POLL_INTERVAL = parser.getint(API_CONFIG_SECTION, 'JOB_POLL_INTERVAL', fallback=1)
+JOB_LEASE = parser.getint(API_CONFIG_SECTION, 'JOB_LEASE', fallback=300)
+JOB_RETRY_DELAY = parser.getint(API_CONFIG_SECTION, 'JOB_RETRY_DELAY', fallback=10)
+JOB_MAX_RETRY_DELAY = parser.getint(API_CONFIG_SECTION, 'JOB_MAX_RETRY_DELAY', fallback=3600)
+JOB_MAX_ATTEMPTS = parser.getint(API_CONFIG_SECTION, 'JOB_MAX_ATTEMPTS', fallback=8)
+
+# ASGI deployment, see api/asgi.py -- requests run on a pool of ASGI_THREADS threads per process
+ASGI_THREADS = parser.getint(API_CONFIG_SECTION, 'ASGI_THREADS', fallback=16)
+
+# long polling, see api/longpoll.py -- a conditional GET with ?wait= is held for up to
+# LONG_POLL_MAX_WAIT seconds, checking for a change every LONG_POLL_INTERVAL seconds
+LONG_POLL_MAX_WAIT = parser.getint(API_CONFIG_SECTION, 'LONG_POLL_MAX_WAIT', fallback=30)
+LONG_POLL_INTERVAL = parser.getint(API_CONFIG_SECTION, 'LONG_POLL_INTERVAL', fallback=1)
+# also hold ?wait= requests under WSGI, where each waiting request takes a server thread
+LONG_POLL_WSGI = parser.getboolean(API_CONFIG_SECTION, 'LONG_POLL_WSGI', fallback=False)
+
+# per-endpoint query/latency histograms, see api/metrics.py
+# each process publishes its histograms to the cache every ENDPOINT_STATS_PUBLISH_INTERVAL seconds
+ENDPOINT_STATS_ENABLED = parser.getboolean(API_CONFIG_SECTION, 'ENDPOINT_STATS_ENABLED', fallback=True)
+ENDPOINT_STATS_PUBLISH_INTERVAL = parser.getint(API_CONFIG_SECTION, 'ENDPOINT_STATS_PUBLISH_INTERVAL',
+                                                fallback=60)
+
+# request rate limits per route, see api/throttling.py
+THROTTLE_RATES = (dict(parser.items(THROTTLE_CONFIG_SECTION))
+                  if parser.has_section(THROTTLE_CONFIG_SECTION) else {})
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ),
+    # encode and decode with orjson or ujson when installed, see api.jsonlib
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',),
+    'DEFAULT_THROTTLE_CLASSES': (
+        'api.throttling.SlidingWindowThrottle',
+    ),
 }